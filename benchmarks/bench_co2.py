@@ -0,0 +1,55 @@
+"""
+Compares co2_factor_calculation called once per histogram against
+co2_factor_batch_calculation over the whole forests x windows matrix.
+Run with: python -m benchmarks.bench_co2
+"""
+import json
+import tempfile
+import time
+
+import numpy as np
+
+from dynamic_world.calculations import (
+    co2_factor_batch_calculation,
+    co2_factor_calculation,
+    pixel_counts_matrix,
+)
+from dynamic_world.constants import PIXEL_COUNT_COLUMNS
+from benchmarks.fake_ee import synthetic_forests
+
+QUICK = {"observations": 5_000}
+
+
+def run(observations: int = 50_000) -> "dict[str, float]":
+    with tempfile.TemporaryDirectory() as directory:
+        (forest,) = synthetic_forests(directory, 1)
+    rng = np.random.default_rng(0)
+    counts = rng.integers(0, 10_000, size=(observations, len(PIXEL_COUNT_COLUMNS)))
+    pixel_counts = [dict(zip(PIXEL_COUNT_COLUMNS, row.tolist())) for row in counts]
+
+    start = time.perf_counter()
+    scalar = [co2_factor_calculation(row, forest) for row in pixel_counts]
+    scalar_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = co2_factor_batch_calculation(pixel_counts_matrix(pixel_counts), forest)
+    batch_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    co2_factor_batch_calculation(counts, forest)
+    matrix_seconds = time.perf_counter() - start
+
+    assert np.allclose(batch, scalar, rtol=1e-12)
+
+    return {
+        "observations": observations,
+        "scalar_seconds": scalar_seconds,
+        "batch_seconds": batch_seconds,
+        "batch_from_matrix_seconds": matrix_seconds,
+        "speedup": scalar_seconds / batch_seconds,
+        "speedup_from_matrix": scalar_seconds / matrix_seconds,
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
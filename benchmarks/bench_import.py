@@ -0,0 +1,63 @@
+"""
+Measures the import time of the dynamic_world modules with python -X importtime
+and reports whether Earth Engine and geemap were imported along the way.
+Every module is imported in a fresh interpreter so the timings do not share
+the module cache.
+Run with: python -m benchmarks.bench_import
+"""
+import json
+import re
+import subprocess
+import sys
+
+MODULES = [
+    "dynamic_world.configurations",
+    "dynamic_world.calculations",
+    "dynamic_world.store",
+    "dynamic_world.registry",
+    "dynamic_world.downloads",
+]
+HEAVY_MODULES = ["ee", "geemap"]
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+QUICK = {}
+
+SCRIPT = (
+    "import sys, json; import {module}; "
+    "print(json.dumps([name for name in {heavy} if name in sys.modules]))"
+)
+
+
+def import_profile(module: str) -> "dict[str, object]":
+    """
+    Imports module in a new interpreter, returning its cumulative import time
+    in seconds and the heavy modules which ended up loaded
+    """
+    process = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            SCRIPT.format(module=module, heavy=HEAVY_MODULES),
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    cumulative = {}
+    for line in process.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            cumulative[match.group(4)] = int(match.group(2))
+    return {
+        "seconds": cumulative[module] / 1e6,
+        "heavy_modules_loaded": json.loads(process.stdout),
+    }
+
+
+def run() -> "dict[str, dict[str, object]]":
+    return {module: import_profile(module) for module in MODULES}
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
@@ -0,0 +1,81 @@
+"""
+Measures the latency of single calls against the simulated Earth Engine
+backend (see benchmarks.fake_ee): the percentiles of every entry point and the
+client-side overhead, which is the time taken by the same call when
+round-trips are instantaneous (building the request, evaluating the fake
+reduction, formatting results).
+Run with: python -m benchmarks.bench_latency
+"""
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+import numpy as np
+
+from dynamic_world.calculations import (
+    multi_forest_calculation,
+    single_date_calculation,
+    stands_calculation,
+    time_series_calculation,
+)
+from benchmarks.fake_ee import FakeBackend, synthetic_forests
+
+QUICK = {"calls": 5, "latency": 0.01}
+
+WINDOW = ("2022-01-01", "2022-02-01")
+WINDOWS = [("2022-01-01", "2022-02-01"), ("2022-02-01", "2022-03-01")]
+
+
+def timed_calls(call: Callable[[], Any], calls: int, backend: FakeBackend) -> list:
+    seconds = []
+    with backend.install():
+        for _ in range(calls):
+            start = time.perf_counter()
+            call()
+            seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def run(
+    calls: int = 30, latency: float = 0.05, forests: int = 4
+) -> "dict[str, dict[str, float]]":
+    with tempfile.TemporaryDirectory() as directory:
+        configs = synthetic_forests(Path(directory), forests)
+        forest = configs[0]
+        entry_points = {
+            "single_date_calculation": lambda: single_date_calculation(*WINDOW, forest),
+            "partitioned_single_date_calculation": lambda: single_date_calculation(
+                *WINDOW, forest, partition=True, max_region_pixels=20_000
+            ),
+            "time_series_calculation": lambda: time_series_calculation(forest, WINDOWS),
+            "multi_forest_calculation": lambda: multi_forest_calculation(
+                *WINDOW, configs
+            ),
+            "stands_calculation": lambda: stands_calculation(*WINDOW, forest, "stand"),
+        }
+        # Every feature of the synthetic forests is its own stand
+        for config in configs:
+            for index, feature in enumerate(config.geojson_info["features"]):
+                feature["properties"]["stand"] = index
+
+        results = {}
+        for name, call in entry_points.items():
+            backend = FakeBackend(latency=latency)
+            seconds = np.asarray(timed_calls(call, calls, backend))
+            # Without latency only the client-side work is left
+            overhead = timed_calls(call, calls, FakeBackend())
+            results[name] = {
+                "p50_seconds": float(np.percentile(seconds, 50)),
+                "p95_seconds": float(np.percentile(seconds, 95)),
+                "max_seconds": float(seconds.max()),
+                "round_trips_per_call": backend.round_trips / calls,
+                "overhead_seconds_per_call": float(np.mean(overhead)),
+            }
+
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
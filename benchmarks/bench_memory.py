@@ -0,0 +1,72 @@
+"""
+Measures the peak memory (Python and numpy allocations, see tracemalloc) of
+downloading a forest from the simulated Earth Engine backend (see
+benchmarks.fake_ee), as a single image and as tiles, and of counting the
+pixels of the resulting COG locally.
+Download peaks include the simulated server rendering each image, which is
+proportional to the image (or tile) size as in geemap.
+Run with: python -m benchmarks.bench_memory
+"""
+import json
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Tuple
+
+from dynamic_world.downloads import download_single_date_image
+from dynamic_world.rasters import local_pixel_counts
+from benchmarks.fake_ee import PIXEL, FakeBackend, synthetic_forests
+
+QUICK = {"size_degrees": 0.03}
+
+WINDOW = ("2022-01-01", "2022-02-01")
+
+
+def peak_memory(call: Callable[[], Any]) -> Tuple[Any, "dict[str, float]"]:
+    """
+    Calls call, returning its result with the seconds taken and the peak of
+    traced memory in bytes
+    """
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        result = call()
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, {"seconds": seconds, "peak_bytes": peak}
+
+
+def run(size_degrees: float = 0.2) -> "dict[str, dict[str, float]]":
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        forest = synthetic_forests(directory / "forests", 1, size_degrees)[0]
+        pixels = round(size_degrees / PIXEL) ** 2
+        backend = FakeBackend()
+
+        with backend.install():
+            cog_path, results["download"] = peak_memory(
+                lambda: download_single_date_image(
+                    *WINDOW, forest, directory / "single"
+                )
+            )
+            _, results["tiled_download"] = peak_memory(
+                lambda: download_single_date_image(
+                    *WINDOW, forest, directory / "tiled", tile_size=size_degrees / 4
+                )
+            )
+        _, results["local_pixel_counts"] = peak_memory(
+            lambda: local_pixel_counts(cog_path, forest)
+        )
+
+    for result in results.values():
+        result["pixels"] = pixels
+        result["peak_bytes_per_pixel"] = result["peak_bytes"] / pixels
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
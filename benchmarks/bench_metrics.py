@@ -0,0 +1,55 @@
+"""
+Measures the overhead of the instrumentation on the hot path (a timer, a
+counter and a getInfo call) with metrics disabled and with an in-memory sink.
+Run with: python -m benchmarks.bench_metrics
+"""
+import json
+import time
+
+from dynamic_world import metrics
+
+QUICK = {"calls": 20_000}
+
+
+class FakeEEObject:
+    def getInfo(self):
+        return {}
+
+
+def instrumented_call(ee_object: FakeEEObject):
+    with metrics.timer("composite"):
+        pass
+    metrics.increment("cache_misses")
+    return metrics.get_info(ee_object)
+
+
+def seconds_per_call(calls: int) -> float:
+    ee_object = FakeEEObject()
+    start = time.perf_counter()
+    for _ in range(calls):
+        instrumented_call(ee_object)
+    return (time.perf_counter() - start) / calls
+
+
+def run(calls: int = 200_000) -> "dict[str, float]":
+    ee_object = FakeEEObject()
+    start = time.perf_counter()
+    for _ in range(calls):
+        ee_object.getInfo()
+    baseline = (time.perf_counter() - start) / calls
+
+    disabled = seconds_per_call(calls)
+    with metrics.use_sink(metrics.InMemorySink()):
+        enabled = seconds_per_call(calls)
+
+    return {
+        "calls": calls,
+        "baseline_seconds_per_call": baseline,
+        "disabled_seconds_per_call": disabled,
+        "in_memory_seconds_per_call": enabled,
+        "disabled_overhead_seconds_per_call": disabled - baseline,
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
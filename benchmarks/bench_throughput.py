@@ -0,0 +1,110 @@
+"""
+Measures the throughput of N forests x M date windows against the simulated
+Earth Engine backend (see benchmarks.fake_ee), comparing one job per
+(forest, window) against one job per forest (time_series_calculation) and
+one job per window (multi_forest_calculation).
+Every round-trip takes latency seconds and the backend throttles above
+max_concurrent requests, so the scheduler retries are exercised too.
+Run with: python -m benchmarks.bench_throughput
+"""
+import json
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+from dynamic_world.calculations import (
+    multi_forest_calculation,
+    single_date_calculation,
+    time_series_calculation,
+)
+from dynamic_world.scheduler import Job, run_jobs
+from dynamic_world.utils import date_windows
+from benchmarks.fake_ee import FakeBackend, synthetic_forests
+
+QUICK = {"forests": 2, "windows": 3, "latency": 0.01}
+
+
+def _time_series_task(windows, start_date, end_date, forest):
+    return time_series_calculation(forest, windows)
+
+
+def _multi_forest_task(forests, start_date, end_date, forest):
+    return multi_forest_calculation(start_date, end_date, forests)
+
+
+def measure(jobs: list, backend: FakeBackend, max_workers: int) -> "dict[str, float]":
+    """
+    Runs jobs against backend, returning the time taken, the jobs per second
+    and how many round-trips, throttled requests and retries were needed
+    """
+    with backend.install():
+        start = time.perf_counter()
+        results = list(
+            run_jobs(jobs, max_workers=max_workers, backoff_seconds=backend.latency)
+        )
+        seconds = time.perf_counter() - start
+
+    failed = [result for result in results if result.error is not None]
+    return {
+        "jobs": len(jobs),
+        "seconds": seconds,
+        "jobs_per_second": len(jobs) / seconds,
+        "round_trips": backend.round_trips,
+        "throttled": backend.throttled,
+        "retries": sum(result.attempts - 1 for result in results),
+        "failed_jobs": len(failed),
+    }
+
+
+def run(
+    forests: int = 10,
+    windows: int = 12,
+    latency: float = 0.05,
+    max_concurrent: int = 6,
+    max_workers: int = 8,
+) -> "dict[str, dict[str, float]]":
+    with tempfile.TemporaryDirectory() as directory:
+        configs = synthetic_forests(Path(directory), forests)
+        window_list = date_windows("2022-01-01", "2023-01-01", 365 // windows)[:windows]
+
+        modes = {
+            "single_date": [
+                Job(forest, start_date, end_date, single_date_calculation)
+                for forest in configs
+                for start_date, end_date in window_list
+            ],
+            "time_series": [
+                Job(
+                    forest,
+                    window_list[0][0],
+                    window_list[-1][1],
+                    partial(_time_series_task, window_list),
+                )
+                for forest in configs
+            ],
+            "multi_forest": [
+                Job(
+                    configs[0],
+                    start_date,
+                    end_date,
+                    partial(_multi_forest_task, configs),
+                )
+                for start_date, end_date in window_list
+            ],
+        }
+
+        results = {}
+        for mode, jobs in modes.items():
+            backend = FakeBackend(latency=latency, max_concurrent=max_concurrent)
+            results[mode] = measure(jobs, backend, max_workers)
+            # Observations are (forest, window) pairs whatever the job size
+            results[mode]["observations_per_second"] = (
+                forests * windows / results[mode]["seconds"]
+            )
+
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=2))
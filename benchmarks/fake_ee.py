@@ -0,0 +1,654 @@
+"""
+Simulated Earth Engine and geemap backends, answering the calls made by
+dynamic_world (reduceRegion, reduceRegions, download_ee_image...) from
+synthetic label rasters so calculations and downloads can be benchmarked
+(and tested, see tests/) offline.
+
+Pixels follow the EPSG:4326 grid used by Earth Engine at SCALE meters and are
+counted when their center lies inside the region. The label of a pixel is a
+deterministic function of its position and of the date window, 9 stands for
+pixels without data (NA).
+
+Every getInfo and download_ee_image is a round-trip: it waits latency
+seconds, and can be throttled (more than max_concurrent running at once) or
+fail (failure_rate).
+
+Usage:
+    backend = FakeBackend(latency=0.05)
+    with backend.install():
+        single_date_calculation(start_date, end_date, forest)
+    backend.round_trips
+"""
+import json
+import math
+import random
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Iterator, List, NamedTuple, Optional
+
+import numpy as np
+import rasterio
+import yaml
+from rasterio.features import bounds, geometry_mask
+from rasterio.transform import from_origin
+
+import dynamic_world.calculations
+import dynamic_world.composites
+import dynamic_world.downloads
+import dynamic_world.sampling
+from dynamic_world.configurations import ForestConfig, load_config
+from dynamic_world.constants import (
+    FOREST_CONFIG_FILENAME,
+    HISTOGRAM_PROPERTY,
+    LABEL_MODE_BAND,
+    LABEL_NODATA,
+    METERS_PER_DEGREE,
+    NA_CLASS_ID,
+    SCALE,
+)
+
+PIXEL = SCALE / METERS_PER_DEGREE
+NA_VALUE = 9
+# Windows ending before this date have no images
+FIRST_IMAGE_DATE = "2015-06-27"
+PATCHED_MODULES = [
+    dynamic_world.calculations,
+    dynamic_world.composites,
+    dynamic_world.downloads,
+    dynamic_world.sampling,
+]
+
+
+class FakeEEException(Exception):
+    pass
+
+
+class Grid(NamedTuple):
+    """
+    Window of the global pixel grid, rows are counted from the south
+    """
+
+    col_start: int
+    row_start: int
+    cols: int
+    rows: int
+
+    @classmethod
+    def covering(cls, west, south, east, north) -> "Grid":
+        col_start, row_start = math.floor(west / PIXEL), math.floor(south / PIXEL)
+        return cls(
+            col_start,
+            row_start,
+            max(math.ceil(east / PIXEL) - col_start, 0),
+            max(math.ceil(north / PIXEL) - row_start, 0),
+        )
+
+    @property
+    def transform(self):
+        return from_origin(
+            self.col_start * PIXEL, (self.row_start + self.rows) * PIXEL, PIXEL, PIXEL
+        )
+
+    def indices(self):
+        """
+        Grid rows and columns of every pixel, first raster row is the northern one
+        """
+        return np.mgrid[
+            self.row_start + self.rows - 1 : self.row_start - 1 : -1,
+            self.col_start : self.col_start + self.cols,
+        ]
+
+
+def synthetic_labels(grid: Grid, window: tuple) -> np.ndarray:
+    """
+    Labels 0-8 (and 9 for NA) of every pixel of grid for a date window
+    """
+    rows, cols = grid.indices()
+    offset = zlib.crc32("".join(window).encode()) % 10
+    return ((rows * 7 + cols * 3 + offset) % 10).astype(np.uint8)
+
+
+class FakeGeometry:
+    def __init__(self, shapes: Optional[list] = None, rectangle=None):
+        self.shapes = shapes  # Geojson geometries, None means the rectangle
+        self.rectangle = rectangle  # (west, south, east, north)
+
+    def bounds(self):
+        if self.shapes is None:
+            return tuple(self.rectangle)
+        west, south, east, north = bounds(
+            {"type": "GeometryCollection", "geometries": self.shapes}
+        )
+        if self.rectangle is not None:
+            r_west, r_south, r_east, r_north = self.rectangle
+            west, south = max(west, r_west), max(south, r_south)
+            east, north = min(east, r_east), min(north, r_north)
+        return west, south, east, north
+
+    def mask(self, grid: Grid) -> np.ndarray:
+        """
+        True for the pixels of grid whose center lies inside the geometry
+        """
+        if grid.rows == 0 or grid.cols == 0:
+            return np.zeros((grid.rows, grid.cols), dtype=bool)
+        inside = np.ones((grid.rows, grid.cols), dtype=bool)
+        if self.shapes is not None:
+            inside &= ~geometry_mask(
+                self.shapes, out_shape=inside.shape, transform=grid.transform
+            )
+        if self.rectangle is not None:
+            west, south, east, north = [
+                round(coordinate / PIXEL) for coordinate in self.rectangle
+            ]
+            rows, cols = grid.indices()
+            inside &= (cols >= west) & (cols < east) & (rows >= south) & (rows < north)
+        return inside
+
+    def area(self, maxError=None, proj=None) -> float:
+        """
+        Planar area in square degrees if proj is given (only EPSG:4326 is
+        supported), else in square meters
+        """
+        if self.shapes is None:
+            west, south, east, north = self.rectangle
+            polygons = [[[(west, south), (east, south), (east, north), (west, north)]]]
+        else:
+            polygons = []
+            for shape in self.shapes:
+                if shape["type"] == "Polygon":
+                    polygons.append(shape["coordinates"])
+                else:
+                    polygons.extend(shape["coordinates"])
+        # Exterior ring minus the holes
+        degrees = sum(
+            _ring_area(polygon[0]) - sum(_ring_area(hole) for hole in polygon[1:])
+            for polygon in polygons
+        )
+        if proj is not None:
+            return degrees
+        latitude = (self.bounds()[1] + self.bounds()[3]) / 2
+        return degrees * METERS_PER_DEGREE**2 * math.cos(math.radians(latitude))
+
+    def intersection(self, other: "FakeGeometry", *args) -> "FakeGeometry":
+        return FakeGeometry(self.shapes, other.rectangle)
+
+    def geometry(self) -> "FakeGeometry":
+        return self
+
+
+class Value:
+    """
+    A server-side value, only computed on getInfo
+    """
+
+    def __init__(self, backend: "FakeBackend", compute: Callable[[], Any]):
+        self.backend = backend
+        self.compute = compute
+
+    def get(self, key, default=None) -> "Value":
+        return Value(
+            self.backend,
+            lambda: _evaluate(self).get(key, _evaluate(default)),
+        )
+
+    def getInfo(self) -> Any:
+        with self.backend.round_trip():
+            return _evaluate(self)
+
+
+def _evaluate(value: Any) -> Any:
+    if isinstance(value, Value):
+        return value.compute()
+    if isinstance(value, list):
+        return [_evaluate(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _evaluate(item) for key, item in value.items()}
+    return value
+
+
+class FakeDictionary:
+    def __init__(self, backend: "FakeBackend"):
+        self.backend = backend
+
+    def __call__(self, value: Any = None) -> Value:
+        if isinstance(value, Value):
+            return value
+        return Value(self.backend, lambda: _evaluate(value or {}))
+
+    def fromLists(self, keys: Value, values: Value) -> Value:
+        return Value(
+            self.backend, lambda: dict(zip(_evaluate(keys), _evaluate(values)))
+        )
+
+
+class FakeFeature:
+    def __init__(self, geometry: FakeGeometry, properties: Optional[dict] = None):
+        self.geometry = geometry
+        self.properties = properties or {}
+
+    def set(self, name: str, value: Any) -> "FakeFeature":
+        return FakeFeature(self.geometry, {**self.properties, name: _evaluate(value)})
+
+    def toDictionary(self) -> Value:
+        return Value(None, lambda: dict(self.properties))
+
+
+class FakeFeatureCollection:
+    def __init__(self, backend: "FakeBackend", features: Callable[[], list]):
+        self.backend = backend
+        self.features = features
+
+    def map(
+        self, algorithm: Callable[[FakeFeature], FakeFeature]
+    ) -> "FakeFeatureCollection":
+        return FakeFeatureCollection(
+            self.backend, lambda: [algorithm(feature) for feature in self.features()]
+        )
+
+    def aggregate_array(self, name: str) -> Value:
+        return Value(
+            self.backend,
+            lambda: [
+                feature.properties[name]
+                for feature in self.features()
+                if name in feature.properties
+            ],
+        )
+
+    def aggregate_histogram(self, name: str) -> Value:
+        def histogram():
+            values = [
+                feature.properties[name]
+                for feature in self.features()
+                if name in feature.properties
+            ]
+            values, counts = np.unique(values, return_counts=True)
+            return {str(value): int(count) for value, count in zip(values, counts)}
+
+        return Value(self.backend, histogram)
+
+
+class FakeImage:
+    def __init__(
+        self,
+        backend: "FakeBackend",
+        window: tuple,
+        operations=(),
+        constant: Optional[int] = None,
+    ):
+        self.backend = backend
+        self.window = window
+        self.operations = tuple(operations)  # ("clip", geometry) or ("unmask", v)
+        self.constant = constant  # Label of every pixel, instead of the window
+
+    def clip(self, geometry: FakeGeometry) -> "FakeImage":
+        return FakeImage(
+            self.backend,
+            self.window,
+            self.operations + (("clip", geometry),),
+            self.constant,
+        )
+
+    def unmask(self, value: int) -> "FakeImage":
+        return FakeImage(
+            self.backend,
+            self.window,
+            self.operations + (("unmask", value),),
+            self.constant,
+        )
+
+    def cast(self, bands: dict) -> "FakeImage":
+        return self
+
+    def rename(self, name: str) -> "FakeImage":
+        return self
+
+    def has_bands(self) -> bool:
+        """
+        The mode of a window without images has no bands
+        """
+        return self.constant is not None or not _is_empty(self.window)
+
+    def labels(self, grid: Grid) -> np.ma.MaskedArray:
+        """
+        Label of every pixel of grid, masked outside clip or without data
+        """
+        if not self.has_bands():
+            raise FakeEEException(
+                f"Image.select: Pattern '{LABEL_MODE_BAND}' did not match any bands."
+            )
+        if self.constant is not None:
+            labels = np.full((grid.rows, grid.cols), self.constant, dtype=np.uint8)
+        else:
+            labels = synthetic_labels(grid, self.window)
+        masked = labels == NA_VALUE
+        for operation, argument in self.operations:
+            if operation == "clip":
+                masked |= ~argument.mask(grid)
+            else:
+                labels[masked] = argument
+                masked[:] = False
+        return np.ma.masked_array(labels, masked)
+
+    def histogram(self, region: FakeGeometry) -> dict:
+        """
+        Frequency histogram of the pixels inside region, masked pixels are
+        counted as null
+        """
+        grid = Grid.covering(*region.bounds())
+        self.backend.check_pixels(grid)
+        labels = self.labels(grid)
+        selected = region.mask(grid)
+        values = labels.data[selected].astype(np.int64)
+        values[np.ma.getmaskarray(labels)[selected]] = NA_VALUE
+        counts = np.bincount(values, minlength=NA_VALUE + 1)
+        histogram = {
+            str(value): int(count)
+            for value, count in enumerate(counts[:NA_VALUE])
+            if count
+        }
+        if counts[NA_VALUE:].sum():
+            histogram[NA_CLASS_ID] = int(counts[NA_VALUE:].sum())
+        return histogram
+
+    def sample(
+        self,
+        region: FakeGeometry,
+        numPixels: int,
+        seed: int = 0,
+        **kwargs,
+    ) -> FakeFeatureCollection:
+        """
+        Simple random sample of the pixels inside region, masked pixels are
+        skipped
+        """
+
+        def features():
+            if not self.has_bands():
+                return []
+            grid = Grid.covering(*region.bounds())
+            labels = self.labels(grid)
+            values = labels.data[region.mask(grid) & ~np.ma.getmaskarray(labels)]
+            rng = np.random.default_rng(seed)
+            sample = rng.choice(values, min(numPixels, values.size), replace=False)
+            return [
+                FakeFeature(None, {LABEL_MODE_BAND: int(value)}) for value in sample
+            ]
+
+        return FakeFeatureCollection(self.backend, features)
+
+    def reduceRegion(self, geometry: FakeGeometry, **kwargs) -> Value:
+        def reduced():
+            # Images without bands reduce to an empty dictionary
+            if not self.has_bands():
+                return {}
+            return {LABEL_MODE_BAND: self.histogram(geometry)}
+
+        return Value(self.backend, reduced)
+
+    def reduceRegions(self, collection: FakeFeatureCollection, **kwargs):
+        def features():
+            # Regions without pixels get no histogram, as when Earth Engine
+            # reduces them to null
+            reduced = []
+            for feature in collection.features():
+                histogram = self.has_bands() and self.histogram(feature.geometry)
+                properties = dict(feature.properties)
+                if histogram:
+                    properties[HISTOGRAM_PROPERTY] = histogram
+                reduced.append(FakeFeature(feature.geometry, properties))
+            return reduced
+
+        return FakeFeatureCollection(self.backend, features)
+
+
+class FakeImageConstructor:
+    def __init__(self, backend: "FakeBackend"):
+        self.backend = backend
+
+    def __call__(self, image: FakeImage) -> FakeImage:
+        return image
+
+    def constant(self, value: int) -> FakeImage:
+        return FakeImage(self.backend, ("", ""), constant=value)
+
+
+class FakeImageCollection:
+    def __init__(self, backend: "FakeBackend", window: tuple = ("", "")):
+        self.backend = backend
+        self.window = window
+
+    def filterDate(self, start_date: str, end_date: str) -> "FakeImageCollection":
+        return FakeImageCollection(self.backend, (start_date, end_date))
+
+    def filterBounds(self, geometry) -> "FakeImageCollection":
+        return self
+
+    def select(self, band: str) -> "FakeImageCollection":
+        return self
+
+    def reduce(self, reducer) -> FakeImage:
+        return FakeImage(self.backend, self.window)
+
+    def size(self) -> "FakeNumber":
+        return FakeNumber(0 if _is_empty(self.window) else 1)
+
+
+class FakeNumber(int):
+    """
+    Server-side number, known client-side so ee.Algorithms.If can choose
+    """
+
+    def gt(self, other: int) -> bool:
+        return self > other
+
+
+class FakeReducer:
+    def unweighted(self) -> "FakeReducer":
+        return self
+
+
+class FakeBackend:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        max_concurrent: Optional[int] = None,
+        failure_rate: float = 0.0,
+        failure_message: str = "Internal error.",
+        max_pixels: Optional[int] = None,
+        seed: int = 0,
+    ):
+        """
+        Args:
+            latency: seconds taken by every round-trip
+            max_concurrent: round-trips running at the same time above this
+                are throttled ("Too many concurrent aggregations.")
+            failure_rate: probability of a round-trip failing with
+                failure_message
+            max_pixels: regions with more pixels fail with
+                "Computation timed out."
+            seed: seed of the failure injection
+        """
+        self.latency = latency
+        self.max_concurrent = max_concurrent
+        self.failure_rate = failure_rate
+        self.failure_message = failure_message
+        self.max_pixels = max_pixels
+        self.round_trips = 0
+        self.throttled = 0
+        self.failures = 0
+        self.running = 0
+        self.peak_concurrency = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self.ee = SimpleNamespace(
+            Dictionary=FakeDictionary(self),
+            List=lambda values: Value(self, lambda: _evaluate(values)),
+            Feature=FakeFeature,
+            FeatureCollection=lambda features: FakeFeatureCollection(
+                self, lambda: features
+            ),
+            ImageCollection=lambda name: FakeImageCollection(self),
+            Image=FakeImageConstructor(self),
+            Algorithms=SimpleNamespace(
+                If=lambda condition, true_case, false_case: (
+                    true_case if condition else false_case
+                )
+            ),
+            Reducer=SimpleNamespace(mode=FakeReducer, frequencyHistogram=FakeReducer),
+            Geometry=SimpleNamespace(
+                Rectangle=lambda coordinates, *args: FakeGeometry(rectangle=coordinates)
+            ),
+            EEException=FakeEEException,
+        )
+        self.geemap = SimpleNamespace(
+            geojson_to_ee=lambda geojson_info: FakeGeometry(_shapes(geojson_info)),
+            download_ee_image=self._download_ee_image,
+        )
+
+    @contextmanager
+    def round_trip(self) -> Iterator[None]:
+        with self._lock:
+            self.round_trips += 1
+            if self.max_concurrent and self.running >= self.max_concurrent:
+                self.throttled += 1
+                raise FakeEEException("Too many concurrent aggregations.")
+            if self.failure_rate and self._random.random() < self.failure_rate:
+                self.failures += 1
+                raise FakeEEException(self.failure_message)
+            self.running += 1
+            self.peak_concurrency = max(self.peak_concurrency, self.running)
+        try:
+            time.sleep(self.latency)
+            yield
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    def check_pixels(self, grid: Grid):
+        if self.max_pixels is not None and grid.rows * grid.cols > self.max_pixels:
+            raise FakeEEException("Computation timed out.")
+
+    def _download_ee_image(
+        self,
+        image: FakeImage,
+        filename,
+        scale=SCALE,
+        region: Optional[FakeGeometry] = None,
+        crs: str = "EPSG:4326",
+        dtype: str = "uint8",
+        **kwargs,
+    ):
+        with self.round_trip():
+            grid = Grid.covering(*region.bounds())
+            labels = image.labels(grid)
+            with rasterio.open(
+                filename,
+                "w",
+                driver="GTiff",
+                width=grid.cols,
+                height=grid.rows,
+                count=1,
+                dtype=dtype,
+                crs=crs,
+                transform=grid.transform,
+                nodata=LABEL_NODATA,
+            ) as dst:
+                dst.write(labels.filled(LABEL_NODATA).astype(dtype), 1)
+
+    @contextmanager
+    def install(self) -> Iterator["FakeBackend"]:
+        """
+        Replaces ee and geemap inside the dynamic_world modules
+        """
+        originals = [
+            (module, name, getattr(module, name))
+            for module in PATCHED_MODULES
+            for name in ("ee", "geemap")
+            if hasattr(module, name)
+        ]
+        for module, name, _ in originals:
+            setattr(module, name, getattr(self, name))
+        try:
+            yield self
+        finally:
+            for module, name, original in originals:
+                setattr(module, name, original)
+
+
+def _is_empty(window: tuple) -> bool:
+    """
+    Whether there are no images between the dates of window
+    """
+    _, end_date = window
+    return bool(end_date) and end_date <= FIRST_IMAGE_DATE
+
+
+def _ring_area(ring: list) -> float:
+    """
+    Area of a linear ring (shoelace formula)
+    """
+    return abs(
+        sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1]))
+        / 2
+    )
+
+
+def _shapes(geojson_info: dict) -> list:
+    if geojson_info["type"] == "FeatureCollection":
+        return [feature["geometry"] for feature in geojson_info["features"]]
+    if geojson_info["type"] == "Feature":
+        return [geojson_info["geometry"]]
+    return [geojson_info]
+
+
+def synthetic_forests(
+    directory: Path, count: int, size_degrees: float = 0.02, south: float = -8.0
+) -> List[ForestConfig]:
+    """
+    Writes count square forests (with their forest_config.yml) into directory,
+    side by side with their southern border at latitude south
+    Returns:
+        the ForestConfig of every forest
+    """
+    forests = []
+    for index in range(count):
+        forest_directory = Path(directory) / f"Forest{index}"
+        forest_directory.mkdir(parents=True, exist_ok=True)
+        west = -76.0 + index * size_degrees * 1.5
+        east, north = west + size_degrees, south + size_degrees
+        square = [[west, south], [east, south], [east, north], [west, north]]
+        geojson_info = {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "properties": {},
+                    "geometry": {
+                        "type": "Polygon",
+                        "coordinates": [square + [square[0]]],
+                    },
+                }
+            ],
+        }
+        (forest_directory / "forest.geojson").write_text(json.dumps(geojson_info))
+        config = {
+            "name": f"Forest {index}",
+            "geojson": "./forest.geojson",
+            "co2_factor": {
+                "trees": 591.85,
+                "crops": 11.5,
+                "other": 0,
+                "factor_pixel": 100,
+            },
+            "start_date": "2022-01-01",
+        }
+        with open(forest_directory / FOREST_CONFIG_FILENAME, "w") as file:
+            yaml.safe_dump(config, file)
+        forests.append(load_config(forest_directory))
+    return forests
@@ -0,0 +1,142 @@
+"""
+Runs every benchmark and writes their results as a single json document, so
+results can be stored and compared across versions:
+    {"metadata": {"timestamp": ..., "git_commit": ...},
+     "benchmarks": {"bench_co2": {...}, ...}}
+Comparing against a previous run exits with status 1 if any measurement got
+worse than the tolerance (lower is better for times, round-trips and bytes,
+higher is better for rates and speedups).
+Run with:
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --quick --compare baseline.json --tolerance 0.2
+"""
+import argparse
+import datetime
+import importlib
+import json
+import platform
+import subprocess
+import sys
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+BENCHMARKS = [
+    "bench_co2",
+    "bench_import",
+    "bench_metrics",
+    "bench_throughput",
+    "bench_latency",
+    "bench_memory",
+]
+# Fragments of the result keys, anything else is informative only
+LOWER_IS_BETTER = ["seconds", "round_trips", "bytes"]
+HIGHER_IS_BETTER = ["per_second", "speedup"]
+DEFAULT_TOLERANCE = 0.2
+
+
+def run_benchmarks(names: Iterable[str], quick: bool = False) -> dict:
+    """
+    Runs the benchmarks named in names (modules of this package), using
+    their QUICK arguments if quick
+    """
+    results = {}
+    for name in names:
+        module = importlib.import_module(f"benchmarks.{name}")
+        results[name] = module.run(**(module.QUICK if quick else {}))
+    return {"metadata": metadata(quick), "benchmarks": results}
+
+
+def metadata(quick: bool) -> dict:
+    try:
+        git_commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        git_commit = None
+
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "git_commit": git_commit,
+        "quick": quick,
+    }
+
+
+def flatten(results: dict, prefix: str = "") -> "dict[str, float]":
+    """
+    Flattens nested results into {"bench.mode.key": number}
+    """
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(
+    current: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE
+) -> List[str]:
+    """
+    Compares two runs (as written by run_benchmarks)
+    Returns:
+        a description of every measurement which got worse than tolerance
+        (relative change), measurements missing from either run are ignored
+    """
+    current = flatten(current["benchmarks"])
+    baseline = flatten(baseline["benchmarks"])
+    regressions = []
+
+    for name in sorted(set(current).intersection(baseline)):
+        key = name.rsplit(".", 1)[-1]
+        old, new = baseline[name], current[name]
+        if any(fragment in key for fragment in HIGHER_IS_BETTER):
+            worse = new < old * (1 - tolerance)
+        elif any(fragment in key for fragment in LOWER_IS_BETTER):
+            worse = new > old * (1 + tolerance)
+        else:
+            continue
+        if worse:
+            regressions.append(f"{name}: {old:.6g} -> {new:.6g}")
+
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--quick", action="store_true", help="smaller workloads, for smoke tests"
+    )
+    parser.add_argument(
+        "--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS, metavar="NAME"
+    )
+    parser.add_argument("--output", type=Path, help="json file for the results")
+    parser.add_argument("--compare", type=Path, help="json file of a previous run")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.only, args.quick)
+    document = json.dumps(results, indent=2)
+    if args.output is not None:
+        args.output.write_text(document + "\n")
+    else:
+        print(document)
+
+    if args.compare is not None:
+        regressions = compare(
+            results, json.loads(args.compare.read_text()), args.tolerance
+        )
+        for regression in regressions:
+            print(f"Regression {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
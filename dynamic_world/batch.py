@@ -0,0 +1,351 @@
+import json
+import threading
+import time
+from functools import partial
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from dynamic_world.cache import ResultCache
+from dynamic_world.calculations import co2_factor_calculation, single_date_calculation
+from dynamic_world.configurations import ForestConfig
+from dynamic_world.constants import (
+    CALCULATION_TASK,
+    CHECKPOINT_FILENAME,
+    DEFAULT_MAX_WORKERS,
+    DEFAULT_OUTPUT_DIR,
+    DEFAULT_STEP_DAYS,
+    DOWNLOAD_TASK,
+)
+from dynamic_world.downloads import calculate_and_download, download_single_date_image
+from dynamic_world.registry import ForestRegistry
+from dynamic_world.scheduler import Job, run_jobs
+from dynamic_world.sinks import ForestWindowResult, ResultSink
+from dynamic_world.utils import date_windows, get_logger
+
+
+class BatchSummary(NamedTuple):
+    jobs: int  # (forest, window) pairs of the run, including skipped ones
+    skipped: int  # Already done by a previous run, see RunCheckpoint
+    succeeded: int
+    failed: int
+    retries: int  # Throttled attempts, see dynamic_world.scheduler
+    seconds: float
+
+    @property
+    def jobs_per_second(self) -> float:
+        """
+        Jobs run (not skipped) per second
+        """
+        return (self.succeeded + self.failed) / self.seconds if self.seconds else 0.0
+
+
+class RunCheckpoint:
+    """
+    JSON Lines file with the outcome of every job of a batch run, one line
+    per job appended as soon as it finishes, so an interrupted run resumes
+    where it stopped. Lines look like
+    {"forest": "Sample", "start_date": "2022-01-01", "end_date": "2022-01-31",
+     "tasks": ["calculation"], "pixel_counts": {...}, "co2": 1.0}
+    and failed jobs have an "error" instead (they are run again on resume).
+    A truncated last line (the process died while writing it) is ignored.
+    """
+
+    def __init__(self, path: Path):
+        """
+        Args:
+            path: path of the checkpoint file, created if not exists
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._done = {}  # (forest, start_date, end_date): tasks done
+        self._lock = threading.Lock()
+
+        if self.path.exists():
+            with open(self.path) as checkpoint_file:
+                for line in checkpoint_file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if "error" not in entry:
+                        self._mark_done(entry)
+
+    def is_done(
+        self, forest: str, start_date: str, end_date: str, tasks: List[str]
+    ) -> bool:
+        """
+        Check if every task of a forest window succeeded in a previous job
+        """
+        with self._lock:
+            done = self._done.get((forest, start_date, end_date), set())
+        return done.issuperset(tasks)
+
+    def record(self, entry: dict):
+        """
+        Appends the outcome of a job, see the class docstring for its format
+        """
+        line = json.dumps(entry, default=str)
+        with self._lock:
+            with open(self.path, "a") as checkpoint_file:
+                checkpoint_file.write(line + "\n")
+            if "error" not in entry:
+                self._mark_done(entry)
+
+    def _mark_done(self, entry: dict):
+        key = (entry["forest"], entry["start_date"], entry["end_date"])
+        self._done.setdefault(key, set()).update(entry["tasks"])
+
+
+def run_batch(
+    base_directory: Path,
+    start_date: str,
+    end_date: str,
+    step_days: int = DEFAULT_STEP_DAYS,
+    forests: Optional[List[str]] = None,
+    calculate: bool = True,
+    download: bool = False,
+    output_dir: Path = Path(DEFAULT_OUTPUT_DIR),
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    requests_per_second: Optional[float] = None,
+    cache: Optional[ResultCache] = None,
+    progress: Optional[Callable[[dict], None]] = None,
+    sink: Optional[ResultSink] = None,
+) -> BatchSummary:
+    """
+    Runs the calculations and/or downloads of several forests for every
+    window of step_days days between start_date and end_date, one job per
+    (forest, window) running concurrently (see dynamic_world.scheduler.run_jobs).
+    Outcomes are appended to output_dir/checkpoint.jsonl as jobs finish
+    (see RunCheckpoint), jobs already there are skipped so running the
+    same command again resumes an interrupted run.
+    Args:
+        base_directory: directory containing one directory per forest
+        start_date: a string with format YYYY-mm-dd
+        end_date: a string with format YYYY-mm-dd, must be after start_date
+        step_days: length of each window in days
+        forests: names of the forest directories to run, all by default
+        calculate: calculate the pixel counts and CO2 of every window.
+            If download is set too they are calculated from the downloaded
+            file (see dynamic_world.downloads.calculate_and_download)
+        download: download the COG file of every window into
+            output_dir/<forest directory>
+        output_dir: folder of the checkpoint and downloads, created if not
+            exists
+        max_workers: maximum number of jobs running at the same time
+        requests_per_second: if set, maximum average rate of jobs started
+        cache: a ResultCache passed to the calculations and downloads
+        progress: called with every checkpoint entry as soon as it is written
+        sink: if set, the pixel counts and CO2 of every successful job are
+            written into it as soon as they are ready (see dynamic_world.sinks),
+            it is not closed
+    Returns:
+        a BatchSummary
+    """
+    if not calculate and not download:
+        raise ValueError("at least one of calculate and download must be set")
+
+    windows = date_windows(start_date, end_date, step_days)
+    registry = ForestRegistry(base_directory, max_workers=max_workers)
+    for name, error in registry.errors.items():
+        get_logger().warning(f"Skipping invalid forest {name}: {error}")
+    if forests is None:
+        forests = registry.names()
+    else:
+        registry.validate_forest_names(forests)
+
+    tasks = [
+        task
+        for task, enabled in ((CALCULATION_TASK, calculate), (DOWNLOAD_TASK, download))
+        if enabled
+    ]
+    checkpoint = RunCheckpoint(Path(output_dir) / CHECKPOINT_FILENAME)
+
+    succeeded, failed, retries, skipped = 0, 0, 0, 0
+    start = time.perf_counter()
+
+    def finish(entry: dict, error: Optional[BaseException] = None):
+        """
+        Counts and records the outcome of a job
+        """
+        nonlocal succeeded, failed
+        if error is None:
+            succeeded += 1
+        else:
+            failed += 1
+            entry["error"] = str(error)
+            get_logger().error(
+                f"{entry['forest']} {entry['start_date']} {entry['end_date']} "
+                + f"failed: {error}"
+            )
+        checkpoint.record(entry)
+        if progress is not None:
+            progress(entry)
+
+    def pending_jobs() -> Iterator[Job]:
+        """
+        Jobs not done yet, created lazily as the scheduler needs them.
+        Checkpoint entries are keyed by forest directory (the job name), not
+        by forest name
+        """
+        nonlocal skipped
+        for name in forests:
+            pending = []
+            for window in windows:
+                if checkpoint.is_done(name, *window, tasks):
+                    skipped += 1
+                else:
+                    pending.append(window)
+            if not pending:
+                continue
+
+            # A forest which cannot be loaded fails its jobs, not the batch
+            try:
+                forest = registry.get(name)
+            except Exception as error:
+                for window_start, window_end in pending:
+                    entry = {
+                        "forest": name,
+                        "start_date": window_start,
+                        "end_date": window_end,
+                        "tasks": tasks,
+                        "attempts": 0,
+                    }
+                    finish(entry, error)
+                continue
+
+            task = _forest_task(name, calculate, download, output_dir, cache)
+            for window in pending:
+                yield Job(forest, *window, task, name)
+
+    for result in run_jobs(
+        pending_jobs(), max_workers=max_workers, requests_per_second=requests_per_second
+    ):
+        entry = {
+            "forest": result.job.name,
+            "start_date": result.job.start_date,
+            "end_date": result.job.end_date,
+            "tasks": tasks,
+            "attempts": result.attempts,
+        }
+        retries += result.attempts - 1
+        if result.error is None:
+            entry.update(result.result)
+            if sink is not None and "pixel_counts" in entry:
+                sink.write(
+                    ForestWindowResult(
+                        result.job.forest.name,
+                        result.job.start_date,
+                        result.job.end_date,
+                        entry["pixel_counts"],
+                        entry["co2"],
+                    )
+                )
+        finish(entry, result.error)
+
+    return BatchSummary(
+        jobs=succeeded + failed + skipped,
+        skipped=skipped,
+        succeeded=succeeded,
+        failed=failed,
+        retries=retries,
+        seconds=time.perf_counter() - start,
+    )
+
+
+def iter_calculations(
+    forests: Iterable[ForestConfig],
+    windows: Iterable[Tuple[str, str]],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    requests_per_second: Optional[float] = None,
+    cache: Optional[ResultCache] = None,
+) -> Iterator[ForestWindowResult]:
+    """
+    Calculates the pixel counts and CO2 of every forest for every window,
+    one job per (forest, window) running concurrently, yielding each result
+    as soon as it is ready (not in order). Forests are consumed lazily, so
+    results can be written to a sink (see dynamic_world.sinks.write_results)
+    with constant memory however long the run is.
+    If a job fails the jobs not started are dropped and its error is raised,
+    the results already yielded are kept
+    Args:
+        forests: ForestConfig objects, for example a generator
+        windows: (start_date, end_date) pairs with format YYYY-mm-dd
+        max_workers: maximum number of jobs running at the same time
+        requests_per_second: if set, maximum average rate of jobs started
+        cache: a ResultCache passed to single_date_calculation
+    Returns:
+        an iterator of ForestWindowResult
+    """
+    windows = list(windows)
+    task = partial(_calculation_task, cache=cache)
+    jobs = (Job(forest, *window, task) for forest in forests for window in windows)
+
+    for result in run_jobs(
+        jobs, max_workers=max_workers, requests_per_second=requests_per_second
+    ):
+        if result.error is not None:
+            raise result.error
+        yield ForestWindowResult(
+            result.job.forest.name,
+            result.job.start_date,
+            result.job.end_date,
+            result.result["pixel_counts"],
+            result.result["co2"],
+        )
+
+
+def _forest_task(
+    name: str,
+    calculate: bool,
+    download: bool,
+    output_dir: Path,
+    cache: Optional[ResultCache],
+) -> Callable[[str, str, ForestConfig], dict]:
+    """
+    Task of the jobs of a forest directory, see run_batch
+    """
+    if download:
+        return partial(
+            _download_task,
+            destination_folder=Path(output_dir) / name,
+            calculate=calculate,
+            cache=cache,
+        )
+    return partial(_calculation_task, cache=cache)
+
+
+def _calculation_task(
+    start_date: str,
+    end_date: str,
+    forest: ForestConfig,
+    cache: Optional[ResultCache] = None,
+) -> dict:
+    pixel_counts = single_date_calculation(start_date, end_date, forest, cache=cache)
+    return {
+        "pixel_counts": pixel_counts,
+        "co2": co2_factor_calculation(pixel_counts, forest),
+    }
+
+
+def _download_task(
+    start_date: str,
+    end_date: str,
+    forest: ForestConfig,
+    destination_folder: Path,
+    calculate: bool,
+    cache: Optional[ResultCache] = None,
+) -> dict:
+    if not calculate:
+        path = download_single_date_image(
+            start_date, end_date, forest, destination_folder, cache=cache
+        )
+        return {"path": str(path)}
+
+    report = calculate_and_download(
+        start_date, end_date, forest, destination_folder, cache=cache
+    )
+    return {
+        "path": str(report.path),
+        "pixel_counts": report.pixel_counts,
+        "co2": report.co2,
+    }
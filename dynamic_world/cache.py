@@ -0,0 +1,202 @@
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+from dynamic_world import metrics
+from dynamic_world.constants import (
+    CACHE_EVICTION_TARGET,
+    CACHE_HITS_COUNTER,
+    CACHE_MISSES_COUNTER,
+    DEFAULT_CACHE_DIR,
+    DEFAULT_CACHE_MAX_BYTES,
+    DYNAMIC_WORLD_COLLECTION,
+    SCALE,
+)
+
+
+class ResultCache:
+    """
+    On-disk, content-addressed cache of Earth Engine results.
+    Each entry is a small json file named after the hash of everything that
+    defines the computation (geometry, dates, dataset, reducer and scale).
+    Writes are atomic (temporary file + rename) so several workers, threads
+    or processes, can share the same directory.
+    The last access time of each file is used for LRU eviction and its
+    modification time for age based eviction.
+    Writes keep a running total of the size of the cache (scanned on the
+    first write) and the directory is only scanned again once it exceeds
+    max_bytes. Expired entries are never returned, they are removed when
+    read or by evict.
+    """
+
+    def __init__(
+        self,
+        directory: Path = Path(DEFAULT_CACHE_DIR),
+        max_bytes: Optional[int] = DEFAULT_CACHE_MAX_BYTES,
+        max_age_days: Optional[float] = None,
+    ):
+        """
+        Args:
+            directory: folder where entries are stored, created if not exists
+            max_bytes: maximum size of all entries, least recently used are
+                removed first. None means no limit
+            max_age_days: entries older than this are discarded.
+                None means no limit
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._size = None  # Bytes of the entries, None until scanned
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(geometry: dict, start_date: str, end_date: str, reducer: str) -> str:
+        """
+        Builds the key of a computation
+        Args:
+            geometry: geojson object of the area
+            start_date: a string with format YYYY-mm-dd
+            end_date: a string with format YYYY-mm-dd
+            reducer: a string identifying the operation (reducer, file type...)
+        Returns:
+            a sha256 hex digest
+        """
+        content = json.dumps(
+            {
+                "geometry": geometry,
+                "start_date": start_date,
+                "end_date": end_date,
+                "dataset": DYNAMIC_WORLD_COLLECTION,
+                "reducer": reducer,
+                "scale": SCALE,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Returns the value stored under key or None if it is not present
+        (or has expired)
+        """
+        path = self._path(key)
+        try:
+            modified = path.stat().st_mtime
+            if self._expired(modified, time.time()):
+                path.unlink()
+                value = None
+            else:
+                with open(path) as entry:
+                    value = json.load(entry)
+                # Mark as recently used, keeping the creation time
+                os.utime(path, (time.time(), modified))
+        except (FileNotFoundError, json.JSONDecodeError):
+            value = None
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.increment(CACHE_MISSES_COUNTER if value is None else CACHE_HITS_COUNTER)
+
+        return value
+
+    def set(self, key: str, value: Any):
+        """
+        Stores value (must be json serializable) under key and evicts the
+        least recently used entries if the cache grew over max_bytes
+        """
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        with tempfile.NamedTemporaryFile(
+            "w", dir=path.parent, suffix=".tmp", delete=False
+        ) as tmpfile:
+            json.dump(value, tmpfile)
+        size = os.path.getsize(tmpfile.name)
+        try:
+            size -= path.stat().st_size  # Overwritten entry
+        except FileNotFoundError:
+            pass
+        os.replace(tmpfile.name, path)
+
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+            full = self._size is None or self._size > self.max_bytes
+        if full:
+            self._evict(self.max_bytes * CACHE_EVICTION_TARGET)
+
+    def evict(self):
+        """
+        Removes expired entries and then the least recently used ones until
+        the cache fits in max_bytes
+        """
+        self._evict(self.max_bytes)
+
+    def _evict(self, target_bytes: Optional[float]):
+        """
+        Removes expired entries and, if the cache does not fit in max_bytes,
+        the least recently used ones until it fits in target_bytes
+        """
+        now = time.time()
+        entries = []
+        for path in self.directory.glob("*/*.json"):
+            try:
+                stat = path.stat()
+                if self._expired(stat.st_mtime, now):
+                    path.unlink()
+                else:
+                    entries.append((stat.st_atime, stat.st_size, path))
+            except FileNotFoundError:  # Removed by another worker
+                continue
+
+        total = sum(size for _, size, _ in entries)
+        if self.max_bytes is not None and total > self.max_bytes:
+            for _, size, path in sorted(entries):
+                if total <= target_bytes:
+                    break
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+        with self._lock:
+            self._size = total
+
+    def stats(self) -> "dict[str, int]":
+        """
+        Returns the hit and miss counters
+        """
+        return {"hits": self.hits, "misses": self.misses}
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def _expired(self, modified: float, now: float) -> bool:
+        return (
+            self.max_age_days is not None
+            and now - modified > self.max_age_days * 24 * 3600
+        )
+
+
+def is_past_window(end_date: str) -> bool:
+    """
+    Check if a window already ended, so its Dynamic World data will not change
+    Args:
+        end_date: a string with format YYYY-mm-dd
+    """
+    return end_date < datetime.date.today().isoformat()
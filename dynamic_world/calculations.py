@@ -1,20 +1,85 @@
-import ee
-import geemap
+import math
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
+import numpy as np
+
+from dynamic_world import metrics
+from dynamic_world.cache import ResultCache, is_past_window
+from dynamic_world.composites import forest_borders, label_composite
 from dynamic_world.configurations import ForestConfig
 from dynamic_world.constants import (
-    CLASS_LABELS_DICT,
+    DEFAULT_MAX_WORKERS,
+    DEFAULT_WINDOW_BATCH_SIZE,
+    DOWNLOAD_CRS,
     FACTOR_PIXEL_LABEL,
+    FOREST_NAME_PROPERTY,
+    FOREST_TOTAL_ID,
+    HISTOGRAM_CACHE_REDUCER,
+    HISTOGRAM_PROPERTY,
+    LABEL_MODE_BAND,
+    MAX_PARTITION_DEPTH,
+    MAX_PIXELS,
+    MAX_REGION_PIXELS,
+    METERS_PER_DEGREE,
     NA_LABEL,
     OTHER_LABEL,
+    PARTITION_ERROR_MESSAGES,
+    PIXEL_COUNT_COLUMNS,
     SCALE,
+    STAND_ID_PROPERTY,
+    TRANSITION_BAND,
+)
+from dynamic_world.errors import (
+    DateBeforeError,
+    DuplicateForestError,
+    KeyNotPresentError,
+)
+from dynamic_world.utils import (
+    format_pixel_counts,
+    get_logger,
+    lazy_import,
+    validate_dates,
 )
-from dynamic_world.errors import DateBeforeError
-from dynamic_world.utils import get_logger, validate_dates
+
+ee = lazy_import("ee")
+geemap = lazy_import("geemap")
+features = lazy_import("rasterio.features")
+
+
+class StandsCalculation(NamedTuple):
+    pixel_counts: "dict[str, dict[str, int]]"  # Per stand
+    co2: "dict[str, float]"  # Per stand
+    total_pixel_counts: "dict[str, int]"  # Whole forest
+    total_co2: float
+
+
+class TransitionCalculation(NamedTuple):
+    # Pixels of class row at the first window and class column at the second
+    # one, in the order of dynamic_world.constants.PIXEL_COUNT_COLUMNS
+    matrix: np.ndarray
+    co2_a: float  # Co2 Tons. at the first window
+    co2_b: float
+
+    @property
+    def co2_delta(self) -> float:
+        """
+        Co2 Tons. gained (positive) or lost between both windows
+        """
+        return self.co2_b - self.co2_a
 
 
 def single_date_calculation(
-    start_date: str, end_date: str, forest: ForestConfig
+    start_date: str,
+    end_date: str,
+    forest: ForestConfig,
+    return_raw: bool = False,
+    cache: Optional[ResultCache] = None,
+    partition: bool = False,
+    max_region_pixels: float = MAX_REGION_PIXELS,
+    max_workers: int = DEFAULT_MAX_WORKERS,
 ) -> "dict[str, int]":
     """
     Retrieves the pixel counts of the area defined in a proyect
@@ -28,6 +93,17 @@ def single_date_calculation(
         start_date: a string with format YYYY-mm-dd
         end_date: a string with format YYYY-mm-dd, must be after start_date
         proyect: a ForestConfig (see mrv.configurations.py) object
+        return_raw: if True, return the histogram as computed by Earth Engine
+            (keys are the class ids 0-8 and null) without label translation
+        cache: a ResultCache, windows that already ended are read from it
+            (or stored in it) without contacting Earth Engine
+        partition: if True, regions estimated to have more than
+            max_region_pixels pixels, or whose reduction fails because it is
+            too large (timeouts, memory limits...), are split in four and
+            reduced concurrently. Sub-regions are aligned to the pixel grid,
+            so every pixel is counted exactly once
+        max_region_pixels: largest region reduced at once when partitioning
+        max_workers: maximum number of sub-regions reduced at the same time
     Returns:
         a {string : int} dictionary with the following format
         (some keys could not be present):
@@ -44,11 +120,144 @@ def single_date_calculation(
     """
     validate_dates([start_date, end_date])
 
-    # Loading geojson object as ee.FeatureCollection
-    ee_geojson = geemap.geojson_to_ee(forest.geojson_info)
+    # Can compare this way since both dates are in ISO notation
+    if start_date >= end_date:
+        raise DateBeforeError("end_date", "start_date")
+
+    # If end_date is before proyect's start_date raise a warning
+    if forest.start_date > end_date:
+        get_logger().warning(
+            "end_date is before proyect's start_date: "
+            + f"{end_date} > {forest.start_date}"
+        )
+
+    # Past windows never change, so they can be served from the cache
+    cache_key = None
+    if cache is not None and is_past_window(end_date):
+        cache_key = ResultCache.key(
+            forest.geojson_info, start_date, end_date, HISTOGRAM_CACHE_REDUCER
+        )
+        raw_counts = cache.get(cache_key)
+        if raw_counts is not None:
+            return raw_counts if return_raw else format_pixel_counts(raw_counts)
 
     # Defining the borders for DW map (must be defined as ee.Geometry)
-    borders = ee_geojson.geometry()
+    borders = forest_borders(forest)
+
+    dw_composite = label_composite(start_date, end_date, borders).clip(borders)
+
+    if partition:
+        raw_counts = _partitioned_histogram(
+            dw_composite, borders, forest, max_region_pixels, max_workers
+        )
+    else:
+        # Extract pixel counts
+        counts = _pixel_histogram(dw_composite, borders)
+
+        # Single round-trip, labels are renamed client-side
+        raw_counts = metrics.get_info(counts)
+
+    if cache_key is not None:
+        cache.set(cache_key, raw_counts)
+
+    if return_raw:
+        return raw_counts
+
+    return format_pixel_counts(raw_counts)
+
+
+def multi_forest_calculation(
+    start_date: str, end_date: str, forests: List[ForestConfig]
+) -> "dict[str, dict[str, int]]":
+    """
+    Retrieves the pixel counts of several forests at once.
+    All the forests are merged into a single FeatureCollection and reduced
+    with one reduceRegions over a shared mode composite, so the whole batch
+    costs a single Earth Engine round-trip instead of one per forest.
+    Args:
+        start_date: a string with format YYYY-mm-dd
+        end_date: a string with format YYYY-mm-dd, must be after start_date
+        forests: a list of ForestConfig objects, names must be unique
+    Returns:
+        a {forest name : pixel counts} dictionary, where pixel counts follow
+        the same format as in single_date_calculation
+    """
+    validate_dates([start_date, end_date])
+
+    # Can compare this way since both dates are in ISO notation
+    if start_date >= end_date:
+        raise DateBeforeError("end_date", "start_date")
+
+    names = set()
+    for forest in forests:
+        if forest.name in names:
+            raise DuplicateForestError(forest.name)
+        names.add(forest.name)
+
+        # If end_date is before proyect's start_date raise a warning
+        if forest.start_date > end_date:
+            get_logger().warning(
+                f"end_date is before {forest.name}'s start_date: "
+                + f"{end_date} > {forest.start_date}"
+            )
+
+    # One feature per forest, tagged with its name
+    regions = ee.FeatureCollection(
+        [
+            ee.Feature(
+                forest_borders(forest),
+                {FOREST_NAME_PROPERTY: forest.name},
+            )
+            for forest in forests
+        ]
+    )
+
+    # No need to clip, each region is only reduced over its own footprint
+    dw_composite = label_composite(start_date, end_date, regions)
+
+    countStats = dw_composite.reduceRegions(
+        collection=regions,
+        reducer=ee.Reducer.frequencyHistogram().unweighted(),
+        scale=SCALE,  # IMPORTANT!!!! each pixel is 10m x 10m
+    )
+
+    # Only fetch names and histograms, geometries stay in Earth Engine
+    countStats = _with_histogram(countStats)
+    counts = metrics.get_info(
+        ee.Dictionary.fromLists(
+            countStats.aggregate_array(FOREST_NAME_PROPERTY),
+            countStats.aggregate_array(HISTOGRAM_PROPERTY),
+        )
+    )
+
+    return {
+        forest.name: format_pixel_counts(counts.get(forest.name, {}))
+        for forest in forests
+    }
+
+
+def stands_calculation(
+    start_date: str, end_date: str, forest: ForestConfig, stand_property: str
+) -> StandsCalculation:
+    """
+    Retrieves the pixel counts and CO2 of every stand (parcel) of a forest,
+    along with the totals of the whole forest, in a single Earth Engine
+    round-trip. Features of the forest's geojson sharing the same value of
+    stand_property are grouped into one stand, and the whole forest is
+    reduced as one more region of the same reduceRegions, so pixels of
+    overlapping stands are counted once in the totals.
+    Args:
+        start_date: a string with format YYYY-mm-dd
+        end_date: a string with format YYYY-mm-dd, must be after start_date
+        forest: a ForestConfig object
+        stand_property: the feature property identifying each stand,
+            every feature must have it
+    Returns:
+        a StandsCalculation whose pixel counts follow the same format as in
+        single_date_calculation, stands are keyed by their stand_property
+        value (as string)
+    """
+    validate_dates([start_date, end_date])
 
     # Can compare this way since both dates are in ISO notation
     if start_date >= end_date:
@@ -61,33 +270,63 @@ def single_date_calculation(
             + f"{end_date} > {forest.start_date}"
         )
 
-    dw = (
-        ee.ImageCollection("GOOGLE/DYNAMICWORLD/V1")
-        .filterDate(start_date, end_date)
-        .filterBounds(borders)
-    )  # Returns ee.ImageCollection
+    # Group the features client-side, Earth Engine only sees stand ids.
+    # A preprocessed forest lost its features, stands use the original ones
+    stands = {}
+    for index, feature in enumerate(forest.source_features()):
+        properties = feature.get("properties") or {}
+        if stand_property not in properties:
+            raise KeyNotPresentError(f"feature {index} properties", stand_property)
+        stands.setdefault(str(properties[stand_property]), []).append(feature)
+    stand_ids = {name: str(index) for index, name in enumerate(stands)}
 
-    # Reducing using the mode (polling)
-    classification = dw.select("label")
-    dw_composite = classification.reduce(ee.Reducer.mode()).clip(borders)
+    borders = forest_borders(forest)
+    regions = ee.FeatureCollection(
+        [
+            ee.Feature(
+                geemap.geojson_to_ee(
+                    {"type": "FeatureCollection", "features": stand_features}
+                ).geometry(),
+                {STAND_ID_PROPERTY: stand_ids[name]},
+            )
+            for name, stand_features in stands.items()
+        ]
+        + [ee.Feature(borders, {STAND_ID_PROPERTY: FOREST_TOTAL_ID})]
+    )
 
-    # Extract pixel counts
-    countStats = dw_composite.reduceRegion(
-        geometry=borders,
+    # No need to clip, each region is only reduced over its own footprint
+    dw_composite = label_composite(start_date, end_date, borders)
+
+    countStats = dw_composite.reduceRegions(
+        collection=regions,
         reducer=ee.Reducer.frequencyHistogram().unweighted(),
         scale=SCALE,  # IMPORTANT!!!! each pixel is 10m x 10m
-        maxPixels=1e10,
     )
 
-    counts = ee.Dictionary(countStats.get("label_mode"))
+    # Only fetch ids and histograms, geometries stay in Earth Engine
+    countStats = _with_histogram(countStats)
+    counts = metrics.get_info(
+        ee.Dictionary.fromLists(
+            countStats.aggregate_array(STAND_ID_PROPERTY),
+            countStats.aggregate_array(HISTOGRAM_PROPERTY),
+        )
+    )
 
-    # Rename using propper classLabels (not 0-8)
-    old_keys = counts.keys().getInfo()
-    counts_formatted = counts.rename(
-        old_keys, [CLASS_LABELS_DICT.get(key) for key in old_keys]
+    pixel_counts = {
+        name: format_pixel_counts(counts.get(stand_ids[name], {})) for name in stands
+    }
+    total_pixel_counts = format_pixel_counts(counts.get(FOREST_TOTAL_ID, {}))
+    co2 = co2_factor_batch_calculation(
+        pixel_counts_matrix(list(pixel_counts.values()) + [total_pixel_counts]),
+        forest,
     )
 
-    return counts_formatted.getInfo()
+    return StandsCalculation(
+        pixel_counts,
+        dict(zip(pixel_counts.keys(), co2[:-1].tolist())),
+        total_pixel_counts,
+        float(co2[-1]),
+    )
 
 
 def co2_factor_calculation(
@@ -104,6 +343,7 @@ def co2_factor_calculation(
     which we have information about.
     For example, if available pixels contain 40% forest,
     we suppose NA's also have 40% forest.
+    If there are no pixels besides NA's the result is 0 Co2 Tons.
     Args:
         pixel_counts: a dictionary containing the counts of each category
         forest: a ForestConfig object (containing a co2_factor_info dictionary).
@@ -127,10 +367,12 @@ def co2_factor_calculation(
 
     #  First we remove the NA assuming they
     # distribute just like the pixels for which we have info
-    for notNAKey in set(pixel_counts_copy.keys()).difference([NA_LABEL]):
-        pixel_counts_copy[notNAKey] += (
-            pixel_counts_copy[NA_LABEL] * pixel_counts_copy[notNAKey] / notNACount
-        )
+    # (there is nothing to distribute them like if every pixel is NA)
+    if notNACount > 0:
+        for notNAKey in set(pixel_counts_copy.keys()).difference([NA_LABEL]):
+            pixel_counts_copy[notNAKey] += (
+                pixel_counts_copy[NA_LABEL] * pixel_counts_copy[notNAKey] / notNACount
+            )
 
     for commonKey in set(metric.keys()).intersection(pixel_counts_copy.keys()):
         totalCO2 += pixel_counts_copy[commonKey] * metric[commonKey] / factorPixel
@@ -142,3 +384,382 @@ def co2_factor_calculation(
         totalCO2 += pixel_counts_copy[otherKey] * metric[OTHER_LABEL] / factorPixel
 
     return totalCO2
+
+
+def pixel_counts_matrix(pixel_counts: "Iterable[dict[str, int]]") -> np.ndarray:
+    """
+    Stacks several pixel counts dictionaries into a matrix
+    Args:
+        pixel_counts: dictionaries as returned by single_date_calculation
+    Returns:
+        a 2-D array with one row per dictionary and one column per label,
+        in the order of dynamic_world.constants.PIXEL_COUNT_COLUMNS
+        (missing labels are 0)
+    """
+    return np.array(
+        [
+            [counts.get(label, 0) for label in PIXEL_COUNT_COLUMNS]
+            for counts in pixel_counts
+        ],
+        dtype=np.float64,
+    ).reshape(-1, len(PIXEL_COUNT_COLUMNS))
+
+
+def co2_factor_weights(forest: ForestConfig) -> np.ndarray:
+    """
+    Builds the Co2 Tons. per pixel of each column of a pixel counts matrix
+    (see pixel_counts_matrix). Labels not present in co2_factor_info use
+    the 'other' factor and NA has no weight (NA's are redistributed)
+    Args:
+        forest: a ForestConfig object (containing a co2_factor_info dictionary)
+    Returns:
+        a 1-D array with one weight per column
+    """
+    metric = forest.co2_factor_info
+
+    return np.array(
+        [
+            0
+            if label == NA_LABEL
+            else metric.get(label, metric[OTHER_LABEL]) / metric[FACTOR_PIXEL_LABEL]
+            for label in PIXEL_COUNT_COLUMNS
+        ],
+        dtype=np.float64,
+    )
+
+
+def co2_factor_batch_calculation(
+    pixel_counts: np.ndarray, forest: ForestConfig
+) -> np.ndarray:
+    """
+    Vectorized version of co2_factor_calculation for many observations
+    (for example forests x dates) at once, NA's are treated the same way
+    and observations without any pixel besides NA's result in 0 Co2 Tons
+    too.
+    Args:
+        pixel_counts: a 2-D array with one row per observation and one
+            column per label (see pixel_counts_matrix)
+        forest: a ForestConfig object (containing a co2_factor_info dictionary)
+    Returns:
+        a 1-D array with the total CO2 tons of each observation
+    """
+    pixel_counts = np.asarray(pixel_counts, dtype=np.float64)
+    na_column = PIXEL_COUNT_COLUMNS.index(NA_LABEL)
+
+    na_counts = pixel_counts[:, na_column]
+    not_na_counts = pixel_counts.sum(axis=1) - na_counts
+
+    # NA's distribute just like the pixels for which we have info
+    na_ratio = np.divide(
+        na_counts,
+        not_na_counts,
+        out=np.zeros_like(na_counts),
+        where=not_na_counts > 0,
+    )
+    redistributed = pixel_counts + pixel_counts * na_ratio[:, np.newaxis]
+
+    return redistributed @ co2_factor_weights(forest)
+
+
+def time_series_calculation(
+    forest: ForestConfig, windows: Iterable[Tuple[str, str]]
+) -> "dict[tuple[str, str], dict[str, int]]":
+    """
+    Retrieves the pixel counts of a forest for many date windows at once.
+    Every window gets its own mode composite and histogram, all of them are
+    built server-side and fetched together with a single getInfo call.
+    Args:
+        forest: a ForestConfig object
+        windows: (start_date, end_date) pairs with format YYYY-mm-dd,
+            see dynamic_world.utils.date_windows
+    Returns:
+        a {(start_date, end_date) : pixel counts} dictionary following the
+        order of windows, where pixel counts follow the same format as in
+        single_date_calculation (so they can be passed directly to
+        co2_factor_calculation)
+    """
+    windows = list(windows)
+
+    for start_date, end_date in windows:
+        validate_dates([start_date, end_date])
+
+        # Can compare this way since both dates are in ISO notation
+        if start_date >= end_date:
+            raise DateBeforeError("end_date", "start_date")
+
+    # If some end_date is before proyect's start_date raise a warning
+    early_windows = [end for _, end in windows if forest.start_date > end]
+    if early_windows:
+        get_logger().warning(
+            f"{len(early_windows)} windows end before proyect's start_date: "
+            + f"{min(early_windows)} > {forest.start_date}"
+        )
+
+    # The geometry is converted only once for every window
+    borders = forest_borders(forest)
+
+    histograms = metrics.get_info(
+        ee.List(
+            [
+                _pixel_histogram(
+                    label_composite(start_date, end_date, borders).clip(borders),
+                    borders,
+                )
+                for start_date, end_date in windows
+            ]
+        )
+    )
+
+    return {
+        window: format_pixel_counts(counts)
+        for window, counts in zip(windows, histograms)
+    }
+
+
+def iter_time_series_calculation(
+    forest: ForestConfig,
+    windows: Iterable[Tuple[str, str]],
+    batch_size: int = DEFAULT_WINDOW_BATCH_SIZE,
+) -> Iterator[Tuple[Tuple[str, str], "dict[str, int]"]]:
+    """
+    Generator version of time_series_calculation, windows are consumed lazily
+    and fetched batch_size at a time (one getInfo per batch), so memory does
+    not grow with the number of windows and the windows already yielded are
+    kept if a later batch fails.
+    Args:
+        forest: a ForestConfig object
+        windows: (start_date, end_date) pairs with format YYYY-mm-dd,
+            for example a generator
+        batch_size: windows fetched with each Earth Engine round-trip
+    Returns:
+        an iterator of ((start_date, end_date), pixel counts) following the
+        order of windows, pixel counts follow the same format as in
+        single_date_calculation
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be a positive number of windows")
+
+    windows = iter(windows)
+    while True:
+        batch = list(islice(windows, batch_size))
+        if not batch:
+            return
+        yield from time_series_calculation(forest, batch).items()
+
+
+def transition_calculation(
+    forest: ForestConfig, window_a: Tuple[str, str], window_b: Tuple[str, str]
+) -> TransitionCalculation:
+    """
+    Retrieves the class transitions of every pixel of a forest between two
+    date windows with a single Earth Engine computation. Both mode composites
+    are combined into one band (class_a * 10 + class_b, pixels without data
+    are NA) whose frequency histogram is the transition matrix.
+    Args:
+        forest: a ForestConfig object
+        window_a: (start_date, end_date) of the first composite, strings
+            with format YYYY-mm-dd
+        window_b: (start_date, end_date) of the second composite
+    Returns:
+        a TransitionCalculation with the 10x10 transition matrix (9 classes
+        and NA) and the Co2 Tons. at both windows
+    """
+    for start_date, end_date in (window_a, window_b):
+        validate_dates([start_date, end_date])
+
+        # Can compare this way since both dates are in ISO notation
+        if start_date >= end_date:
+            raise DateBeforeError("end_date", "start_date")
+
+        # If end_date is before proyect's start_date raise a warning
+        if forest.start_date > end_date:
+            get_logger().warning(
+                "end_date is before proyect's start_date: "
+                + f"{end_date} > {forest.start_date}"
+            )
+
+    classes = len(PIXEL_COUNT_COLUMNS)
+    na_index = PIXEL_COUNT_COLUMNS.index(NA_LABEL)
+
+    # Defining the borders for DW map (must be defined as ee.Geometry).
+    # A window without images is all NA, instead of a composite without bands
+    borders = forest_borders(forest)
+    composite_a, composite_b = [
+        label_composite(start_date, end_date, borders, empty_label=na_index)
+        .unmask(na_index)
+        .clip(borders)
+        for start_date, end_date in (window_a, window_b)
+    ]
+    transitions = composite_a.multiply(classes).add(composite_b)
+
+    countStats = transitions.rename(TRANSITION_BAND).reduceRegion(
+        geometry=borders,
+        reducer=ee.Reducer.frequencyHistogram().unweighted(),
+        scale=SCALE,  # IMPORTANT!!!! each pixel is 10m x 10m
+        maxPixels=MAX_PIXELS,
+    )
+    counts = ee.Dictionary(countStats.get(TRANSITION_BAND, ee.Dictionary()))
+
+    matrix = np.zeros((classes, classes), dtype=np.int64)
+    for key, count in metrics.get_info(counts).items():
+        class_a, class_b = divmod(int(float(key)), classes)
+        matrix[class_a, class_b] += count
+
+    return transition_from_matrix(matrix, forest)
+
+
+def transition_from_matrix(
+    matrix: np.ndarray, forest: ForestConfig
+) -> TransitionCalculation:
+    """
+    Calculates the Co2 Tons. at both windows of a transition matrix, whose
+    row and column totals are the pixel counts of each window
+    """
+    co2_a, co2_b = co2_factor_batch_calculation(
+        np.stack([matrix.sum(axis=1), matrix.sum(axis=0)]), forest
+    )
+    return TransitionCalculation(matrix, float(co2_a), float(co2_b))
+
+
+def _with_histogram(countStats: "ee.FeatureCollection") -> "ee.FeatureCollection":
+    """
+    Gives an empty histogram to the regions reduced without one (no pixels),
+    aggregate_array skips missing properties so otherwise the histograms
+    would no longer be aligned with the names of their regions
+    """
+    return countStats.map(
+        lambda feature: feature.set(
+            HISTOGRAM_PROPERTY,
+            feature.toDictionary().get(HISTOGRAM_PROPERTY, ee.Dictionary()),
+        )
+    )
+
+
+def _pixel_histogram(dw_composite: "ee.Image", borders) -> "ee.Dictionary":
+    """
+    Counts the pixels of each class of a label composite inside borders.
+    Windows without images yield an empty dictionary
+    """
+    countStats = dw_composite.reduceRegion(
+        geometry=borders,
+        reducer=ee.Reducer.frequencyHistogram().unweighted(),
+        scale=SCALE,  # IMPORTANT!!!! each pixel is 10m x 10m
+        maxPixels=MAX_PIXELS,
+    )
+
+    return ee.Dictionary(countStats.get(LABEL_MODE_BAND, ee.Dictionary()))
+
+
+def _partitioned_histogram(
+    dw_composite: "ee.Image",
+    borders: "ee.Geometry",
+    forest: ForestConfig,
+    max_region_pixels: float,
+    max_workers: int,
+) -> "dict[str, int]":
+    """
+    Counts the pixels of each class of dw_composite inside borders, splitting
+    the forest into cells of the pixel grid (in EPSG:4326) until every cell
+    can be reduced. Cells are reduced concurrently, one level at a time, and
+    their histograms are added up
+    """
+    pixel = SCALE / METERS_PER_DEGREE
+    west, south, east, north = features.bounds(forest.geojson_info)
+    # Cells are (first column, first row, last column, last row) of the grid
+    pending = [
+        (
+            (
+                math.floor(west / pixel),
+                math.floor(south / pixel),
+                math.ceil(east / pixel),
+                math.ceil(north / pixel),
+            ),
+            0,
+        )
+    ]
+    raw_counts = Counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending:
+            results = executor.map(
+                lambda item: _cell_histogram(
+                    dw_composite, borders, *item, max_region_pixels
+                ),
+                pending,
+            )
+            next_level = []
+            for (cell, depth), counts in zip(pending, results):
+                if counts is None:
+                    next_level.extend((child, depth + 1) for child in _split_cell(cell))
+                else:
+                    raw_counts.update(counts)
+            pending = next_level
+
+    return dict(raw_counts)
+
+
+def _cell_histogram(
+    dw_composite: "ee.Image",
+    borders: "ee.Geometry",
+    cell: Tuple[int, int, int, int],
+    depth: int,
+    max_region_pixels: float,
+) -> Optional["dict[str, int]"]:
+    """
+    Counts the pixels of each class inside a cell of the forest
+    Returns:
+        the raw histogram, or None if the cell must be split
+    """
+    col_start, row_start, col_end, row_end = cell
+    splittable = depth < MAX_PARTITION_DEPTH and len(_split_cell(cell)) > 1
+    if splittable and (col_end - col_start) * (row_end - row_start) > (
+        max_region_pixels
+    ):
+        return None
+
+    if depth == 0:
+        region = borders
+    else:
+        # Cell borders lie between pixel centers, half a pixel away, so a
+        # 1m error margin never moves a pixel to the neighbouring cell
+        pixel = SCALE / METERS_PER_DEGREE
+        rectangle = ee.Geometry.Rectangle(
+            [
+                col_start * pixel,
+                row_start * pixel,
+                col_end * pixel,
+                row_end * pixel,
+            ],
+            DOWNLOAD_CRS,
+            False,
+        )
+        region = borders.intersection(rectangle, 1, DOWNLOAD_CRS)
+
+    try:
+        return metrics.get_info(_pixel_histogram(dw_composite, region))
+    except Exception as error:
+        message = str(error).lower()
+        if splittable and any(
+            fragment in message for fragment in PARTITION_ERROR_MESSAGES
+        ):
+            get_logger().info(f"Splitting region {cell} after error: {error}")
+            return None
+        raise
+
+
+def _split_cell(cell: Tuple[int, int, int, int]) -> List[Tuple[int, int, int, int]]:
+    """
+    Splits a cell of the pixel grid in (up to) four quadrants
+    """
+    col_start, row_start, col_end, row_end = cell
+    col_middle = (col_start + col_end) // 2
+    row_middle = (row_start + row_end) // 2
+    cols = [(col_start, col_middle), (col_middle, col_end)]
+    rows = [(row_start, row_middle), (row_middle, row_end)]
+
+    return [
+        (first_col, first_row, last_col, last_row)
+        for first_col, last_col in cols
+        for first_row, last_row in rows
+        if first_col < last_col and first_row < last_row
+    ]
@@ -0,0 +1,90 @@
+from typing import Optional
+
+from dynamic_world.configurations import ForestConfig
+from dynamic_world import metrics
+from dynamic_world.constants import (
+    COMPOSITE_STAGE,
+    DYNAMIC_WORLD_COLLECTION,
+    GEOJSON_TO_EE_STAGE,
+    LABEL_BAND,
+    LABEL_MODE_BAND,
+)
+from dynamic_world.utils import lazy_import
+
+ee = lazy_import("ee")
+geemap = lazy_import("geemap")
+
+
+def forest_borders(forest: ForestConfig) -> "ee.Geometry":
+    """
+    Defines the borders of a forest as ee.Geometry, using its preprocessed
+    geometry if available (see dynamic_world.geometry)
+    """
+    with metrics.timer(GEOJSON_TO_EE_STAGE):
+        if forest.ee_geometry is not None:
+            return ee.deserializer.fromJSON(forest.ee_geometry)
+
+        # Loading geojson object as ee.FeatureCollection
+        return geemap.geojson_to_ee(forest.geojson_info).geometry()
+
+
+def label_composite(
+    start_date: str, end_date: str, borders, empty_label: Optional[int] = None
+) -> "ee.Image":
+    """
+    Builds the Dynamic World label composite between start_date and end_date,
+    reducing every pixel using the mode (polling)
+    Args:
+        start_date: a string with format YYYY-mm-dd
+        end_date: a string with format YYYY-mm-dd
+        borders: ee.Geometry or ee.FeatureCollection used to filter the images
+        empty_label: if set, label of every pixel when there are no images
+            between start_date and end_date. Otherwise the composite has no
+            bands then, which fails any band operation
+    Returns:
+        an ee.Image with a single band named label_mode
+    """
+    with metrics.timer(COMPOSITE_STAGE):
+        dw = (
+            ee.ImageCollection(DYNAMIC_WORLD_COLLECTION)
+            .filterDate(start_date, end_date)
+            .filterBounds(borders)
+        )  # Returns ee.ImageCollection
+
+        composite = dw.select(LABEL_BAND).reduce(ee.Reducer.mode())
+        if empty_label is None:
+            return composite
+
+        return ee.Image(
+            ee.Algorithms.If(
+                dw.size().gt(0),
+                composite,
+                ee.Image.constant(empty_label).rename(LABEL_MODE_BAND),
+            )
+        )
+
+
+def download_composite(
+    start_date: str,
+    end_date: str,
+    borders: "ee.Geometry",
+    dtype: str,
+    nodata: Optional[int],
+) -> "ee.Image":
+    """
+    Builds the label composite clipped to borders, ready to be downloaded
+    Args:
+        start_date: a string with format YYYY-mm-dd
+        end_date: a string with format YYYY-mm-dd
+        borders: ee.Geometry of the forest
+        dtype: data type of the labels, class ids 0-8 fit in uint8
+        nodata: value given to pixels without data, if None they stay masked
+    Returns:
+        an ee.Image with a single band named label_mode
+    """
+    dw_composite = label_composite(start_date, end_date, borders).clip(borders)
+
+    # Compact labels with an explicit nodata value
+    if nodata is not None:
+        dw_composite = dw_composite.unmask(nodata)
+    return dw_composite.cast({LABEL_MODE_BAND: dtype})
@@ -1,17 +1,20 @@
 import datetime
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 import geojson
 import yaml
 from pydantic import BaseModel, validator
 from yaml.loader import SafeLoader
 
+from dynamic_world import metrics
 from dynamic_world.constants import (
     CLASS_LABELS,
+    CONFIG_LOAD_STAGE,
     FACTOR_PIXEL_LABEL,
     FOREST_CONFIG_FILENAME,
     OTHER_LABEL,
+    SCALE,
 )
 from dynamic_world.errors import (
     DateBadFormatError,
@@ -19,6 +22,9 @@ from dynamic_world.errors import (
     UndefinedKeyError,
 )
 
+# LibYAML based loader is much faster, if available
+YamlLoader = getattr(yaml, "CSafeLoader", SafeLoader)
+
 
 class ForestConfig(BaseModel):
     name: str  # The name of the forest/proyect
@@ -27,6 +33,10 @@ class ForestConfig(BaseModel):
         str, float
     ]  # Dictionary containing info used to calculate ammount of co2 retained
     start_date: str
+    # Serialized ee.Geometry of the (simplified) area, if it was preprocessed
+    ee_geometry: Optional[str] = None
+    # Original geojson file, if geojson_info is its preprocessed version
+    source_geojson_path: Optional[Path] = None
 
     @validator("co2_factor_info")
     def co2_factor_must_contain(cls, v):
@@ -77,8 +87,21 @@ class ForestConfig(BaseModel):
             **data
         )
 
+    def source_features(self) -> list:
+        """
+        Features of the original geojson file, with their properties (a
+        preprocessed geojson_info is a single dissolved feature)
+        """
+        if self.source_geojson_path is None:
+            return self.geojson_info["features"]
+
+        with open(self.source_geojson_path) as geojson_file:
+            return geojson.load(geojson_file)["features"]
+
 
-def load_config(directory_path: Path) -> ForestConfig:
+def load_config(
+    directory_path: Path, preprocess: bool = False, tolerance: float = SCALE / 2
+) -> ForestConfig:
     """
     Loads a forest configuration.
     A forest configuration is defined by its name, location as geojson object and
@@ -94,22 +117,51 @@ def load_config(directory_path: Path) -> ForestConfig:
         - start_date: date in which the resforestation began, in format YYYY-mm-dd
     Args:
         directory_path: Path of the directory containing the proyect
+        preprocess: if True, the geojson is dissolved and simplified
+            (see dynamic_world.geometry.preprocess_geometry, requires
+            Earth Engine to be initialized the first time)
+        tolerance: maximum error of the simplification in meters
     Returns:
         ForestConfig object with the configuration loaded
     TODO:
         Add support for shapefiles?
     """
 
-    path = directory_path / FOREST_CONFIG_FILENAME
+    with metrics.timer(CONFIG_LOAD_STAGE):
+        config_data = read_config_data(directory_path)
 
-    with open(path) as yaml_file:
-        config_data = yaml.load(yaml_file, Loader=SafeLoader)
+        geojson_path = directory_path / config_data["geojson"]
+        ee_geometry, source_geojson_path = None, None
+
+        if preprocess:
+            # Imported here since it needs Earth Engine
+            from dynamic_world.geometry import preprocess_geometry
 
-    forest_configuration = ForestConfig(
-        name=config_data["name"],
-        geojson_path=directory_path / config_data["geojson"],
-        co2_factor=config_data["co2_factor"],
-        start_date=config_data["start_date"],
-    )
+            source_geojson_path = geojson_path
+            geojson_path, ee_geometry, _ = preprocess_geometry(geojson_path, tolerance)
+
+        forest_configuration = ForestConfig(
+            name=config_data["name"],
+            geojson_path=geojson_path,
+            co2_factor=config_data["co2_factor"],
+            start_date=config_data["start_date"],
+            ee_geometry=ee_geometry,
+            source_geojson_path=source_geojson_path,
+        )
 
     return forest_configuration
+
+
+def read_config_data(directory_path: Path) -> dict:
+    """
+    Reads the configuration file of a forest directory without validating it
+    nor reading its geojson file (see load_config)
+    Args:
+        directory_path: Path of the directory containing the proyect
+    Returns:
+        a dictionary with the fields of the configuration file
+    """
+    path = directory_path / FOREST_CONFIG_FILENAME
+
+    with open(path) as yaml_file:
+        return yaml.load(yaml_file, Loader=YamlLoader)
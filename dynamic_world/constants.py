@@ -16,3 +16,98 @@ FACTOR_PIXEL_LABEL = 'factor_pixel'
 SCALE = 10
 DEFAULT_PROYECTS_DIR = 'forests'
 LOGGER_NAME = 'mrv-gnome'
+DYNAMIC_WORLD_COLLECTION = 'GOOGLE/DYNAMICWORLD/V1'
+LABEL_BAND = 'label'
+# Output names of the reducers used over the label band
+LABEL_MODE_BAND = 'label_mode'
+HISTOGRAM_PROPERTY = 'histogram'
+FOREST_NAME_PROPERTY = 'forest_name'
+# Scheduler defaults, see dynamic_world.scheduler
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_SECONDS = 1
+# Lowercase fragments of the errors Earth Engine raises when throttling
+THROTTLING_MESSAGES = [
+        'too many concurrent aggregations', 'too many requests',
+        'quota exceeded', 'rate limit', '429'
+]
+# Result cache defaults, see dynamic_world.cache
+DEFAULT_CACHE_DIR = '.dynamic_world_cache'
+DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# A full cache is shrunk to this fraction of max_bytes, so it is not scanned
+# again on the next write
+CACHE_EVICTION_TARGET = 0.9
+# Identify each kind of computation inside the result cache
+HISTOGRAM_CACHE_REDUCER = 'frequencyHistogram.unweighted'
+COG_CACHE_REDUCER = 'mode.cog'
+# Key used by Earth Engine histograms for pixels without data
+NA_CLASS_ID = 'null'
+# Column order of pixel count matrices (class labels followed by NA)
+PIXEL_COUNT_COLUMNS = list(CLASS_LABELS_DICT.values())
+# GDAL COG driver creation options, see https://gdal.org/drivers/raster/cog.html
+DEFAULT_COG_OPTIONS = {
+        'compress': 'DEFLATE', 'predictor': 'YES',
+        'overviews': 'AUTO', 'overview_resampling': 'MODE'
+}
+# CRS of the geojson files and the downloaded images
+DOWNLOAD_CRS = 'EPSG:4326'
+# Class ids 0-8 fit in a byte, nodata must not collide with a class id
+LABEL_DTYPE = 'uint8'
+LABEL_NODATA = 255
+# Geometry preprocessing, see dynamic_world.geometry
+SIMPLIFIED_GEOJSON_SUFFIX = '.simplified.geojson'
+SIMPLIFIED_EE_SUFFIX = '.simplified.ee.json'
+# Cache of the forest configurations, see dynamic_world.registry
+FOREST_MANIFEST_FILENAME = '.forest_manifest.json'
+# Environment variable holding the base64 encoded GEE service account json
+SERVICE_ACCOUNT_ENV = 'SERVICE_ACCOUNT'
+# Largest region reduced at once, see single_date_calculation(partition=True)
+MAX_PIXELS = 1e10
+MAX_REGION_PIXELS = 1e8
+MAX_PARTITION_DEPTH = 6
+# Size of a SCALE pixel in EPSG:4326 degrees, as used by Earth Engine
+METERS_PER_DEGREE = 111319.49079327357
+# Earth Engine errors fixed by reducing smaller regions
+PARTITION_ERROR_MESSAGES = [
+        'computation timed out', 'memory limit exceeded',
+        'too many pixels', 'computed value is too large'
+]
+# Identify every stand (group of features) of a forest inside Earth Engine
+STAND_ID_PROPERTY = 'stand_id'
+FOREST_TOTAL_ID = 'total'
+# Band encoding the class at two dates as class_a * len(PIXEL_COUNT_COLUMNS) + class_b
+TRANSITION_BAND = 'transition'
+# Pixel sampling estimates, see dynamic_world.sampling
+DEFAULT_SAMPLE_SIZE = 5000
+DEFAULT_CONFIDENCE = 0.95
+AREA_PROPERTY = 'area'
+# Metrics, see dynamic_world.metrics
+METRICS_PREFIX = 'dynamic_world'
+CONFIG_LOAD_STAGE = 'config_load'
+GEOJSON_TO_EE_STAGE = 'geojson_to_ee'
+COMPOSITE_STAGE = 'composite'
+GET_INFO_STAGE = 'get_info'
+DOWNLOAD_STAGE = 'download'
+COG_CONVERSION_STAGE = 'cog_conversion'
+EE_INITIALIZE_STAGE = 'ee_initialize'
+EE_ROUND_TRIPS_COUNTER = 'ee_round_trips'
+RETRIES_COUNTER = 'retries'
+BYTES_DOWNLOADED_COUNTER = 'bytes_downloaded'
+CACHE_HITS_COUNTER = 'cache_hits'
+CACHE_MISSES_COUNTER = 'cache_misses'
+# Batch runs, see dynamic_world.batch
+CHECKPOINT_FILENAME = 'checkpoint.jsonl'
+DEFAULT_OUTPUT_DIR = 'output'
+DEFAULT_STEP_DAYS = 30
+CALCULATION_TASK = 'calculation'
+DOWNLOAD_TASK = 'download'
+# Windows fetched with each getInfo by iter_time_series_calculation
+DEFAULT_WINDOW_BATCH_SIZE = 12
+# Rows of each Parquet row group, see dynamic_world.sinks.ParquetSink
+DEFAULT_ROW_GROUP_SIZE = 1000
+# HTTP service, see dynamic_world.service
+DEFAULT_SERVICE_HOST = '127.0.0.1'
+DEFAULT_SERVICE_PORT = 8080
+DEFAULT_QUEUE_SIZE = 32
+DEFAULT_LRU_SIZE = 1024
+RETRY_AFTER_SECONDS = 1
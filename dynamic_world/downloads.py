@@ -1,18 +1,59 @@
 # Dependencies
+import hashlib
+import json
 import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Callable, List, NamedTuple, Optional, Tuple
 
-import ee
-import geemap
+import rasterio
+from rasterio.features import bounds
+from rasterio.merge import merge
 
+from dynamic_world.cache import ResultCache, is_past_window
+from dynamic_world.calculations import co2_factor_calculation
+from dynamic_world.composites import download_composite, forest_borders
 from dynamic_world.configurations import ForestConfig
-from dynamic_world.constants import SCALE
+from dynamic_world import metrics
+from dynamic_world.constants import (
+    BYTES_DOWNLOADED_COUNTER,
+    COG_CACHE_REDUCER,
+    COG_CONVERSION_STAGE,
+    DEFAULT_MAX_WORKERS,
+    DOWNLOAD_CRS,
+    DOWNLOAD_STAGE,
+    EE_ROUND_TRIPS_COUNTER,
+    LABEL_DTYPE,
+    LABEL_NODATA,
+    SCALE,
+)
 from dynamic_world.errors import DateBeforeError
-from dynamic_world.utils import get_logger, validate_dates
+from dynamic_world.rasters import convert_to_cog, local_pixel_counts
+from dynamic_world.utils import get_logger, lazy_import, validate_dates
+
+ee = lazy_import("ee")
+geemap = lazy_import("geemap")
+
+
+class ForestWindowReport(NamedTuple):
+    path: Path  # The COG file of the window
+    pixel_counts: "dict[str, int]"
+    co2: float
 
 
 def download_single_date_image(
-    start_date: str, end_date: str, forest: ForestConfig, destination_folder: Path
+    start_date: str,
+    end_date: str,
+    forest: ForestConfig,
+    destination_folder: Path,
+    cache: Optional[ResultCache] = None,
+    cog_options: Optional[dict] = None,
+    tile_size: Optional[float] = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    progress: Optional[Callable[[int, int, Path], None]] = None,
+    dtype: str = LABEL_DTYPE,
+    nodata: Optional[int] = LABEL_NODATA,
 ) -> str:
     """
     Downloads the image of a forest (representing the status at a specific date)
@@ -23,16 +64,28 @@ def download_single_date_image(
         forest: a ForestConfig instance
         destination_folder: the folder where the files are stored
             created if not exists
+        cache: a ResultCache, if a window that already ended was downloaded
+            before (and the file still exists) it is reused instead of
+            contacting Earth Engine
+        cog_options: COG creation options (compression, predictor,
+            overviews...), see dynamic_world.rasters.convert_to_cog
+        tile_size: if set, the forest is split into a grid of tiles of
+            tile_size x tile_size degrees which are downloaded concurrently
+            and mosaicked. Finished tiles are kept until the COG is created,
+            so retrying after a failure with the same tile_size, dtype and
+            nodata only downloads the missing ones
+        max_workers: maximum number of tiles downloaded at the same time
+        progress: called as progress(done, total, tile_path) every time
+            a tile is ready
+        dtype: data type of the downloaded labels, class ids 0-8 fit in uint8
+        nodata: value given to pixels without data (clouds, outside the
+            forest...), must not be a class id. If None pixels are left
+            masked and the nodata value is chosen by geemap
     Returns:
         a string containing the path to the newly created COG file
     """
     validate_dates([start_date, end_date])
 
-    ee_geojson = geemap.geojson_to_ee(forest.geojson_info)
-
-    # Defining the borders for DW map (must be defined as ee.Geometry)
-    borders = ee_geojson.geometry()
-
     # Can compare this way since both dates are in ISO notation
     if start_date >= end_date:
         raise DateBeforeError("end_date", "start_date")
@@ -44,17 +97,6 @@ def download_single_date_image(
             + f"{end_date} > {forest.start_date}"
         )
 
-    # Loading DW map and restrict it to dates and borders
-    dw = (
-        ee.ImageCollection("GOOGLE/DYNAMICWORLD/V1")
-        .filterDate(start_date, end_date)
-        .filterBounds(borders)
-    )  # Returns ee.ImageCollection
-
-    # Reducing using the mode (polling)
-    classification = dw.select("label")
-    dw_composite = classification.reduce(ee.Reducer.mode()).clip(borders)
-
     name = forest.name
     destination_folder.mkdir(parents=True, exist_ok=True)
     file_path = destination_folder / Path(
@@ -64,21 +106,258 @@ def download_single_date_image(
         name.replace(" ", "_") + "_" + start_date + "_" + end_date + ".cog" + ".tif"
     )
 
-    geemap.download_ee_image(
-        dw_composite, file_path, scale=SCALE, region=borders, crs="EPSG:4326"
-    )
+    # Past windows never change, so a previous download can be reused if it
+    # was created with the same options
+    cache_key = None
+    if cache is not None and is_past_window(end_date):
+        options_hash = hashlib.sha256(
+            json.dumps(cog_options or {}, sort_keys=True, default=str).encode()
+        ).hexdigest()
+        cache_key = ResultCache.key(
+            forest.geojson_info,
+            start_date,
+            end_date,
+            f"{COG_CACHE_REDUCER}.{dtype}.{nodata}.{options_hash}",
+        )
+        cached_path = cache.get(cache_key)
+        if cached_path is not None and Path(cached_path).is_file():
+            if Path(cached_path) != file_path_cog:
+                shutil.copyfile(cached_path, file_path_cog)
+            get_logger().info(f"Reusing cached COG file {cached_path}")
+            return file_path_cog
+
+    # Defining the borders for DW map (must be defined as ee.Geometry)
+    borders = forest_borders(forest)
+    dw_composite = download_composite(start_date, end_date, borders, dtype, nodata)
+
+    if tile_size is None:
+        _download_image(dw_composite, file_path, borders, dtype)
+    else:
+        # Tiles of a previous run can only be reused if they share the same
+        # grid and values (the dates are already part of the file name)
+        tiles_hash = hashlib.sha256(
+            json.dumps(
+                [forest.geojson_info, tile_size, dtype, nodata], sort_keys=True
+            ).encode()
+        ).hexdigest()[:12]
+        tiles_folder = destination_folder / f"{file_path.stem}_tiles_{tiles_hash}"
+        tile_paths = _download_tiles(
+            dw_composite,
+            forest.geojson_info,
+            tiles_folder,
+            tile_size,
+            max_workers,
+            progress,
+            dtype,
+            nodata,
+        )
+        # Mosaic, tiles share the same pixel grid so overlaps are identical
+        merge(tile_paths, nodata=nodata, dst_path=file_path)
 
     get_logger().info(f"Successfully created TIFF file {file_path}")
 
-    # Use GDAL command to create a COG from the TIFF file
-    os.system(
-        "gdal_translate "
-        + str(file_path)
-        + " "
-        + str(file_path_cog)
-        + " -of COG -co COMPRESS=LZW"
-    )
+    # Create the COG in-process and remove the intermediate TIFF file
+    try:
+        _set_nodata(file_path, nodata)
+        with metrics.timer(COG_CONVERSION_STAGE):
+            convert_to_cog(file_path, file_path_cog, cog_options)
+    finally:
+        file_path.unlink(missing_ok=True)
 
     get_logger().info(f"Successfully created COG file {file_path_cog}")
 
+    if tile_size is not None:
+        shutil.rmtree(tiles_folder)
+
+    if cache_key is not None:
+        cache.set(cache_key, str(file_path_cog))
+
     return file_path_cog
+
+
+def calculate_and_download(
+    start_date: str,
+    end_date: str,
+    forest: ForestConfig,
+    destination_folder: Path,
+    **download_options,
+) -> ForestWindowReport:
+    """
+    Downloads the image of a forest and calculates its pixel counts and CO2
+    from the downloaded file, so the composite is computed by Earth Engine
+    only once instead of once for single_date_calculation and once for
+    download_single_date_image.
+    Pixels whose center lies inside the forest are counted, as Earth Engine
+    does, see dynamic_world.rasters.local_pixel_counts
+    Args:
+        start_date: a string with format YYYY-mm-dd
+        end_date: a string with format YYYY-mm-dd, must be after start_date
+        forest: a ForestConfig instance
+        destination_folder: the folder where the files are stored
+            created if not exists
+        download_options: passed to download_single_date_image (cache,
+            tile_size, max_workers...)
+    Returns:
+        a ForestWindowReport with the COG path, pixel counts and CO2 tons
+    """
+    path = download_single_date_image(
+        start_date, end_date, forest, destination_folder, **download_options
+    )
+    pixel_counts = local_pixel_counts(path, forest)
+
+    return ForestWindowReport(
+        path, pixel_counts, co2_factor_calculation(pixel_counts, forest)
+    )
+
+
+def _download_tiles(
+    dw_composite: "ee.Image",
+    geojson_info: dict,
+    tiles_folder: Path,
+    tile_size: float,
+    max_workers: int,
+    progress: Optional[Callable[[int, int, Path], None]],
+    dtype: str,
+    nodata: Optional[int],
+) -> List[Path]:
+    """
+    Downloads dw_composite as a grid of tiles covering geojson_info,
+    tiles already present in tiles_folder are not downloaded again
+    Returns:
+        the paths of every tile of the grid
+    """
+    tiles_folder.mkdir(parents=True, exist_ok=True)
+    tiles = {
+        tiles_folder / f"tile_{row}_{col}.tif": tile_bounds
+        for row, col, tile_bounds in _tile_grid(geojson_info, tile_size)
+    }
+    pending = {path: tile for path, tile in tiles.items() if not path.is_file()}
+    done = len(tiles) - len(pending)
+
+    get_logger().info(
+        f"Downloading {len(pending)} of {len(tiles)} tiles into {tiles_folder}"
+    )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_download_tile, dw_composite, path, tile, dtype, nodata)
+            for path, tile in pending.items()
+        ]
+        for future in as_completed(futures):
+            try:
+                tile_path = future.result()
+            except Exception:
+                # Fail fast, finished tiles are kept for the next attempt
+                for pending_future in futures:
+                    pending_future.cancel()
+                raise
+            done += 1
+            get_logger().info(f"Tile {done}/{len(tiles)} ready: {tile_path}")
+            if progress is not None:
+                progress(done, len(tiles), tile_path)
+
+    return list(tiles.keys())
+
+
+def _download_tile(
+    dw_composite: "ee.Image",
+    tile_path: Path,
+    tile_bounds: Tuple[float, float, float, float],
+    dtype: str,
+    nodata: Optional[int],
+) -> Path:
+    """
+    Downloads a single tile, the file only appears once it is complete
+    """
+    partial_path = tile_path.with_suffix(".part.tif")
+    _download_image(
+        dw_composite,
+        partial_path,
+        ee.Geometry.Rectangle(list(tile_bounds), DOWNLOAD_CRS, False),
+        dtype,
+    )
+    _set_nodata(partial_path, nodata)
+    os.replace(partial_path, tile_path)
+
+    return tile_path
+
+
+def _download_image(
+    dw_composite: "ee.Image", file_path: Path, region: "ee.Geometry", dtype: str
+):
+    """
+    Downloads dw_composite over region into a GeoTIFF file
+    """
+    with metrics.timer(DOWNLOAD_STAGE):
+        geemap.download_ee_image(
+            dw_composite,
+            file_path,
+            scale=SCALE,
+            region=region,
+            crs=DOWNLOAD_CRS,
+            dtype=dtype,
+        )
+    metrics.increment(EE_ROUND_TRIPS_COUNTER)
+    if metrics.get_sink() is not None and Path(file_path).is_file():
+        metrics.increment(BYTES_DOWNLOADED_COUNTER, Path(file_path).stat().st_size)
+
+
+def _set_nodata(file_path: Path, nodata: Optional[int]):
+    """
+    Tags the nodata value of a downloaded file, geemap may tag a different
+    one (such as 0, which is a class id) even if no pixel is masked
+    """
+    with rasterio.open(file_path) as src:
+        if nodata is None or src.nodata == nodata:
+            return
+
+    with rasterio.open(file_path, "r+") as dst:
+        dst.nodata = nodata
+
+
+def _tile_grid(
+    geojson_info: dict, tile_size: float
+) -> List[Tuple[int, int, Tuple[float, float, float, float]]]:
+    """
+    Splits the bounding box of a geojson object into tiles of
+    tile_size x tile_size degrees, skipping those which do not touch
+    the bounding box of any feature
+    Returns:
+        a list of (row, col, (west, south, east, north)) tuples
+    """
+    if tile_size <= 0:
+        raise ValueError("tile_size must be a positive number of degrees")
+
+    features = geojson_info.get("features", [geojson_info])
+    feature_bounds = [bounds(feature) for feature in features]
+    west = min(b[0] for b in feature_bounds)
+    south = min(b[1] for b in feature_bounds)
+    east = max(b[2] for b in feature_bounds)
+    north = max(b[3] for b in feature_bounds)
+
+    grid = []
+    row, tile_north = 0, north
+    while tile_north > south:
+        col, tile_west = 0, west
+        while tile_west < east:
+            tile = (
+                tile_west,
+                max(tile_north - tile_size, south),
+                min(tile_west + tile_size, east),
+                tile_north,
+            )
+            if any(_overlaps(tile, other) for other in feature_bounds):
+                grid.append((row, col, tile))
+            col, tile_west = col + 1, tile_west + tile_size
+        row, tile_north = row + 1, tile_north - tile_size
+
+    return grid
+
+
+def _overlaps(bbox: tuple, other: tuple) -> bool:
+    return (
+        bbox[0] <= other[2]
+        and other[0] <= bbox[2]
+        and bbox[1] <= other[3]
+        and other[1] <= bbox[3]
+    )
@@ -22,3 +22,18 @@ class ForestNotFoundError(FileNotFoundError):
     def __init__(self, name : str):
         super().__init__(f"forest {name}"
                          " does not correspond with an existing directory")
+
+
+class DuplicateForestError(ValueError):
+    def __init__(self, name : str):
+        super().__init__(f"forest {name} is present more than once")
+
+
+class CogCreationError(RuntimeError):
+    def __init__(self, path : str, reason : str):
+        super().__init__(f"could not create COG file {path}: {reason}")
+
+
+class ServiceBusyError(RuntimeError):
+    def __init__(self, pending : int):
+        super().__init__(f"service is busy, {pending} requests are pending")
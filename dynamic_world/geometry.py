@@ -0,0 +1,155 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import geojson
+
+from dynamic_world import metrics
+from dynamic_world.constants import (
+    SCALE,
+    SIMPLIFIED_EE_SUFFIX,
+    SIMPLIFIED_GEOJSON_SUFFIX,
+)
+from dynamic_world.utils import get_logger, lazy_import
+
+ee = lazy_import("ee")
+geemap = lazy_import("geemap")
+
+
+class GeometryReport(NamedTuple):
+    vertices: int  # Vertices of the original geojson
+    simplified_vertices: int
+    area: float  # Square meters of the original geometry (overlaps dissolved)
+    simplified_area: float
+    tolerance: float  # Maximum error of the simplification in meters
+
+    @property
+    def area_change(self) -> float:
+        """
+        Relative area change introduced by the simplification
+        """
+        return (self.simplified_area - self.area) / self.area if self.area else 0.0
+
+
+class PreprocessedGeometry(NamedTuple):
+    geojson_path: Path  # Simplified geojson file
+    ee_geometry: str  # Serialized ee.Geometry, see ee.deserializer.fromJSON
+    report: GeometryReport
+
+
+def preprocess_geometry(
+    geojson_path: Path, tolerance: float = SCALE / 2
+) -> PreprocessedGeometry:
+    """
+    Dissolves the overlapping features of a geojson file and simplifies the
+    result so that it moves less than tolerance meters (half a pixel by
+    default), which keeps pixel counts within pixel resolution while
+    reducing the vertices sent with every Earth Engine request.
+    The simplification runs once in Earth Engine (which must be initialized)
+    and is cached next to the geojson file, both as a geojson file and as a
+    serialized ee.Geometry. The cache is reused while it is newer than the
+    geojson file and was built with the same tolerance.
+    Args:
+        geojson_path: path of the geojson file
+        tolerance: maximum error of the simplification in meters
+    Returns:
+        a PreprocessedGeometry with the simplified geojson path, its
+        serialized ee.Geometry and a report of the vertices and area change
+    """
+    simplified_path = geojson_path.with_name(
+        geojson_path.stem + SIMPLIFIED_GEOJSON_SUFFIX
+    )
+    serialized_path = geojson_path.with_name(geojson_path.stem + SIMPLIFIED_EE_SUFFIX)
+
+    cached = _load_cached(geojson_path, simplified_path, serialized_path, tolerance)
+    if cached is not None:
+        return cached
+
+    with open(geojson_path) as geojson_file:
+        geojson_info = geojson.load(geojson_file)
+
+    original = geemap.geojson_to_ee(geojson_info).geometry().dissolve(maxError=1)
+    simplified = original.simplify(maxError=tolerance)
+
+    # Single round-trip for the geometry and both areas
+    result = metrics.get_info(
+        ee.Dictionary(
+            {
+                "geometry": simplified,
+                "area": original.area(maxError=1),
+                "simplified_area": simplified.area(maxError=1),
+            }
+        )
+    )
+
+    report = GeometryReport(
+        vertices=count_vertices(geojson_info),
+        simplified_vertices=count_vertices(result["geometry"]),
+        area=result["area"],
+        simplified_area=result["simplified_area"],
+        tolerance=tolerance,
+    )
+    ee_geometry = ee.Geometry(result["geometry"], None, False).serialize()
+
+    _write_atomic(
+        simplified_path,
+        geojson.FeatureCollection([geojson.Feature(geometry=result["geometry"])]),
+    )
+    _write_atomic(
+        serialized_path,
+        {"ee_geometry": ee_geometry, "report": report._asdict()},
+    )
+
+    get_logger().info(
+        f"Simplified {geojson_path}: {report.vertices} -> "
+        + f"{report.simplified_vertices} vertices, area change "
+        + f"{report.area_change:.4%} (tolerance {tolerance}m)"
+    )
+
+    return PreprocessedGeometry(simplified_path, ee_geometry, report)
+
+
+def count_vertices(geojson_info: Any) -> int:
+    """
+    Counts the positions of a geojson object (FeatureCollection, Feature
+    or geometry)
+    """
+    return len(list(geojson.utils.coords(geojson_info)))
+
+
+def _load_cached(
+    geojson_path: Path, simplified_path: Path, serialized_path: Path, tolerance: float
+):
+    """
+    Returns the cached PreprocessedGeometry or None if it is missing or stale
+    """
+    if not (simplified_path.is_file() and serialized_path.is_file()):
+        return None
+
+    source_mtime = geojson_path.stat().st_mtime
+    if min(simplified_path.stat().st_mtime, serialized_path.stat().st_mtime) < (
+        source_mtime
+    ):
+        return None
+
+    with open(serialized_path) as serialized_file:
+        serialized = json.load(serialized_file)
+
+    report = GeometryReport(**serialized["report"])
+    if report.tolerance != tolerance:
+        return None
+
+    return PreprocessedGeometry(simplified_path, serialized["ee_geometry"], report)
+
+
+def _write_atomic(path: Path, content: Any):
+    """
+    Writes content as json, the file only appears once it is complete
+    """
+    with tempfile.NamedTemporaryFile(
+        "w", dir=path.parent, suffix=".tmp", delete=False
+    ) as tmpfile:
+        json.dump(content, tmpfile)
+    os.replace(tmpfile.name, path)
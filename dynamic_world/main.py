@@ -0,0 +1,99 @@
+from contextlib import ExitStack
+from pathlib import Path
+from typing import List, Optional
+
+import typer
+
+from dynamic_world import metrics
+from dynamic_world.batch import run_batch
+from dynamic_world.cache import ResultCache
+from dynamic_world.constants import (
+    DEFAULT_MAX_WORKERS,
+    DEFAULT_OUTPUT_DIR,
+    DEFAULT_PROYECTS_DIR,
+    DEFAULT_STEP_DAYS,
+    EE_ROUND_TRIPS_COUNTER,
+)
+from dynamic_world.sinks import open_sink
+from dynamic_world.utils import initialize_ee
+
+
+def main(
+    start_date: str = typer.Argument(..., help="First day, with format YYYY-mm-dd"),
+    end_date: str = typer.Argument(
+        ..., help="Day after the last one, with format YYYY-mm-dd"
+    ),
+    step: int = typer.Option(DEFAULT_STEP_DAYS, help="Length of each window in days"),
+    forests_dir: Path = typer.Option(
+        Path(DEFAULT_PROYECTS_DIR), help="Directory containing the forests"
+    ),
+    forest: Optional[List[str]] = typer.Option(
+        None, help="Forest directory to run (can be repeated), all by default"
+    ),
+    calculate: bool = typer.Option(True, help="Calculate pixel counts and CO2"),
+    download: bool = typer.Option(False, help="Download the COG of every window"),
+    output_dir: Path = typer.Option(
+        Path(DEFAULT_OUTPUT_DIR), help="Folder of the checkpoint and downloads"
+    ),
+    jobs: int = typer.Option(
+        DEFAULT_MAX_WORKERS, "--jobs", "-j", help="Jobs running at the same time"
+    ),
+    requests_per_second: Optional[float] = typer.Option(
+        None, help="Maximum average rate of jobs started"
+    ),
+    cache_dir: Optional[Path] = typer.Option(
+        None, help="Reuse the results of past windows stored in this folder"
+    ),
+    results: Optional[Path] = typer.Option(
+        None,
+        help="Also write the new pixel counts and CO2 to a .ndjson, .csv or .parquet",
+    ),
+):
+    """
+    Runs the calculations and/or downloads of every forest for each window of
+    STEP days between START_DATE and END_DATE. Results are appended to
+    OUTPUT_DIR/checkpoint.jsonl as soon as each job finishes, running the
+    same command again resumes an interrupted run.
+    """
+    initialize_ee()
+    cache = ResultCache(cache_dir) if cache_dir is not None else None
+
+    with ExitStack() as stack:
+        sink = stack.enter_context(metrics.use_sink(metrics.InMemorySink()))
+        try:
+            result_sink = (
+                stack.enter_context(open_sink(results)) if results is not None else None
+            )
+            summary = run_batch(
+                forests_dir,
+                start_date,
+                end_date,
+                step_days=step,
+                forests=forest or None,
+                calculate=calculate,
+                download=download,
+                output_dir=output_dir,
+                max_workers=jobs,
+                requests_per_second=requests_per_second,
+                cache=cache,
+                sink=result_sink,
+            )
+        except (ValueError, FileNotFoundError, ImportError) as exc:
+            typer.echo(f"Error: {exc}", err=True)
+            raise typer.Exit(code=2)
+
+    typer.echo(
+        f"{summary.jobs} jobs: {summary.succeeded} succeeded, "
+        + f"{summary.failed} failed, {summary.skipped} already done"
+    )
+    typer.echo(
+        f"{summary.seconds:.1f}s, {summary.jobs_per_second:.2f} jobs/s, "
+        + f"{sink.counters[EE_ROUND_TRIPS_COUNTER]} Earth Engine round-trips, "
+        + f"{summary.retries} retries"
+    )
+    if summary.failed:
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
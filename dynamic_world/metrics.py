@@ -0,0 +1,235 @@
+import cProfile
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, ContextManager, Iterator, Optional, TextIO, Union
+
+from dynamic_world.constants import (
+    EE_ROUND_TRIPS_COUNTER,
+    GET_INFO_STAGE,
+    METRICS_PREFIX,
+)
+from dynamic_world.utils import get_logger
+
+
+class MetricsSink:
+    """
+    Receives the measurements of dynamic_world, subclasses decide what to
+    do with them. Methods are called from several threads at the same time
+    """
+
+    def record_timing(self, stage: str, seconds: float):
+        pass
+
+    def increment(self, counter: str, value: float = 1):
+        pass
+
+    def flush(self):
+        pass
+
+
+class InMemorySink(MetricsSink):
+    """
+    Keeps every measurement in memory, mostly useful for tests
+    """
+
+    def __init__(self):
+        self.timings = defaultdict(list)  # Stage: list of seconds
+        self.counters = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record_timing(self, stage: str, seconds: float):
+        with self._lock:
+            self.timings[stage].append(seconds)
+
+    def increment(self, counter: str, value: float = 1):
+        with self._lock:
+            self.counters[counter] += value
+
+
+class JsonLinesSink(MetricsSink):
+    """
+    Writes every measurement as a json object in its own line, for example
+    {"type": "timing", "name": "get_info", "value": 1.2, "time": 1660000000.0}
+    """
+
+    def __init__(self, destination: Union[Path, TextIO]):
+        """
+        Args:
+            destination: path of the file (lines are appended) or an open
+                text stream
+        """
+        if isinstance(destination, (str, Path)):
+            self._stream = open(destination, "a")
+            self._owned = True
+        else:
+            self._stream = destination
+            self._owned = False
+        self._lock = threading.Lock()
+
+    def record_timing(self, stage: str, seconds: float):
+        self._write("timing", stage, seconds)
+
+    def increment(self, counter: str, value: float = 1):
+        self._write("counter", counter, value)
+
+    def flush(self):
+        with self._lock:
+            self._stream.flush()
+
+    def close(self):
+        self.flush()
+        if self._owned:
+            self._stream.close()
+
+    def _write(self, kind: str, name: str, value: float):
+        line = json.dumps(
+            {"type": kind, "name": name, "value": value, "time": time.time()}
+        )
+        with self._lock:
+            self._stream.write(line + "\n")
+
+
+class PrometheusTextfileSink(InMemorySink):
+    """
+    Aggregates the measurements and writes them, on flush, in the Prometheus
+    text format for the node exporter textfile collector. Counters become
+    dynamic_world_<counter>_total and timings a summary named
+    dynamic_world_stage_seconds with a stage label
+    """
+
+    def __init__(self, path: Path):
+        super().__init__()
+        self.path = Path(path)
+
+    def flush(self):
+        with self._lock:
+            lines = [
+                f"# TYPE {METRICS_PREFIX}_stage_seconds summary",
+                *(
+                    f'{METRICS_PREFIX}_stage_seconds_{suffix}{{stage="{stage}"}} '
+                    + f"{value}"
+                    for stage, seconds in sorted(self.timings.items())
+                    for suffix, value in (
+                        ("sum", sum(seconds)),
+                        ("count", len(seconds)),
+                    )
+                ),
+            ]
+            for counter, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {METRICS_PREFIX}_{counter}_total counter")
+                lines.append(f"{METRICS_PREFIX}_{counter}_total {value}")
+
+        # The collector must never read a half written file
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.path.parent, suffix=".tmp", delete=False
+        ) as tmpfile:
+            tmpfile.write("\n".join(lines) + "\n")
+        os.replace(tmpfile.name, self.path)
+
+
+# None means metrics are disabled, which is checked before measuring anything
+_sink: Optional[MetricsSink] = None
+_DISABLED = nullcontext()
+
+
+def set_sink(sink: Optional[MetricsSink]):
+    """
+    Sends the measurements of the whole process to sink, None disables them
+    """
+    global _sink
+    _sink = sink
+
+
+def get_sink() -> Optional[MetricsSink]:
+    return _sink
+
+
+@contextmanager
+def use_sink(sink: MetricsSink) -> Iterator[MetricsSink]:
+    """
+    Sends the measurements to sink inside the with block, then flushes it
+    and restores the previous one
+    """
+    previous = _sink
+    set_sink(sink)
+    try:
+        yield sink
+    finally:
+        set_sink(previous)
+        sink.flush()
+
+
+def timer(stage: str) -> ContextManager:
+    """
+    Measures the wall time spent inside the with block as stage.
+    When metrics are disabled a shared no-op context is returned
+    """
+    if _sink is None:
+        return _DISABLED
+    return _timer(_sink, stage)
+
+
+@contextmanager
+def _timer(sink: MetricsSink, stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        sink.record_timing(stage, time.perf_counter() - start)
+
+
+def increment(counter: str, value: float = 1):
+    """
+    Adds value to counter, does nothing if metrics are disabled
+    """
+    if _sink is not None:
+        _sink.increment(counter, value)
+
+
+def get_info(ee_object: Any) -> Any:
+    """
+    Calls getInfo on ee_object, measuring it as an Earth Engine round-trip
+    """
+    if _sink is None:
+        return ee_object.getInfo()
+
+    with _timer(_sink, GET_INFO_STAGE):
+        result = ee_object.getInfo()
+    _sink.increment(EE_ROUND_TRIPS_COUNTER)
+    return result
+
+
+def profiled(name: str, directory: Optional[Path]) -> ContextManager:
+    """
+    Profiles the with block using cProfile, stats are dumped into
+    directory/<name>.prof (see pstats). Does nothing if directory is None
+    """
+    if directory is None:
+        return nullcontext()
+    return _profiled(Path(directory) / f"{name}.prof")
+
+
+@contextmanager
+def _profiled(path: Path) -> Iterator[None]:
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError as exc:
+        # Only one profiler can be active at a time in Python 3.12+
+        get_logger().warning(f"Could not profile {path.stem}: {exc}")
+        yield
+        return
+
+    try:
+        yield
+    finally:
+        profile.disable()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        profile.dump_stats(path)
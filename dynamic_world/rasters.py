@@ -0,0 +1,243 @@
+import os
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.features import bounds, geometry_mask
+from rasterio.warp import transform_geom
+from rasterio.windows import Window, from_bounds
+
+from dynamic_world.calculations import TransitionCalculation, transition_from_matrix
+from dynamic_world.configurations import ForestConfig
+from dynamic_world.constants import (
+    CLASS_LABELS_DICT,
+    DEFAULT_COG_OPTIONS,
+    DOWNLOAD_CRS,
+    NA_CLASS_ID,
+)
+from dynamic_world.errors import CogCreationError
+from dynamic_world.utils import format_pixel_counts
+
+# Class ids 0-8, every other value (nodata, NaN...) is counted as NA
+CLASS_IDS = [int(key) for key in CLASS_LABELS_DICT.keys() if key != NA_CLASS_ID]
+NA_INDEX = max(CLASS_IDS) + 1
+
+
+def local_pixel_counts(
+    cog_path: Path,
+    forest: ForestConfig,
+    geojson_info: Optional[dict] = None,
+    return_raw: bool = False,
+) -> "dict[str, int]":
+    """
+    Retrieves the pixel counts of a downloaded label raster
+    (see dynamic_world.downloads.download_single_date_image) without using
+    Earth Engine.
+    The raster is read block by block, only the blocks touching the area
+    are read, and pixels whose center lies inside the area are counted
+    (same criteria as Earth Engine reductions).
+    Nodata pixels inside the area are counted as NA.
+    Args:
+        cog_path: path of the label raster
+        forest: a ForestConfig object
+        geojson_info: a geojson object (FeatureCollection, Feature or
+            geometry) used instead of the forest's one, for example to analyse
+            a sub-area of the forest
+        return_raw: if True, return the histogram keyed by class ids 0-8 and
+            null, as in single_date_calculation
+    Returns:
+        a {string : int} dictionary following the same format as
+        dynamic_world.calculations.single_date_calculation
+    """
+    if geojson_info is None:
+        geojson_info = forest.geojson_info
+
+    counts = np.zeros(NA_INDEX + 1, dtype=np.int64)
+
+    with rasterio.open(cog_path) as src:
+        shapes = [
+            transform_geom(DOWNLOAD_CRS, src.crs, shape)
+            for shape in _geometries(geojson_info)
+        ]
+
+        area_window = _area_window(src, shapes)
+        if area_window is not None:
+            for _, window in src.block_windows(1):
+                if _intersects(window, area_window):
+                    counts += _window_counts(src, window, shapes)
+
+    raw_counts = {
+        str(class_id): int(counts[class_id])
+        for class_id in CLASS_IDS
+        if counts[class_id]
+    }
+    if counts[NA_INDEX]:
+        raw_counts[NA_CLASS_ID] = int(counts[NA_INDEX])
+
+    return raw_counts if return_raw else format_pixel_counts(raw_counts)
+
+
+def local_transition_calculation(
+    cog_path_a: Path,
+    cog_path_b: Path,
+    forest: ForestConfig,
+    geojson_info: Optional[dict] = None,
+) -> TransitionCalculation:
+    """
+    Local counterpart of dynamic_world.calculations.transition_calculation
+    over two label rasters of the same forest (downloaded with
+    download_single_date_image, so they share the same pixel grid).
+    Pixels are selected as in local_pixel_counts
+    Args:
+        cog_path_a: path of the label raster of the first window
+        cog_path_b: path of the label raster of the second window
+        forest: a ForestConfig object
+        geojson_info: a geojson object used instead of the forest's one
+    Returns:
+        a TransitionCalculation with the 10x10 transition matrix (9 classes
+        and NA) and the Co2 Tons. at both windows
+    """
+    if geojson_info is None:
+        geojson_info = forest.geojson_info
+
+    matrix = np.zeros((NA_INDEX + 1) ** 2, dtype=np.int64)
+
+    with rasterio.open(cog_path_a) as src_a, rasterio.open(cog_path_b) as src_b:
+        if (src_a.shape, src_a.transform, src_a.crs) != (
+            src_b.shape,
+            src_b.transform,
+            src_b.crs,
+        ):
+            raise ValueError(
+                f"{cog_path_a} and {cog_path_b} do not share the same pixel grid"
+            )
+
+        shapes = [
+            transform_geom(DOWNLOAD_CRS, src_a.crs, shape)
+            for shape in _geometries(geojson_info)
+        ]
+
+        area_window = _area_window(src_a, shapes)
+        if area_window is not None:
+            for _, window in src_a.block_windows(1):
+                if _intersects(window, area_window):
+                    inside = ~geometry_mask(
+                        shapes,
+                        out_shape=(int(window.height), int(window.width)),
+                        transform=src_a.window_transform(window),
+                    )
+                    transitions = _window_classes(src_a, window, inside) * (
+                        NA_INDEX + 1
+                    ) + _window_classes(src_b, window, inside)
+                    matrix += np.bincount(transitions, minlength=matrix.size)
+
+    return transition_from_matrix(matrix.reshape(NA_INDEX + 1, NA_INDEX + 1), forest)
+
+
+def convert_to_cog(
+    source_path: Path, cog_path: Path, cog_options: Optional[dict] = None
+) -> Path:
+    """
+    Converts a GeoTIFF into a Cloud Optimized Geotiff in-process using GDAL's
+    COG driver, which streams the source block by block.
+    The COG is written under a temporary name and renamed when complete, so
+    a partially written file is never visible at cog_path.
+    Args:
+        source_path: path of the raster to convert
+        cog_path: path of the COG file to create
+        cog_options: COG driver creation options (compress, predictor,
+            level, overviews, overview_resampling, blocksize...), updating
+            dynamic_world.constants.DEFAULT_COG_OPTIONS
+    Returns:
+        the path of the COG file
+    """
+    options = {**DEFAULT_COG_OPTIONS, **(cog_options or {})}
+    partial_path = cog_path.with_name(cog_path.name + ".part")
+
+    try:
+        with rasterio.open(source_path) as src:
+            rasterio.shutil.copy(src, partial_path, driver="COG", **options)
+        os.replace(partial_path, cog_path)
+    except (rasterio.errors.RasterioError, OSError) as exc:
+        if partial_path.exists():
+            partial_path.unlink()
+        raise CogCreationError(str(cog_path), str(exc)) from exc
+
+    return cog_path
+
+
+def _window_counts(src, window: Window, shapes: list) -> np.ndarray:
+    """
+    Counts the pixels of each class inside shapes for a window of src
+    """
+    inside = ~geometry_mask(
+        shapes,
+        out_shape=(int(window.height), int(window.width)),
+        transform=src.window_transform(window),
+    )
+
+    return np.bincount(_window_classes(src, window, inside), minlength=NA_INDEX + 1)
+
+
+def _window_classes(src, window: Window, inside: np.ndarray) -> np.ndarray:
+    """
+    Class ids of the pixels of a window of src selected by inside,
+    anything that is not a class id is NA_INDEX
+    """
+    labels = src.read(1, window=window, masked=True)
+    values = labels.data[inside]
+    valid = ~np.ma.getmaskarray(labels)[inside]
+
+    if np.issubdtype(values.dtype, np.floating):
+        valid &= np.isfinite(values)
+        values = np.where(valid, values, -1)
+    values = values.astype(np.int64)
+
+    # Anything that is not a class id goes to the NA bin
+    values[~valid | (values < 0) | (values >= NA_INDEX)] = NA_INDEX
+
+    return values
+
+
+def _area_window(src, shapes: list) -> Optional[Window]:
+    """
+    Window of src covering the bounding box of shapes (None if disjoint)
+    """
+    if not shapes:
+        return None
+
+    shape_bounds = [bounds(shape) for shape in shapes]
+    window = from_bounds(
+        min(b[0] for b in shape_bounds),
+        min(b[1] for b in shape_bounds),
+        max(b[2] for b in shape_bounds),
+        max(b[3] for b in shape_bounds),
+        transform=src.transform,
+    )
+    full = Window(0, 0, src.width, src.height)
+
+    if not _intersects(window, full):
+        return None
+    return window.intersection(full)
+
+
+def _intersects(window: Window, other: Window) -> bool:
+    return (
+        window.col_off < other.col_off + other.width
+        and other.col_off < window.col_off + window.width
+        and window.row_off < other.row_off + other.height
+        and other.row_off < window.row_off + window.height
+    )
+
+
+def _geometries(geojson_info: dict) -> list:
+    """
+    Extracts the geometries of a FeatureCollection, Feature or geometry
+    """
+    if geojson_info["type"] == "FeatureCollection":
+        return [feature["geometry"] for feature in geojson_info["features"]]
+    if geojson_info["type"] == "Feature":
+        return [geojson_info["geometry"]]
+    return [geojson_info]
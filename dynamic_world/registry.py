@@ -0,0 +1,278 @@
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+from dynamic_world.configurations import ForestConfig, read_config_data
+from dynamic_world.constants import (
+    DEFAULT_MAX_WORKERS,
+    DEFAULT_PROYECTS_DIR,
+    FOREST_CONFIG_FILENAME,
+    FOREST_MANIFEST_FILENAME,
+)
+from dynamic_world.errors import ForestNotFoundError
+from dynamic_world.utils import get_logger
+
+
+class ForestEntry(NamedTuple):
+    """
+    Validated contents of a forest configuration file, the geojson file is
+    only checked to exist (it is parsed by ForestRegistry.get)
+    """
+
+    name: str
+    geojson_path: str
+    co2_factor: "dict[str, float]"
+    start_date: str
+    config_mtime: float
+    geojson_mtime: float
+
+
+class ReloadResult(NamedTuple):
+    added: List[str]
+    changed: List[str]
+    removed: List[str]
+
+
+class ForestRegistry:
+    """
+    Registry of every forest directory inside a base directory, meant for
+    batch runners and long-running workers handling thousands of forests.
+    - Configuration files are read in parallel.
+    - Geojson files are only parsed when a forest is requested (get).
+    - A manifest with the modification times of every configuration and
+      geojson file is kept in the base directory, so unchanged forests are
+      not read again on the next start.
+    - reload only reads the directories that changed.
+    Forests are identified by their directory name (as in
+    dynamic_world.utils.validate_forest_names).
+    """
+
+    def __init__(
+        self,
+        base_directory: Path = Path(DEFAULT_PROYECTS_DIR),
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        manifest_path: Optional[Path] = None,
+    ):
+        """
+        Args:
+            base_directory: directory containing one directory per forest
+            max_workers: maximum number of configuration files read at once
+            manifest_path: where the manifest is stored, defaults to
+                base_directory / FOREST_MANIFEST_FILENAME
+        """
+        self.base_directory = Path(base_directory)
+        self.max_workers = max_workers
+        self.manifest_path = manifest_path or (
+            self.base_directory / FOREST_MANIFEST_FILENAME
+        )
+        self.errors: Dict[str, Exception] = {}  # Invalid forests
+        self._error_mtimes: Dict[str, float] = {}
+        self._entries: Dict[str, ForestEntry] = self._read_manifest()
+        self._configs: Dict[str, ForestConfig] = {}
+        self._lock = threading.Lock()
+
+        self.reload()
+
+    def reload(self) -> ReloadResult:
+        """
+        Reads the forest directories which were added or changed since
+        the last reload (or since the manifest was written) and forgets the
+        removed ones. Invalid forests are skipped and stored in errors
+        Returns:
+            a ReloadResult with the added, changed and removed forests
+        """
+        directories = {
+            entry.name: Path(entry.path)
+            for entry in os.scandir(self.base_directory)
+            if entry.is_dir()
+        }
+
+        with self._lock:
+            known = dict(self._entries)
+            invalid = dict(self._error_mtimes)
+
+        stale = [
+            name
+            for name, directory in directories.items()
+            if not _is_fresh(known.get(name), directory)
+            and invalid.get(name) != _directory_mtime(directory)
+        ]
+        removed = [name for name in known if name not in directories]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            read = list(
+                executor.map(lambda name: _read_entry(directories[name]), stale)
+            )
+        mtimes = [_directory_mtime(directories[name]) for name in stale]
+
+        result = ReloadResult(added=[], changed=[], removed=removed)
+        with self._lock:
+            for name in removed + [name for name in invalid if name not in directories]:
+                self._entries.pop(name, None)
+                self._configs.pop(name, None)
+                self.errors.pop(name, None)
+                self._error_mtimes.pop(name, None)
+
+            for name, entry, mtime in zip(stale, read, mtimes):
+                is_known = name in known or name in invalid
+                (result.changed if is_known else result.added).append(name)
+                self._configs.pop(name, None)
+                if isinstance(entry, Exception):
+                    self._entries.pop(name, None)
+                    self.errors[name] = entry
+                    self._error_mtimes[name] = mtime
+                    get_logger().error(f"Invalid forest {name}: {entry}")
+                else:
+                    self._entries[name] = entry
+                    self.errors.pop(name, None)
+                    self._error_mtimes.pop(name, None)
+
+            if stale or removed:
+                self._write_manifest()
+
+        return result
+
+    def names(self) -> List[str]:
+        """
+        Returns the names of the directories of every valid forest
+        """
+        with self._lock:
+            return sorted(self._entries)
+
+    def entry(self, name: str) -> ForestEntry:
+        """
+        Returns the configuration of a forest without parsing its geojson
+        """
+        with self._lock:
+            try:
+                return self._entries[name]
+            except KeyError:
+                raise ForestNotFoundError(name) from None
+
+    def get(self, name: str) -> ForestConfig:
+        """
+        Returns the ForestConfig of a forest, its geojson file is parsed the
+        first time it is requested
+        """
+        with self._lock:
+            config = self._configs.get(name)
+        if config is not None:
+            return config
+
+        entry = self.entry(name)
+        config = ForestConfig(
+            name=entry.name,
+            geojson_path=Path(entry.geojson_path),
+            co2_factor=entry.co2_factor,
+            start_date=entry.start_date,
+        )
+        with self._lock:
+            # Do not cache it if the forest changed in the meantime
+            if self._entries.get(name) == entry:
+                self._configs[name] = config
+
+        return config
+
+    def validate_forest_names(self, forests: List[str]):
+        """
+        Check forests correspond to valid forests of the registry
+        """
+        with self._lock:
+            for forest_name in forests:
+                if forest_name not in self._entries:
+                    raise ForestNotFoundError(forest_name)
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            return name in self._entries
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _read_manifest(self) -> Dict[str, ForestEntry]:
+        try:
+            with open(self.manifest_path) as manifest_file:
+                return {
+                    name: ForestEntry(**entry)
+                    for name, entry in json.load(manifest_file).items()
+                }
+        except (FileNotFoundError, json.JSONDecodeError, TypeError):
+            return {}
+
+    def _write_manifest(self):
+        """
+        Writes the manifest atomically, so concurrent workers never read a
+        partial one
+        """
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.manifest_path.parent, suffix=".tmp", delete=False
+        ) as tmpfile:
+            json.dump(
+                {name: entry._asdict() for name, entry in self._entries.items()},
+                tmpfile,
+            )
+        os.replace(tmpfile.name, self.manifest_path)
+
+
+def _read_entry(directory: Path):
+    """
+    Reads and validates the configuration file of a forest directory.
+    Returns the ForestEntry or the exception raised while reading it
+    """
+    try:
+        config_path = directory / FOREST_CONFIG_FILENAME
+        config_mtime = config_path.stat().st_mtime
+        config_data = read_config_data(directory)
+        geojson_path = directory / config_data["geojson"]
+
+        return ForestEntry(
+            name=config_data["name"],
+            geojson_path=str(geojson_path),
+            co2_factor=ForestConfig.co2_factor_must_contain(
+                {key: float(value) for key, value in config_data["co2_factor"].items()}
+            ),
+            start_date=ForestConfig.start_date_datetime_format(
+                config_data["start_date"]
+            ),
+            config_mtime=config_mtime,
+            geojson_mtime=geojson_path.stat().st_mtime,
+        )
+    except Exception as exc:
+        return exc
+
+
+def _is_fresh(entry: Optional[ForestEntry], directory: Path) -> bool:
+    """
+    Check if neither the configuration nor the geojson file of a forest
+    changed since entry was read
+    """
+    if entry is None:
+        return False
+    try:
+        return (
+            directory / FOREST_CONFIG_FILENAME
+        ).stat().st_mtime == entry.config_mtime and Path(
+            entry.geojson_path
+        ).stat().st_mtime == entry.geojson_mtime
+    except FileNotFoundError:
+        return False
+
+
+def _directory_mtime(directory: Path) -> float:
+    """
+    Latest modification time of a forest directory and its configuration
+    file, used to detect when an invalid forest may have been fixed
+    """
+    try:
+        config_mtime = (directory / FOREST_CONFIG_FILENAME).stat().st_mtime
+    except FileNotFoundError:
+        config_mtime = 0
+    return max(directory.stat().st_mtime, config_mtime)
@@ -0,0 +1,218 @@
+import math
+from statistics import NormalDist
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from dynamic_world import metrics
+from dynamic_world.calculations import co2_factor_weights
+from dynamic_world.composites import forest_borders, label_composite
+from dynamic_world.configurations import ForestConfig
+from dynamic_world.constants import (
+    AREA_PROPERTY,
+    DEFAULT_CONFIDENCE,
+    DEFAULT_SAMPLE_SIZE,
+    DOWNLOAD_CRS,
+    HISTOGRAM_PROPERTY,
+    LABEL_MODE_BAND,
+    METERS_PER_DEGREE,
+    NA_LABEL,
+    PIXEL_COUNT_COLUMNS,
+    SCALE,
+)
+from dynamic_world.errors import DateBeforeError
+from dynamic_world.utils import get_logger, lazy_import, validate_dates
+
+ee = lazy_import("ee")
+
+
+class PixelEstimate(NamedTuple):
+    sample_size: int  # Pixels actually sampled
+    total_pixels: float  # Pixels of the whole forest
+    proportions: "dict[str, float]"  # Estimated share of each label
+    pixel_counts: "dict[str, float]"  # Proportions scaled to the forest
+    pixel_count_intervals: "dict[str, Tuple[float, float]]"
+    co2: float  # Estimated Co2 Tons.
+    co2_interval: Tuple[float, float]
+    confidence: float  # Confidence level of the intervals
+
+
+def estimate_calculation(
+    start_date: str,
+    end_date: str,
+    forest: ForestConfig,
+    sample_size: Optional[int] = None,
+    target_error: Optional[float] = None,
+    confidence: float = DEFAULT_CONFIDENCE,
+    seed: int = 0,
+) -> PixelEstimate:
+    """
+    Estimates the pixel counts and CO2 of a forest from a random sample of
+    its pixels instead of reducing every pixel, which takes seconds
+    regardless of the size of the forest. The sample histogram and the area
+    of the forest (in pixels of the EPSG:4326 grid, like the exact
+    calculations) are fetched in a single round-trip.
+    Args:
+        start_date: a string with format YYYY-mm-dd
+        end_date: a string with format YYYY-mm-dd, must be after start_date
+        forest: a ForestConfig object
+        sample_size: number of pixels to sample (Earth Engine may return
+            slightly less), DEFAULT_SAMPLE_SIZE if neither this nor
+            target_error are given
+        target_error: alternatively, the largest error of the estimated
+            proportions (for example 0.01 for 1%) at the confidence level
+        confidence: confidence level of the intervals
+        seed: seed of the random sample
+    Returns:
+        a PixelEstimate (see estimate_from_sample)
+    """
+    validate_dates([start_date, end_date])
+
+    # Can compare this way since both dates are in ISO notation
+    if start_date >= end_date:
+        raise DateBeforeError("end_date", "start_date")
+
+    if sample_size is None:
+        sample_size = (
+            DEFAULT_SAMPLE_SIZE
+            if target_error is None
+            else sample_size_for_error(target_error, confidence)
+        )
+    if sample_size <= 0:
+        raise ValueError("sample_size must be a positive number")
+
+    # If end_date is before proyect's start_date raise a warning
+    if forest.start_date > end_date:
+        get_logger().warning(
+            "end_date is before proyect's start_date: "
+            + f"{end_date} > {forest.start_date}"
+        )
+
+    na_index = PIXEL_COUNT_COLUMNS.index(NA_LABEL)
+    borders = forest_borders(forest)
+
+    # Pixels without data are sampled as NA instead of being skipped, and
+    # windows without images are all NA as in the exact calculations
+    dw_composite = (
+        label_composite(start_date, end_date, borders, empty_label=na_index)
+        .unmask(na_index)
+        .clip(borders)
+    )
+    sample = dw_composite.sample(
+        region=borders,
+        scale=SCALE,
+        numPixels=sample_size,
+        seed=seed,
+        geometries=False,
+    )
+
+    # Exact counts use the EPSG:4326 grid, whose pixels are SCALE meters only
+    # at the equator: the forest size is its area in that grid, not in meters
+    pixel = SCALE / METERS_PER_DEGREE
+    result = metrics.get_info(
+        ee.Dictionary(
+            {
+                HISTOGRAM_PROPERTY: sample.aggregate_histogram(LABEL_MODE_BAND),
+                # maxError is always in meters, proj only sets the units of
+                # the result (square degrees)
+                AREA_PROPERTY: borders.area(SCALE / 10, DOWNLOAD_CRS),
+            }
+        )
+    )
+
+    sample_counts = np.zeros(len(PIXEL_COUNT_COLUMNS), dtype=np.int64)
+    for key, count in result[HISTOGRAM_PROPERTY].items():
+        sample_counts[int(float(key))] += count
+
+    return estimate_from_sample(
+        sample_counts, result[AREA_PROPERTY] / pixel**2, forest, confidence
+    )
+
+
+def estimate_from_sample(
+    sample_counts: np.ndarray,
+    total_pixels: float,
+    forest: ForestConfig,
+    confidence: float = DEFAULT_CONFIDENCE,
+) -> PixelEstimate:
+    """
+    Estimates the pixel counts and CO2 of a forest from the classes of a
+    simple random sample of its pixels.
+    Proportions use Wilson score intervals, CO2 is the forest size times the
+    mean weight of the sampled pixels with data (NA's distribute just like
+    the pixels we have information about, as in co2_factor_calculation)
+    Args:
+        sample_counts: sampled pixels of each label, in the order of
+            dynamic_world.constants.PIXEL_COUNT_COLUMNS
+        total_pixels: number of pixels of the forest
+        forest: a ForestConfig object (containing a co2_factor_info dictionary)
+        confidence: confidence level of the intervals
+    Returns:
+        a PixelEstimate, labels are those of PIXEL_COUNT_COLUMNS
+    """
+    sample_counts = np.asarray(sample_counts, dtype=np.float64)
+    sample_size = sample_counts.sum()
+    if sample_size <= 0:
+        raise ValueError("the sample does not contain any pixel")
+
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+
+    # Wilson score interval of every proportion
+    proportions = sample_counts / sample_size
+    center = (proportions + z**2 / (2 * sample_size)) / (1 + z**2 / sample_size)
+    margin = (
+        z
+        / (1 + z**2 / sample_size)
+        * np.sqrt(
+            proportions * (1 - proportions) / sample_size
+            + z**2 / (4 * sample_size**2)
+        )
+    )
+    low, high = np.clip(center - margin, 0, 1), np.clip(center + margin, 0, 1)
+
+    # CO2 = total pixels x mean weight of the pixels with data
+    weights = co2_factor_weights(forest)
+    na_column = PIXEL_COUNT_COLUMNS.index(NA_LABEL)
+    with_data = np.delete(sample_counts, na_column)
+    data_weights = np.delete(weights, na_column)
+    data_size = with_data.sum()
+    if data_size > 0:
+        mean = with_data @ data_weights / data_size
+        variance = (
+            with_data @ (data_weights - mean) ** 2 / (data_size - 1)
+            if data_size > 1
+            else 0.0
+        )
+        co2_margin = total_pixels * z * math.sqrt(variance / data_size)
+    else:
+        mean, co2_margin = 0.0, 0.0
+    co2 = total_pixels * mean
+
+    return PixelEstimate(
+        int(sample_size),
+        float(total_pixels),
+        dict(zip(PIXEL_COUNT_COLUMNS, proportions.tolist())),
+        dict(zip(PIXEL_COUNT_COLUMNS, (proportions * total_pixels).tolist())),
+        {
+            label: (float(lower * total_pixels), float(upper * total_pixels))
+            for label, lower, upper in zip(PIXEL_COUNT_COLUMNS, low, high)
+        },
+        float(co2),
+        (float(max(co2 - co2_margin, 0.0)), float(co2 + co2_margin)),
+        confidence,
+    )
+
+
+def sample_size_for_error(
+    target_error: float, confidence: float = DEFAULT_CONFIDENCE
+) -> int:
+    """
+    Number of pixels to sample so that no estimated proportion is off by
+    more than target_error at the confidence level (worst case, proportion
+    of 50%)
+    """
+    if not 0 < target_error < 1:
+        raise ValueError("target_error must be between 0 and 1")
+
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    return math.ceil(z**2 * 0.25 / target_error**2)
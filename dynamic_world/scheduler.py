@@ -0,0 +1,182 @@
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional
+
+from dynamic_world import metrics
+from dynamic_world.configurations import ForestConfig
+from dynamic_world.constants import (
+    DEFAULT_BACKOFF_SECONDS,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_MAX_WORKERS,
+    RETRIES_COUNTER,
+    THROTTLING_MESSAGES,
+)
+from dynamic_world.utils import get_logger
+
+
+class Job(NamedTuple):
+    """
+    A unit of work: task is called as task(start_date, end_date, forest),
+    which matches the signature of single_date_calculation. Use
+    functools.partial to fix extra arguments, for example
+    partial(download_single_date_image, destination_folder=folder)
+    """
+
+    forest: ForestConfig
+    start_date: str
+    end_date: str
+    task: Callable[[str, str, ForestConfig], Any]
+    name: Optional[str] = None  # Identifies the job to the caller, if needed
+
+
+class JobResult(NamedTuple):
+    job: Job
+    result: Any = None
+    error: Optional[BaseException] = None  # Set if the job failed
+    attempts: int = 1
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket, allows bursts of up to capacity calls and
+    rate calls per second on average
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        if rate <= 0:
+            raise ValueError("rate must be a positive number")
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a token is available and consumes it
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_throttling_error(error: BaseException) -> bool:
+    """
+    Check if an error was raised because Earth Engine is throttling us
+    (too many concurrent aggregations, HTTP 429, quota exceeded...)
+    """
+    message = str(error).lower()
+    return any(fragment in message for fragment in THROTTLING_MESSAGES)
+
+
+def run_jobs(
+    jobs: Iterable[Job],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    requests_per_second: Optional[float] = None,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+    profile_dir: Optional[Path] = None,
+) -> Iterator[JobResult]:
+    """
+    Runs jobs concurrently in a thread pool, since most of the time is spent
+    waiting for Earth Engine (getInfo, download_ee_image...) threads are enough.
+    Results are yielded as soon as each job finishes (not in submission order)
+    and jobs are consumed lazily, so a generator of jobs is run with constant
+    memory.
+    Throttling errors are retried with exponential backoff and jitter, any
+    other error is not retried and is returned inside its JobResult so the
+    rest of the jobs keep running.
+    Args:
+        jobs: iterable of Job, for example a generator
+        max_workers: maximum number of jobs running at the same time
+        requests_per_second: if set, maximum average rate at which jobs
+            (including retries) are started
+        max_retries: how many times a throttled job is retried before failing
+        backoff_seconds: base waiting time, doubled after every retry
+        profile_dir: if set, every job is profiled with cProfile and its
+            stats dumped into profile_dir (see dynamic_world.metrics.profiled)
+    Returns:
+        an iterator of JobResult
+    """
+    bucket = (
+        TokenBucket(requests_per_second, max_workers) if requests_per_second else None
+    )
+
+    jobs = iter(jobs)
+    pending = set()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            while True:
+                # Jobs are submitted lazily, a few more than running ones, so
+                # neither the jobs nor their results pile up in memory
+                for job in islice(jobs, max_workers * 2 - len(pending)):
+                    pending.add(
+                        executor.submit(
+                            _run_job,
+                            job,
+                            bucket,
+                            max_retries,
+                            backoff_seconds,
+                            profile_dir,
+                        )
+                    )
+                if not pending:
+                    break
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            # If the caller stops early (Ctrl+C...) jobs not started are dropped
+            for future in pending:
+                future.cancel()
+
+
+def _run_job(
+    job: Job,
+    bucket: Optional[TokenBucket],
+    max_retries: int,
+    backoff_seconds: float,
+    profile_dir: Optional[Path] = None,
+) -> JobResult:
+    """
+    Runs a single job, retrying it while Earth Engine is throttling
+    """
+    name = f"{job.forest.name}_{job.start_date}_{job.end_date}".replace(" ", "_")
+    attempt = 0
+    while True:
+        attempt += 1
+        if bucket is not None:
+            bucket.acquire()
+        try:
+            with metrics.profiled(name, profile_dir):
+                result = job.task(job.start_date, job.end_date, job.forest)
+            return JobResult(job, result=result, attempts=attempt)
+        except Exception as exc:
+            if not is_throttling_error(exc) or attempt > max_retries:
+                return JobResult(job, error=exc, attempts=attempt)
+
+            wait = backoff_seconds * 2 ** (attempt - 1)
+            wait += random.uniform(0, backoff_seconds)
+            get_logger().warning(
+                f"{job.forest.name} {job.start_date} {job.end_date} throttled, "
+                + f"retrying in {wait:.2f}s (attempt {attempt}): {exc}"
+            )
+            metrics.increment(RETRIES_COUNTER)
+            time.sleep(wait)
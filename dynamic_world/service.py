@@ -0,0 +1,360 @@
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import typer
+
+from dynamic_world.cache import ResultCache, is_past_window
+from dynamic_world.calculations import co2_factor_calculation, single_date_calculation
+from dynamic_world.constants import (
+    CALCULATION_TASK,
+    DEFAULT_LRU_SIZE,
+    DEFAULT_MAX_WORKERS,
+    DEFAULT_OUTPUT_DIR,
+    DEFAULT_PROYECTS_DIR,
+    DEFAULT_QUEUE_SIZE,
+    DEFAULT_SERVICE_HOST,
+    DEFAULT_SERVICE_PORT,
+    DOWNLOAD_TASK,
+    RETRY_AFTER_SECONDS,
+)
+from dynamic_world.downloads import download_single_date_image
+from dynamic_world.errors import (
+    DateBeforeError,
+    ForestNotFoundError,
+    ServiceBusyError,
+)
+from dynamic_world.registry import ForestRegistry
+from dynamic_world.session import get_session
+from dynamic_world.utils import get_logger, validate_dates
+
+# (task, forest directory, start_date, end_date)
+RequestKey = Tuple[str, str, str, str]
+
+
+class CalculationService:
+    """
+    Long-running calculation and download service, meant to sit behind an
+    HTTP server (see make_server) so clients do not pay the imports, Earth
+    Engine initialization and configuration loading on every request.
+    - Earth Engine is initialized and every forest configuration loaded once,
+      on start.
+    - Requests run in a bounded pool of workers, at most queue_size more wait
+      for a worker, any other request is rejected with ServiceBusyError.
+    - Identical requests in flight are coalesced: (task, forest, start_date,
+      end_date) is computed once however many clients ask for it.
+    - Results of windows which already ended (see
+      dynamic_world.cache.is_past_window) are kept in an in-memory LRU.
+    """
+
+    def __init__(
+        self,
+        base_directory: Path = Path(DEFAULT_PROYECTS_DIR),
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        lru_size: int = DEFAULT_LRU_SIZE,
+        download_directory: Path = Path(DEFAULT_OUTPUT_DIR),
+        cache: Optional[ResultCache] = None,
+    ):
+        """
+        Args:
+            base_directory: directory containing one directory per forest
+            max_workers: maximum number of requests computed at the same time
+            queue_size: maximum number of requests waiting for a worker
+            lru_size: maximum number of results kept in memory
+            download_directory: downloads are stored in
+                download_directory/<forest directory>
+            cache: a ResultCache passed to the calculations and downloads
+        """
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.lru_size = lru_size
+        self.download_directory = Path(download_directory)
+        self.cache = cache
+        self.session = get_session().ensure()
+        self.registry = ForestRegistry(base_directory, max_workers=max_workers)
+        for name in self.registry.names():
+            self.registry.get(name)
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._in_flight = {}  # RequestKey: Future
+        self._results = OrderedDict()  # RequestKey: result, least recent first
+        self._pending = 0  # Running or waiting for a worker
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "coalesced": 0, "lru_hits": 0, "rejected": 0}
+
+    def calculation(self, forest: str, start_date: str, end_date: str) -> dict:
+        """
+        Pixel counts (same format as single_date_calculation) and Co2 Tons.
+        of a forest directory between start_date and end_date
+        """
+        return self.submit(CALCULATION_TASK, forest, start_date, end_date).result()
+
+    def download(self, forest: str, start_date: str, end_date: str) -> dict:
+        """
+        Downloads the COG file of a forest directory between start_date and
+        end_date, returning its path
+        """
+        return self.submit(DOWNLOAD_TASK, forest, start_date, end_date).result()
+
+    def submit(self, task: str, forest: str, start_date: str, end_date: str) -> Future:
+        """
+        Validates a request and returns the Future of its result, shared with
+        any identical request in flight (or already completed if its result is
+        in the LRU)
+        """
+        validate_dates([start_date, end_date])
+        # Can compare this way since both dates are in ISO notation
+        if start_date >= end_date:
+            raise DateBeforeError("end_date", "start_date")
+        self.registry.entry(forest)  # Raises ForestNotFoundError
+        key = (task, forest, start_date, end_date)
+
+        with self._lock:
+            self.stats["requests"] += 1
+            if key in self._results:
+                self.stats["lru_hits"] += 1
+                self._results.move_to_end(key)
+                future = Future()
+                future.set_result(self._results[key])
+                return future
+
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                return future
+
+            if self._pending >= self.max_workers + self.queue_size:
+                self.stats["rejected"] += 1
+                raise ServiceBusyError(self._pending)
+            self._pending += 1
+            future = self._executor.submit(self._compute, key)
+            self._in_flight[key] = future
+
+        future.add_done_callback(partial(self._finish, key))
+        return future
+
+    def reload(self) -> dict:
+        """
+        Reloads the forest configurations which changed, forgetting their
+        results
+        """
+        result = self.registry.reload()
+        changed = set(result.changed + result.removed)
+        with self._lock:
+            for key in [key for key in self._results if key[1] in changed]:
+                del self._results[key]
+        for name in result.added + result.changed:
+            if name in self.registry:
+                self.registry.get(name)
+        return result._asdict()
+
+    def health(self) -> dict:
+        with self._lock:
+            return {
+                "status": "ok",
+                "earth_engine_initialized": self.session.initialized,
+                "forests": len(self.registry),
+                "pending": self._pending,
+                "in_flight": len(self._in_flight),
+                "cached": len(self._results),
+                **self.stats,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _compute(self, key: RequestKey) -> dict:
+        task, name, start_date, end_date = key
+        self.session.ensure()
+        forest = self.registry.get(name)
+
+        if task == DOWNLOAD_TASK:
+            path = download_single_date_image(
+                start_date,
+                end_date,
+                forest,
+                self.download_directory / name,
+                cache=self.cache,
+            )
+            return {"path": str(path)}
+
+        pixel_counts = single_date_calculation(
+            start_date, end_date, forest, cache=self.cache
+        )
+        return {
+            "pixel_counts": pixel_counts,
+            "co2": co2_factor_calculation(pixel_counts, forest),
+        }
+
+    def _finish(self, key: RequestKey, future: Future):
+        with self._lock:
+            self._pending -= 1
+            self._in_flight.pop(key, None)
+            # Windows which did not end yet may still change
+            if (
+                not future.cancelled()
+                and future.exception() is None
+                and is_past_window(key[3])
+                and self.lru_size > 0
+            ):
+                self._results[key] = future.result()
+                if len(self._results) > self.lru_size:
+                    self._results.popitem(last=False)
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API over a CalculationService:
+        GET /health
+        GET /forests
+        GET /calculation?forest=<directory>&start_date=<date>&end_date=<date>
+        GET /co2?forest=<directory>&start_date=<date>&end_date=<date>
+        GET /download?forest=<directory>&start_date=<date>&end_date=<date>
+        POST /reload
+    """
+
+    service: CalculationService  # Set by make_server
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parameters = {name: values[-1] for name, values in parse_qs(url.query).items()}
+
+        if url.path == "/health":
+            return self._reply(HTTPStatus.OK, self.service.health())
+        if url.path == "/forests":
+            return self._reply(
+                HTTPStatus.OK, {"forests": self.service.registry.names()}
+            )
+        if url.path not in ("/calculation", "/co2", "/download"):
+            return self._reply(HTTPStatus.NOT_FOUND, {"error": f"{url.path} not found"})
+
+        # Bad requests are told apart from failures of the computation, which
+        # may raise KeyError or ValueError too
+        try:
+            arguments = [
+                parameters[name] for name in ("forest", "start_date", "end_date")
+            ]
+            task = DOWNLOAD_TASK if url.path == "/download" else CALCULATION_TASK
+            future = self.service.submit(task, *arguments)
+        except KeyError as exc:
+            return self._reply(
+                HTTPStatus.BAD_REQUEST, {"error": f"missing parameter {exc}"}
+            )
+        except ForestNotFoundError as exc:
+            return self._reply(HTTPStatus.NOT_FOUND, {"error": str(exc)})
+        except ValueError as exc:
+            return self._reply(HTTPStatus.BAD_REQUEST, {"error": str(exc)})
+        except ServiceBusyError as exc:
+            return self._reply(
+                HTTPStatus.SERVICE_UNAVAILABLE,
+                {"error": str(exc)},
+                {"Retry-After": str(RETRY_AFTER_SECONDS)},
+            )
+
+        try:
+            result = future.result()
+        except Exception as exc:
+            get_logger().exception(f"{self.path} failed")
+            return self._reply(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(exc)})
+
+        if url.path == "/co2":
+            result = {"co2": result["co2"]}
+        forest, start_date, end_date = arguments
+        self._reply(
+            HTTPStatus.OK,
+            {
+                "forest": forest,
+                "start_date": start_date,
+                "end_date": end_date,
+                **result,
+            },
+        )
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/reload":
+            return self._reply(
+                HTTPStatus.NOT_FOUND, {"error": f"{self.path} not found"}
+            )
+        self._reply(HTTPStatus.OK, self.service.reload())
+
+    def log_message(self, format: str, *args):
+        get_logger().debug(f"{self.address_string()} {format % args}")
+
+    def _reply(self, status: HTTPStatus, body: dict, headers: Optional[dict] = None):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def make_server(
+    service: CalculationService,
+    host: str = DEFAULT_SERVICE_HOST,
+    port: int = DEFAULT_SERVICE_PORT,
+) -> ThreadingHTTPServer:
+    """
+    Creates the HTTP server of service (port 0 picks a free port),
+    call serve_forever to start it
+    """
+    handler = type("Handler", (ServiceRequestHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(
+    forests_dir: Path = typer.Option(
+        Path(DEFAULT_PROYECTS_DIR), help="Directory containing the forests"
+    ),
+    host: str = typer.Option(DEFAULT_SERVICE_HOST),
+    port: int = typer.Option(DEFAULT_SERVICE_PORT),
+    workers: int = typer.Option(
+        DEFAULT_MAX_WORKERS, help="Requests computed at the same time"
+    ),
+    queue_size: int = typer.Option(
+        DEFAULT_QUEUE_SIZE, help="Requests waiting for a worker before rejecting"
+    ),
+    lru_size: int = typer.Option(DEFAULT_LRU_SIZE, help="Results kept in memory"),
+    download_dir: Path = typer.Option(
+        Path(DEFAULT_OUTPUT_DIR), help="Folder of the downloads"
+    ),
+    cache_dir: Optional[Path] = typer.Option(
+        None, help="Reuse the results of past windows stored in this folder"
+    ),
+):
+    """
+    Serves the calculations and downloads of the forests over HTTP
+    """
+    service = CalculationService(
+        forests_dir,
+        max_workers=workers,
+        queue_size=queue_size,
+        lru_size=lru_size,
+        download_directory=download_dir,
+        cache=ResultCache(cache_dir) if cache_dir is not None else None,
+    )
+    server = make_server(service, host, port)
+    get_logger().info(f"Serving {len(service.registry)} forests on {host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    typer.run(main)
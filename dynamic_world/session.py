@@ -0,0 +1,118 @@
+import base64
+import json
+import os
+import threading
+import time
+from typing import Any, NamedTuple, Optional
+
+from dynamic_world import metrics
+from dynamic_world.constants import EE_INITIALIZE_STAGE, SERVICE_ACCOUNT_ENV
+from dynamic_world.utils import get_logger, lazy_import
+
+ee = lazy_import("ee")
+
+
+class HealthStatus(NamedTuple):
+    healthy: bool
+    seconds: float  # Round-trip time of the health check request
+    error: Optional[str] = None
+
+
+class EarthEngineSession:
+    """
+    Process-wide Earth Engine session. The service account is decoded and
+    Earth Engine initialized only once, later calls to ensure() return
+    immediately. Credentials are kept across threads and forked workers: a
+    child process re-runs ee.Initialize with the credentials it inherited
+    instead of decoding them again. Tokens are refreshed only once expired
+    """
+
+    def __init__(self, environment_variable: str = SERVICE_ACCOUNT_ENV):
+        self.environment_variable = environment_variable
+        self._lock = threading.Lock()
+        self._credentials = None
+        self._pid = None  # Process where Earth Engine was initialized
+        self.initializations = 0
+
+    @property
+    def initialized(self) -> bool:
+        return self._pid == os.getpid()
+
+    def ensure(self) -> "EarthEngineSession":
+        """
+        Initializes Earth Engine in this process if it was not already,
+        and refreshes the credentials if their token expired
+        """
+        if not self.initialized:
+            with self._lock:
+                if not self.initialized:
+                    self._initialize()
+        if getattr(self._credentials, "expired", False):
+            with self._lock:
+                if self._credentials.expired:
+                    self._refresh()
+        return self
+
+    def health_check(self) -> HealthStatus:
+        """
+        Makes a minimal request to Earth Engine to check that the session
+        is usable
+        Returns:
+            A HealthStatus, errors are reported instead of raised
+        """
+        start = time.perf_counter()
+        try:
+            self.ensure()
+            ee.Number(1).getInfo()
+        except Exception as error:
+            return HealthStatus(False, time.perf_counter() - start, str(error))
+        return HealthStatus(True, time.perf_counter() - start)
+
+    def reset(self):
+        """
+        Forgets credentials and initialization, the next ensure() starts over
+        """
+        with self._lock:
+            self._credentials = None
+            self._pid = None
+
+    def _initialize(self):
+        if self._credentials is None:
+            self._credentials = self._load_credentials()
+        with metrics.timer(EE_INITIALIZE_STAGE):
+            ee.Initialize(self._credentials)
+        self._pid = os.getpid()
+        self.initializations += 1
+        get_logger().debug(f"Earth Engine initialized in process {self._pid}")
+
+    def _load_credentials(self) -> Any:
+        # Decode base64 secret and load as dict to make sure is json compatible
+        service_account_dict = json.loads(
+            base64.b64decode(os.environ[self.environment_variable])
+        )
+        return ee.ServiceAccountCredentials(
+            service_account_dict["client_email"],
+            key_data=json.dumps(service_account_dict),
+        )
+
+    def _refresh(self):
+        from google.auth.transport.requests import Request
+
+        self._credentials.refresh(Request())
+        get_logger().debug("Earth Engine credentials refreshed")
+
+    def _after_fork(self):
+        # The parent lock may have been held by another thread while forking
+        self._lock = threading.Lock()
+
+
+_SESSION = EarthEngineSession()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_SESSION._after_fork)
+
+
+def get_session() -> EarthEngineSession:
+    """
+    Returns the process-wide EarthEngineSession
+    """
+    return _SESSION
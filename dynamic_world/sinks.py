@@ -0,0 +1,218 @@
+import csv
+import json
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Iterable, NamedTuple, TextIO, Union
+
+from dynamic_world.constants import DEFAULT_ROW_GROUP_SIZE, PIXEL_COUNT_COLUMNS
+
+# Columns of every row written by the sinks, one per label
+RESULT_COLUMNS = ["forest", "start_date", "end_date", *PIXEL_COUNT_COLUMNS, "co2"]
+
+
+class ForestWindowResult(NamedTuple):
+    forest: str  # Forest name
+    start_date: str
+    end_date: str
+    pixel_counts: "dict[str, int]"  # Same format as single_date_calculation
+    co2: float
+
+    def row(self) -> dict:
+        """
+        Flat version of the result, with a column per label (0 if missing),
+        see RESULT_COLUMNS
+        """
+        return {
+            "forest": self.forest,
+            "start_date": self.start_date,
+            "end_date": self.end_date,
+            **{label: self.pixel_counts.get(label, 0) for label in PIXEL_COUNT_COLUMNS},
+            "co2": self.co2,
+        }
+
+
+class ResultSink(ABC):
+    """
+    Writes results incrementally as they arrive, so memory does not grow
+    with the number of results and the ones already written survive a
+    failure. Use it as a context manager (or call close) so buffered results
+    are written when the run ends, even if it fails.
+    write may be called from several threads at the same time
+    """
+
+    @abstractmethod
+    def write(self, result: ForestWindowResult):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self) -> "ResultSink":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class NdjsonSink(ResultSink):
+    """
+    Writes every result as a json object in its own line (see
+    ForestWindowResult.row), flushed as soon as it is written
+    """
+
+    def __init__(self, destination: Union[Path, TextIO]):
+        """
+        Args:
+            destination: path of the file (lines are appended) or an open
+                text stream
+        """
+        if isinstance(destination, (str, Path)):
+            self._stream = open(destination, "a")
+            self._owned = True
+        else:
+            self._stream = destination
+            self._owned = False
+        self._lock = threading.Lock()
+
+    def write(self, result: ForestWindowResult):
+        line = json.dumps(result.row())
+        with self._lock:
+            self._stream.write(line + "\n")
+            self._stream.flush()
+
+    def close(self):
+        with self._lock:
+            if self._owned:
+                self._stream.close()
+            else:
+                self._stream.flush()
+
+
+class CsvSink(ResultSink):
+    """
+    Writes every result as a row of a CSV file with RESULT_COLUMNS, flushed
+    as soon as it is written. The header is only written to new files, so
+    runs can append to the same file
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        new_file = not self.path.exists() or self.path.stat().st_size == 0
+        self._file = open(self.path, "a", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=RESULT_COLUMNS)
+        if new_file:
+            self._writer.writeheader()
+            self._file.flush()
+        self._lock = threading.Lock()
+
+    def write(self, result: ForestWindowResult):
+        with self._lock:
+            self._writer.writerow(result.row())
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class ParquetSink(ResultSink):
+    """
+    Writes the results into a Parquet file with RESULT_COLUMNS, one row
+    group every row_group_size results (and the remaining ones on close),
+    so at most row_group_size results are kept in memory.
+    Requires pyarrow (pip install pyarrow). Parquet files are only readable
+    once closed: if the process is killed the file is lost, any exception
+    inside the with block still closes it with the rows written so far
+    """
+
+    def __init__(self, path: Path, row_group_size: int = DEFAULT_ROW_GROUP_SIZE):
+        """
+        Args:
+            path: path of the Parquet file, overwritten if it exists
+            row_group_size: results of each row group
+        """
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError(
+                "ParquetSink requires pyarrow, install it with pip install pyarrow"
+            ) from None
+        if row_group_size < 1:
+            raise ValueError("row_group_size must be a positive number of rows")
+
+        self._pyarrow = pyarrow
+        self.path = Path(path)
+        self.row_group_size = row_group_size
+        self._schema = pyarrow.schema(
+            [
+                ("forest", pyarrow.string()),
+                ("start_date", pyarrow.string()),
+                ("end_date", pyarrow.string()),
+                *[(label, pyarrow.int64()) for label in PIXEL_COUNT_COLUMNS],
+                ("co2", pyarrow.float64()),
+            ]
+        )
+        self._writer = pyarrow.parquet.ParquetWriter(self.path, self._schema)
+        self._rows = []
+        self._lock = threading.Lock()
+
+    def write(self, result: ForestWindowResult):
+        with self._lock:
+            self._rows.append(result.row())
+            if len(self._rows) >= self.row_group_size:
+                self._write_row_group()
+
+    def close(self):
+        with self._lock:
+            if self._rows:
+                self._write_row_group()
+            self._writer.close()
+
+    def _write_row_group(self):
+        self._writer.write_table(
+            self._pyarrow.Table.from_pylist(self._rows, schema=self._schema)
+        )
+        self._rows = []
+
+
+# Sink used for each file extension, see open_sink
+SINKS_BY_SUFFIX = {
+    ".ndjson": NdjsonSink,
+    ".jsonl": NdjsonSink,
+    ".csv": CsvSink,
+    ".parquet": ParquetSink,
+}
+
+
+def open_sink(path: Path) -> ResultSink:
+    """
+    Opens the sink matching the extension of path (.ndjson, .jsonl, .csv or
+    .parquet)
+    """
+    path = Path(path)
+    try:
+        sink_class = SINKS_BY_SUFFIX[path.suffix.lower()]
+    except KeyError:
+        raise ValueError(
+            f"{path.suffix} results are not supported, use one of "
+            + ", ".join(SINKS_BY_SUFFIX)
+        ) from None
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return sink_class(path)
+
+
+def write_results(results: Iterable[ForestWindowResult], sink: ResultSink) -> int:
+    """
+    Writes results into sink as they arrive, closing it at the end (or when
+    results raises)
+    Returns:
+        the number of results written
+    """
+    written = 0
+    with sink:
+        for result in results:
+            sink.write(result)
+            written += 1
+    return written
@@ -0,0 +1,191 @@
+import datetime
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional
+
+from dynamic_world.calculations import (
+    co2_factor_batch_calculation,
+    pixel_counts_matrix,
+    time_series_calculation,
+)
+from dynamic_world.configurations import ForestConfig
+from dynamic_world.constants import DEFAULT_WINDOW_BATCH_SIZE, PIXEL_COUNT_COLUMNS
+from dynamic_world.utils import date_windows, get_logger
+
+# One column per label, quoted since they are used as column names
+_COUNT_COLUMNS = ", ".join(f'"{label}"' for label in PIXEL_COUNT_COLUMNS)
+
+
+class WindowRecord(NamedTuple):
+    start_date: str
+    end_date: str
+    pixel_counts: "dict[str, int]"  # Same format as single_date_calculation
+    co2: float
+
+
+class TimeSeriesStore:
+    """
+    Local SQLite store of per-forest, per-window pixel counts and CO2 totals,
+    with one column per label. Windows already stored are never recomputed.
+    """
+
+    def __init__(self, path: Path):
+        """
+        Args:
+            path: path of the SQLite database, created if not exists
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        label_columns = ", ".join(
+            f'"{label}" INTEGER NOT NULL DEFAULT 0' for label in PIXEL_COUNT_COLUMNS
+        )
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS windows ("
+                "forest TEXT NOT NULL, start_date TEXT NOT NULL, "
+                f"end_date TEXT NOT NULL, {label_columns}, co2 REAL NOT NULL, "
+                "PRIMARY KEY (forest, start_date, end_date))"
+            )
+
+    def add(self, forest_name: str, records: List[WindowRecord]):
+        """
+        Stores (or replaces) the records of a forest
+        """
+        placeholders = ", ".join("?" * (len(PIXEL_COUNT_COLUMNS) + 4))
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO windows "
+                f"(forest, start_date, end_date, {_COUNT_COLUMNS}, co2) "
+                f"VALUES ({placeholders})",
+                [
+                    (
+                        forest_name,
+                        record.start_date,
+                        record.end_date,
+                        *[
+                            record.pixel_counts.get(label, 0)
+                            for label in PIXEL_COUNT_COLUMNS
+                        ],
+                        record.co2,
+                    )
+                    for record in records
+                ],
+            )
+
+    def last_window_end(self, forest_name: str) -> Optional[str]:
+        """
+        Returns the end_date of the last stored window of a forest
+        (None if there is none)
+        """
+        with self._connect() as connection:
+            (end_date,) = connection.execute(
+                "SELECT MAX(end_date) FROM windows WHERE forest = ?", (forest_name,)
+            ).fetchone()
+        return end_date
+
+    def history(self, forest_name: str) -> List[WindowRecord]:
+        """
+        Returns every stored window of a forest in chronological order.
+        Labels with no pixels are not present in pixel_counts
+        """
+        with self._connect() as connection:
+            rows = connection.execute(
+                f"SELECT start_date, end_date, {_COUNT_COLUMNS}, co2 FROM windows "
+                "WHERE forest = ? ORDER BY start_date, end_date",
+                (forest_name,),
+            ).fetchall()
+
+        return [
+            WindowRecord(
+                start_date=row[0],
+                end_date=row[1],
+                pixel_counts={
+                    label: count
+                    for label, count in zip(PIXEL_COUNT_COLUMNS, row[2:-1])
+                    if count
+                },
+                co2=row[-1],
+            )
+            for row in rows
+        ]
+
+    def update(
+        self,
+        forests: List[ForestConfig],
+        step_days: int,
+        until: Optional[str] = None,
+        batch_size: int = DEFAULT_WINDOW_BATCH_SIZE,
+    ) -> "dict[str, int]":
+        """
+        Computes and stores the windows of each forest which are missing,
+        starting at the end of the last stored window (or the forest's
+        start_date) until the last complete window before until.
+        The missing windows of a forest are computed batch_size at a time
+        (one time_series_calculation each) and every batch is stored as soon
+        as it is fetched, so an interrupted backfill keeps the windows it
+        already finished.
+        Args:
+            forests: list of ForestConfig objects
+            step_days: length of each window in days
+            until: a string with format YYYY-mm-dd, defaults to today
+            batch_size: windows fetched with each Earth Engine round-trip
+        Returns:
+            a {forest name : number of new windows} dictionary
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be a positive number of windows")
+        if until is None:
+            until = datetime.date.today().isoformat()
+
+        new_windows = {}
+        for forest in forests:
+            start_date = self.last_window_end(forest.name) or forest.start_date
+            windows = []
+            if start_date < until:
+                windows = date_windows(start_date, until, step_days)
+                # The last window is incomplete if it is shorter than step_days
+                if _window_days(windows[-1]) < step_days:
+                    windows.pop()
+
+            for first in range(0, len(windows), batch_size):
+                series = time_series_calculation(
+                    forest, windows[first : first + batch_size]
+                )
+                co2 = co2_factor_batch_calculation(
+                    pixel_counts_matrix(series.values()), forest
+                )
+                self.add(
+                    forest.name,
+                    [
+                        WindowRecord(start, end, counts, float(window_co2))
+                        for ((start, end), counts), window_co2 in zip(
+                            series.items(), co2
+                        )
+                    ],
+                )
+
+            get_logger().info(f"{forest.name}: {len(windows)} new windows stored")
+            new_windows[forest.name] = len(windows)
+
+        return new_windows
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """
+        Opens a connection which commits on success and is always closed
+        """
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+
+def _window_days(window: "tuple[str, str]") -> int:
+    start_date, end_date = window
+    return (
+        datetime.date.fromisoformat(end_date) - datetime.date.fromisoformat(start_date)
+    ).days
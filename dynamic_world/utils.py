@@ -1,38 +1,59 @@
-import base64
 import datetime
-import json
+import importlib
 import logging
 import os
-import tempfile
 from pathlib import Path
-from typing import List
+from types import ModuleType
+from typing import Any, List, Tuple
 
-import ee
+from dynamic_world.constants import CLASS_LABELS_DICT, LOGGER_NAME
+from dynamic_world.errors import (
+    DateBadFormatError,
+    DateBeforeError,
+    ForestNotFoundError,
+)
 
-from dynamic_world.constants import LOGGER_NAME
-from dynamic_world.errors import DateBadFormatError, ForestNotFoundError
 
+class LazyModule:
+    """
+    Stands for a module which is only imported when one of its attributes
+    is used. Earth Engine and geemap take seconds to import (geemap pulls
+    ipyleaflet, folium...), so code paths that never reach Earth Engine
+    (configurations, CO2 calculations...) should not pay for them
+    """
 
-def initialize_ee():
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, attribute: str) -> Any:
+        return getattr(self._load(), attribute)
+
+    def _load(self) -> ModuleType:
+        # Modules are cached by Python after the first import
+        return importlib.import_module(self._name)
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self._name}>"
+
+
+def lazy_import(name: str) -> LazyModule:
     """
-    Initializes Earth Engine service using an encrypted
-    GEE service account
+    Returns a LazyModule for name, imported on first attribute access
+    Args:
+        name: the name of the module, for example 'ee'
     """
+    return LazyModule(name)
 
-    with tempfile.NamedTemporaryFile(suffix=".json", mode="w") as tmpfile:
 
-        # Decode base64 secret and load as dict to make sure is json compatible
-        service_account_dict = json.loads(
-            base64.b64decode(os.environ["SERVICE_ACCOUNT"])
-        )
-        with open(tmpfile.name, "w") as file:
-            json.dump(service_account_dict, file)
+def initialize_ee():
+    """
+    Initializes Earth Engine service using an encrypted
+    GEE service account. Only the first call in each process
+    initializes, see dynamic_world.session.EarthEngineSession
+    """
+    from dynamic_world.session import get_session
 
-        credentials = ee.ServiceAccountCredentials(
-            service_account_dict["client_email"],
-            tmpfile.name,
-        )
-    ee.Initialize(credentials)
+    get_session().ensure()
 
 
 def validate_forest_names(forests: List[str], base_directory: str):
@@ -42,7 +63,14 @@ def validate_forest_names(forests: List[str], base_directory: str):
         forests: list of strings containing forests names,
         they should correspond to an existing directory
     """
+    # A single directory listing instead of checking each forest separately
+    existing = (
+        set(os.listdir(base_directory)) if os.path.isdir(base_directory) else set()
+    )
+
     for forest_name in forests:
+        if forest_name in existing:
+            continue
         forest_path = Path(os.path.join(base_directory, forest_name))
         if not forest_path.exists():
             raise ForestNotFoundError(forest_name)
@@ -61,6 +89,50 @@ def validate_dates(dates: List[str]):
             raise DateBadFormatError() from exc
 
 
+def date_windows(
+    start_date: str, end_date: str, step_days: int
+) -> List[Tuple[str, str]]:
+    """
+    Splits the interval between start_date and end_date into consecutive
+    windows of step_days days (the last one may be shorter)
+    Args:
+        start_date: a string with format YYYY-mm-dd
+        end_date: a string with format YYYY-mm-dd, must be after start_date
+        step_days: length of each window in days
+    Returns:
+        a list of (start_date, end_date) tuples in chronological order
+    """
+    validate_dates([start_date, end_date])
+
+    if start_date >= end_date:
+        raise DateBeforeError("end_date", "start_date")
+    if step_days < 1:
+        raise ValueError("step_days must be a positive number of days")
+
+    start = datetime.date.fromisoformat(start_date)
+    end = datetime.date.fromisoformat(end_date)
+    step = datetime.timedelta(days=step_days)
+
+    windows = []
+    while start < end:
+        window_end = min(start + step, end)
+        windows.append((start.isoformat(), window_end.isoformat()))
+        start = window_end
+
+    return windows
+
+
+def format_pixel_counts(counts: "dict[str, int]") -> "dict[str, int]":
+    """
+    Renames the keys of a frequency histogram using propper classLabels (not 0-8)
+    Args:
+        counts: a {class id : int} dictionary, as computed by Earth Engine
+    Returns:
+        a {class label : int} dictionary (see dynamic_world.constants)
+    """
+    return {CLASS_LABELS_DICT.get(key): value for key, value in counts.items()}
+
+
 def get_logger() -> logging.Logger:
     """
     If the logger is not set-up, configure it. Otherwise return it
@@ -0,0 +1,179 @@
+import json
+
+import pytest
+
+from dynamic_world.batch import RunCheckpoint, iter_calculations, run_batch
+from dynamic_world.errors import ForestNotFoundError
+from dynamic_world.sinks import open_sink
+from benchmarks.fake_ee import FakeBackend, synthetic_forests
+
+
+@pytest.fixture
+def forests_dir(tmp_path):
+    synthetic_forests(tmp_path / "forests", 2, size_degrees=0.01)
+    return tmp_path / "forests"
+
+
+def checkpoint_lines(output_dir):
+    with open(output_dir / "checkpoint.jsonl") as checkpoint_file:
+        return [json.loads(line) for line in checkpoint_file]
+
+
+class TestRunBatch:
+    class TestHappyPaths:
+        def test_calculations(self, forests_dir, tmp_path):
+            output_dir = tmp_path / "output"
+
+            with FakeBackend().install() as backend:
+                summary = run_batch(forests_dir, '2022-01-01', '2022-04-01',
+                                    step_days=30, output_dir=output_dir)
+
+            assert (summary.jobs, summary.succeeded, summary.failed) == (6, 6, 0)
+            assert backend.round_trips == 6
+            entries = checkpoint_lines(output_dir)
+            assert {(entry["forest"], entry["start_date"])
+                    for entry in entries} == {
+                (forest, start) for forest in ("Forest0", "Forest1")
+                for start in ('2022-01-01', '2022-01-31', '2022-03-02')}
+            assert all(entry["co2"] > 0 and entry["tasks"] == ["calculation"]
+                       for entry in entries)
+
+        def test_results_sink(self, forests_dir, tmp_path):
+            path = tmp_path / "results.csv"
+
+            with FakeBackend().install(), open_sink(path) as sink:
+                run_batch(forests_dir, '2022-01-01', '2022-04-01',
+                          step_days=30, output_dir=tmp_path / "output",
+                          sink=sink)
+
+            rows = path.read_text().splitlines()
+            assert len(rows) == 7
+            assert rows[0].startswith("forest,start_date,end_date,water")
+
+        def test_resumes_interrupted_run(self, forests_dir, tmp_path):
+            output_dir = tmp_path / "output"
+            seen = []
+
+            def interrupt(entry):
+                seen.append(entry)
+                if len(seen) == 2:
+                    raise KeyboardInterrupt
+
+            with FakeBackend(latency=0.01).install():
+                with pytest.raises(KeyboardInterrupt):
+                    run_batch(forests_dir, '2022-01-01', '2022-04-01',
+                              step_days=30, output_dir=output_dir,
+                              max_workers=1, progress=interrupt)
+                with FakeBackend().install() as backend:
+                    summary = run_batch(forests_dir, '2022-01-01',
+                                        '2022-04-01', step_days=30,
+                                        output_dir=output_dir)
+
+            assert summary.skipped == 2
+            assert summary.succeeded == 4
+            assert backend.round_trips == 4
+            assert len(checkpoint_lines(output_dir)) == 6
+
+        def test_downloads(self, forests_dir, tmp_path):
+            output_dir = tmp_path / "output"
+
+            with FakeBackend().install():
+                summary = run_batch(forests_dir, '2022-01-01', '2022-02-01',
+                                    step_days=31, forests=["Forest1"],
+                                    download=True, output_dir=output_dir)
+                # Calculations were done from the downloaded files
+                again = run_batch(forests_dir, '2022-01-01', '2022-02-01',
+                                  step_days=31, forests=["Forest1"],
+                                  output_dir=output_dir)
+
+            entry, = checkpoint_lines(output_dir)
+            assert summary.succeeded == 1 and again.skipped == 1
+            assert entry["tasks"] == ["calculation", "download"]
+            assert (output_dir / "Forest1" / entry["path"].split("/")[-1]
+                    ).exists()
+            assert sum(entry["pixel_counts"].values()) > 0
+
+    class TestUnhappyPaths:
+        def test_failed_jobs_are_retried_on_resume(self, forests_dir,
+                                                   tmp_path):
+            output_dir = tmp_path / "output"
+
+            with FakeBackend(failure_rate=1).install():
+                failed = run_batch(forests_dir, '2022-01-01', '2022-02-01',
+                                   step_days=31, output_dir=output_dir)
+            with FakeBackend().install():
+                resumed = run_batch(forests_dir, '2022-01-01', '2022-02-01',
+                                    step_days=31, output_dir=output_dir)
+
+            assert (failed.failed, failed.succeeded) == (2, 0)
+            assert (resumed.skipped, resumed.succeeded) == (0, 2)
+            assert [("error" in entry) for entry in checkpoint_lines(
+                output_dir)] == [True, True, False, False]
+
+        def test_broken_forest_does_not_abort_the_batch(self, forests_dir,
+                                                        tmp_path):
+            output_dir = tmp_path / "output"
+            (forests_dir / "Forest0" / "forest.geojson").write_text("{")
+
+            with FakeBackend().install():
+                summary = run_batch(forests_dir, '2022-01-01', '2022-04-01',
+                                    step_days=30, output_dir=output_dir)
+
+            assert (summary.succeeded, summary.failed) == (3, 3)
+            entries = checkpoint_lines(output_dir)
+            assert {entry["forest"] for entry in entries
+                    if "error" in entry} == {"Forest0"}
+            assert {entry["forest"] for entry in entries
+                    if "error" not in entry} == {"Forest1"}
+
+        def test_unknown_forest(self, forests_dir, tmp_path):
+            with pytest.raises(ForestNotFoundError):
+                run_batch(forests_dir, '2022-01-01', '2022-02-01',
+                          forests=["Unknown"], output_dir=tmp_path)
+
+        def test_nothing_to_do(self, forests_dir, tmp_path):
+            with pytest.raises(ValueError):
+                run_batch(forests_dir, '2022-01-01', '2022-02-01',
+                          calculate=False, output_dir=tmp_path)
+
+        def test_truncated_checkpoint(self, tmp_path):
+            path = tmp_path / "checkpoint.jsonl"
+            path.write_text(
+                json.dumps({"forest": "Sample", "start_date": "2022-01-01",
+                            "end_date": "2022-02-01",
+                            "tasks": ["calculation"]})
+                + '\n{"forest": "Sample", "start_da')
+
+            checkpoint = RunCheckpoint(path)
+
+            assert checkpoint.is_done("Sample", "2022-01-01", "2022-02-01",
+                                      ["calculation"])
+            assert not checkpoint.is_done("Sample", "2022-01-01",
+                                          "2022-02-01",
+                                          ["calculation", "download"])
+
+
+class TestIterCalculations:
+    class TestHappyPaths:
+        def test_iter_calculations(self, tmp_path):
+            forests = synthetic_forests(tmp_path, 2, size_degrees=0.01)
+            windows = [('2022-01-01', '2022-02-01'),
+                       ('2022-02-01', '2022-03-01')]
+
+            with FakeBackend().install():
+                results = list(iter_calculations(iter(forests), windows))
+
+            assert sorted((result.forest, result.start_date)
+                          for result in results) == [
+                ("Forest 0", '2022-01-01'), ("Forest 0", '2022-02-01'),
+                ("Forest 1", '2022-01-01'), ("Forest 1", '2022-02-01')]
+            assert all(result.co2 > 0 for result in results)
+
+    class TestUnhappyPaths:
+        def test_iter_calculations_raises(self, tmp_path):
+            forests = synthetic_forests(tmp_path, 2, size_degrees=0.01)
+
+            with FakeBackend(failure_rate=1).install():
+                with pytest.raises(Exception, match="Internal error"):
+                    list(iter_calculations(forests,
+                                           [('2022-01-01', '2022-02-01')]))
@@ -0,0 +1,128 @@
+import json
+
+import pytest
+
+from benchmarks import run as benchmarks_run
+from dynamic_world.calculations import (multi_forest_calculation,
+                                        single_date_calculation)
+from dynamic_world.downloads import download_single_date_image
+from dynamic_world.rasters import local_pixel_counts
+from dynamic_world.scheduler import Job, run_jobs
+from benchmarks.fake_ee import FakeBackend, synthetic_forests
+
+
+@pytest.fixture
+def forests(tmp_path):
+    return synthetic_forests(tmp_path / "forests", 3, size_degrees=0.01)
+
+
+class TestFakeBackend:
+    class TestHappyPaths:
+        def test_matches_local_pixel_counts(self, forests, tmp_path):
+            backend = FakeBackend()
+
+            with backend.install():
+                raw_counts = single_date_calculation(
+                    '2022-06-04', '2022-07-04', forests[0], return_raw=True)
+                partitioned = single_date_calculation(
+                    '2022-06-04', '2022-07-04', forests[0], return_raw=True,
+                    partition=True, max_region_pixels=3000)
+                cog_path = download_single_date_image(
+                    '2022-06-04', '2022-07-04', forests[0], tmp_path,
+                    tile_size=0.004)
+
+            assert local_pixel_counts(cog_path, forests[0],
+                                      return_raw=True) == raw_counts
+            assert partitioned == raw_counts
+            assert set(raw_counts) == {str(i) for i in range(9)} | {"null"}
+
+        def test_single_round_trip(self, forests):
+            backend = FakeBackend()
+
+            with backend.install():
+                counts = multi_forest_calculation('2022-06-04', '2022-07-04',
+                                                  forests)
+                assert backend.round_trips == 1
+                assert counts[forests[1].name] == single_date_calculation(
+                    '2022-06-04', '2022-07-04', forests[1])
+
+        def test_throttled_jobs_are_retried(self, forests):
+            backend = FakeBackend(latency=0.02, max_concurrent=1)
+            jobs = [Job(forest, '2022-06-04', '2022-07-04',
+                        single_date_calculation) for forest in forests]
+
+            with backend.install():
+                results = list(run_jobs(jobs, max_workers=3,
+                                        backoff_seconds=0.01, max_retries=20))
+
+            assert all(result.error is None for result in results)
+            assert backend.throttled > 0
+            assert sum(result.attempts - 1 for result in results) == (
+                backend.throttled)
+            assert backend.peak_concurrency == 1
+
+        def test_install_restores_modules(self, forests):
+            import dynamic_world.calculations as calculations
+            original = calculations.ee
+
+            with FakeBackend().install() as backend:
+                assert calculations.ee is backend.ee
+
+            assert calculations.ee is original
+
+    class TestUnhappyPaths:
+        def test_failure_injection(self, forests):
+            backend = FakeBackend(failure_rate=1,
+                                  failure_message="Internal error.")
+            jobs = [Job(forest, '2022-06-04', '2022-07-04',
+                        single_date_calculation) for forest in forests]
+
+            with backend.install():
+                results = list(run_jobs(jobs))
+
+            assert all(str(result.error) == "Internal error."
+                       for result in results)
+            assert backend.failures == len(forests)
+
+        def test_too_many_pixels_is_partitioned(self, forests):
+            backend = FakeBackend(max_pixels=5000)
+
+            with backend.install():
+                with pytest.raises(Exception, match="timed out"):
+                    single_date_calculation('2022-06-04', '2022-07-04',
+                                            forests[0])
+                counts = single_date_calculation(
+                    '2022-06-04', '2022-07-04', forests[0], partition=True)
+
+            assert sum(counts.values()) > 5000
+
+
+class TestBenchmarksRun:
+    class TestHappyPaths:
+        def test_quick_run(self, tmp_path):
+            output = tmp_path / "results.json"
+
+            status = benchmarks_run.main(
+                ["--quick", "--only", "bench_throughput", "bench_memory",
+                 "--output", str(output)])
+
+            results = json.loads(output.read_text())
+            assert status == 0
+            assert results["metadata"]["quick"]
+            throughput = results["benchmarks"]["bench_throughput"]
+            assert throughput["single_date"]["failed_jobs"] == 0
+            assert throughput["single_date"]["round_trips"] >= (
+                throughput["single_date"]["jobs"])
+            assert results["benchmarks"]["bench_memory"]["download"][
+                "peak_bytes"] > 0
+
+        def test_compare(self):
+            baseline = {"benchmarks": {"bench": {
+                "seconds": 1.0, "jobs_per_second": 10.0, "jobs": 5}}}
+            current = {"benchmarks": {"bench": {
+                "seconds": 1.1, "jobs_per_second": 5.0, "jobs": 50}}}
+
+            assert benchmarks_run.compare(current, baseline, 0.2) == [
+                "bench.jobs_per_second: 10 -> 5"]
+            assert benchmarks_run.compare(current, baseline, 0.01) == [
+                "bench.jobs_per_second: 10 -> 5", "bench.seconds: 1 -> 1.1"]
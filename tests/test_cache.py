@@ -0,0 +1,82 @@
+import os
+import time
+
+from dynamic_world.cache import ResultCache, is_past_window
+
+
+class TestResultCache:
+    class TestHappyPaths:
+        def test_cache_hit_and_miss(self, tmp_path):
+            cache = ResultCache(tmp_path)
+            key = ResultCache.key({"type": "Point"}, "2022-01-01", "2022-02-01",
+                                  "frequencyHistogram")
+
+            assert cache.get(key) is None
+            cache.set(key, {"1": 10})
+
+            assert cache.get(key) == {"1": 10}
+            assert cache.stats() == {"hits": 1, "misses": 1}
+
+        def test_cache_key_depends_on_inputs(self):
+            key = ResultCache.key({"type": "Point"}, "2022-01-01", "2022-02-01",
+                                  "frequencyHistogram")
+
+            assert key != ResultCache.key({"type": "Point"}, "2022-01-01",
+                                          "2022-02-02", "frequencyHistogram")
+            assert key != ResultCache.key({"type": "Polygon"}, "2022-01-01",
+                                          "2022-02-01", "frequencyHistogram")
+            assert key != ResultCache.key({"type": "Point"}, "2022-01-01",
+                                          "2022-02-01", "mode.cog")
+
+        def test_cache_evicts_least_recently_used(self, tmp_path):
+            cache = ResultCache(tmp_path, max_bytes=None)
+            keys = [ResultCache.key({}, "2022-01-01", f"2022-02-0{day}", "r")
+                    for day in range(1, 4)]
+            for age, key in enumerate(keys):
+                cache.set(key, {"1": 1})
+                # Oldest access first
+                path = tmp_path / key[:2] / f"{key}.json"
+                os.utime(path, (time.time() - 100 + age, time.time()))
+            cache.get(keys[0])  # keys[0] is now the most recently used
+            entry_size = (tmp_path / keys[0][:2] / f"{keys[0]}.json").stat().st_size
+
+            cache.max_bytes = 2 * entry_size
+            cache.evict()
+
+            assert cache.get(keys[0]) is not None
+            assert cache.get(keys[1]) is None
+            assert cache.get(keys[2]) is not None
+
+        def test_cache_only_scans_when_full(self, tmp_path, mocker):
+            cache = ResultCache(tmp_path, max_bytes=1_000_000)
+            scans = mocker.spy(cache, "_evict")
+            keys = [ResultCache.key({}, "2022-01-01", "2022-02-01", f"r{i}")
+                    for i in range(40)]
+            for key in keys[:10]:
+                cache.set(key, {"1": 1})
+            # Only the first write scans the directory
+            assert scans.call_count == 1
+
+            entry_size = (tmp_path / keys[0][:2] / f"{keys[0]}.json").stat().st_size
+            cache.max_bytes = 20 * entry_size
+            for key in keys[10:]:
+                cache.set(key, {"1": 1})
+
+            # Each scan frees room for a couple of writes
+            assert scans.call_count <= 1 + 30 // 2
+            assert len(list(tmp_path.glob("*/*.json"))) <= 20
+
+        def test_cache_expires_old_entries(self, tmp_path):
+            cache = ResultCache(tmp_path, max_age_days=1)
+            key = ResultCache.key({}, "2022-01-01", "2022-02-01", "r")
+            cache.set(key, {"1": 1})
+            path = tmp_path / key[:2] / f"{key}.json"
+            two_days_ago = time.time() - 2 * 24 * 3600
+            os.utime(path, (two_days_ago, two_days_ago))
+
+            assert cache.get(key) is None
+            assert not path.exists()
+
+        def test_is_past_window(self):
+            assert is_past_window("2022-01-01")
+            assert not is_past_window("2999-01-01")
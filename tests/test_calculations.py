@@ -1,9 +1,22 @@
+import json
+import shutil
+
+import numpy as np
 import pytest
 
-from dynamic_world.configurations import load_config
+from dynamic_world.configurations import ForestConfig, load_config
 from dynamic_world.calculations import (single_date_calculation,
-                                        co2_factor_calculation)
-from dynamic_world.utils import initialize_ee
+                                        co2_factor_calculation,
+                                        multi_forest_calculation,
+                                        time_series_calculation,
+                                        co2_factor_batch_calculation,
+                                        pixel_counts_matrix,
+                                        stands_calculation,
+                                        transition_calculation,
+                                        iter_time_series_calculation)
+from dynamic_world.cache import ResultCache
+from dynamic_world.utils import date_windows, initialize_ee
+from benchmarks.fake_ee import PIXEL, FakeBackend, Grid, synthetic_forests
 
 # TODO gives warnings, but I'm pretty sure that it's due to 3rd party libaries,
 # maybe supress them?
@@ -48,7 +61,114 @@ class TestSingleDateCalculation:
                     key in expected_keys
                 )
 
+        def test_single_date_calculation_single_round_trip(self, directory,
+                                                           mocker):
+            ee = mocker.patch("dynamic_world.calculations.ee")
+            mocker.patch("dynamic_world.calculations.geemap")
+            mocker.patch("dynamic_world.composites.ee")
+            mocker.patch("dynamic_world.composites.geemap")
+            ee.Dictionary.return_value.getInfo.return_value = {
+                "0": 2, "1": 7, "null": 1
+            }
+
+            forest = load_config(directory["sample_base_path"])
+
+            counts = single_date_calculation('2022-06-04', '2022-07-04', forest)
+
+            assert counts == {"water": 2, "trees": 7, "NA": 1}
+            get_info_calls = [call for call in ee.mock_calls
+                              if call[0].endswith("getInfo")]
+            assert len(get_info_calls) == 1
+
+        def test_single_date_calculation_raw(self, directory, mocker):
+            ee = mocker.patch("dynamic_world.calculations.ee")
+            mocker.patch("dynamic_world.calculations.geemap")
+            mocker.patch("dynamic_world.composites.ee")
+            mocker.patch("dynamic_world.composites.geemap")
+            ee.Dictionary.return_value.getInfo.return_value = {
+                "0": 2, "1": 7, "null": 1
+            }
+
+            forest = load_config(directory["sample_base_path"])
+
+            counts = single_date_calculation('2022-06-04', '2022-07-04', forest,
+                                             return_raw=True)
+
+            assert counts == {"0": 2, "1": 7, "null": 1}
+
+        def test_single_date_calculation_cached(self, directory, mocker,
+                                                tmp_path):
+            ee = mocker.patch("dynamic_world.calculations.ee")
+            mocker.patch("dynamic_world.calculations.geemap")
+            mocker.patch("dynamic_world.composites.ee")
+            mocker.patch("dynamic_world.composites.geemap")
+            ee.Dictionary.return_value.getInfo.return_value = {"1": 7}
+            cache = ResultCache(tmp_path)
+
+            forest = load_config(directory["sample_base_path"])
+
+            first = single_date_calculation('2022-06-04', '2022-07-04', forest,
+                                            cache=cache)
+            ee.reset_mock()
+            second = single_date_calculation('2022-06-04', '2022-07-04', forest,
+                                             cache=cache)
+
+            assert first == second == {"trees": 7}
+            assert ee.mock_calls == []
+            assert cache.stats() == {"hits": 1, "misses": 1}
+
+        def test_single_date_calculation_partitioned(self, directory):
+            forest = load_config(directory["sample_base_path"])
+            backend = FakeBackend()
+
+            with backend.install():
+                whole = single_date_calculation('2022-06-04', '2022-07-04',
+                                                forest, return_raw=True)
+                partitioned = single_date_calculation(
+                    '2022-06-04', '2022-07-04', forest, return_raw=True,
+                    partition=True, max_region_pixels=20_000)
+                borders = backend.geemap.geojson_to_ee(forest.geojson_info)
+
+            assert backend.round_trips > 3
+            assert partitioned == whole
+            inside = borders.mask(Grid.covering(*borders.bounds()))
+            assert sum(whole.values()) == inside.sum()
+
+        def test_single_date_calculation_partitioned_after_error(
+                self, directory):
+            forest = load_config(directory["sample_base_path"])
+
+            with FakeBackend().install():
+                expected = single_date_calculation(
+                    '2022-06-04', '2022-07-04', forest, return_raw=True)
+            with FakeBackend(max_pixels=50_000).install():
+                counts = single_date_calculation('2022-06-04', '2022-07-04',
+                                                 forest, return_raw=True,
+                                                 partition=True)
+
+            assert counts == expected
+
     class TestUnhappyPaths:
+        def test_single_date_calculation_too_large(self, directory):
+            forest = load_config(directory["sample_base_path"])
+
+            with FakeBackend(max_pixels=50_000).install():
+                with pytest.raises(Exception, match="timed out"):
+                    single_date_calculation('2022-06-04', '2022-07-04',
+                                            forest)
+
+        def test_single_date_calculation_partitioned_other_error(
+                self, directory):
+            forest = load_config(directory["sample_base_path"])
+            backend = FakeBackend(failure_rate=1,
+                                  failure_message="Permission denied.")
+
+            with backend.install():
+                with pytest.raises(Exception, match="Permission denied"):
+                    single_date_calculation('2022-06-04', '2022-07-04',
+                                            forest, partition=True)
+            assert backend.round_trips == 1
+
         def test_date_before_start_date(self, directory):
 
             initialize_ee()
@@ -58,6 +178,348 @@ class TestSingleDateCalculation:
                 single_date_calculation('2022-06-04', '2000-01-01', forest)
 
 
+def stands_forest(directory, tmp_path, stands):
+    """
+    The Sample forest with one square feature per entry of stands
+    (their properties)
+    """
+    sample = load_config(directory["sample_base_path"])
+    features = [
+        {"type": "Feature", "properties": properties,
+         "geometry": {"type": "Polygon", "coordinates": [[
+             [-76.14 + i * 0.01, -8.76], [-76.13 + i * 0.01, -8.76],
+             [-76.13 + i * 0.01, -8.75], [-76.14 + i * 0.01, -8.75],
+             [-76.14 + i * 0.01, -8.76]]]}}
+        for i, properties in enumerate(stands)
+    ]
+    geojson_path = tmp_path / "stands.geojson"
+    geojson_path.write_text(json.dumps(
+        {"type": "FeatureCollection", "features": features}))
+    return ForestConfig(sample.name, geojson_path, sample.co2_factor_info,
+                        sample.start_date)
+
+
+def square_without_pixels():
+    """
+    Ring of a square lying between pixel centers, no pixel is counted in it
+    """
+    west, south = [round(c / PIXEL) * PIXEL for c in (-76.1, -8.1)]
+    return [[west + PIXEL * x, south + PIXEL * y]
+            for x, y in ((0.1, 0.1), (0.4, 0.1), (0.4, 0.4), (0.1, 0.4),
+                         (0.1, 0.1))]
+
+
+class TestStandsCalculation:
+
+    class TestHappyPaths:
+        def test_stands_calculation_single_round_trip(self, directory,
+                                                      mocker, tmp_path):
+            ee = mocker.patch("dynamic_world.calculations.ee")
+            geemap = mocker.patch("dynamic_world.calculations.geemap")
+            mocker.patch("dynamic_world.composites.ee")
+            mocker.patch("dynamic_world.composites.geemap")
+            ee.Dictionary.fromLists.return_value.getInfo.return_value = {
+                "0": {"1": 6, "null": 2},
+                "1": {"0": 1, "1": 3},
+                "total": {"0": 1, "1": 8, "null": 2},
+            }
+            forest = stands_forest(directory, tmp_path,
+                                   [{"stand": "A"}, {"stand": 7},
+                                    {"stand": "A"}])
+
+            result = stands_calculation('2022-06-04', '2022-07-04', forest,
+                                        "stand")
+
+            assert result.pixel_counts == {
+                "A": {"trees": 6, "NA": 2},
+                "7": {"water": 1, "trees": 3},
+            }
+            assert result.total_pixel_counts == {"water": 1, "trees": 8,
+                                                 "NA": 2}
+            assert result.co2 == {
+                name: pytest.approx(co2_factor_calculation(counts, forest))
+                for name, counts in result.pixel_counts.items()
+            }
+            assert result.total_co2 == pytest.approx(
+                co2_factor_calculation(result.total_pixel_counts, forest))
+            # Features of stand A are reduced as a single region
+            stand_a = geemap.geojson_to_ee.call_args_list[0].args[0]
+            assert len(stand_a["features"]) == 2
+            # Two stands and the whole forest
+            assert ee.Feature.call_count == 3
+            get_info_calls = [call for call in ee.mock_calls
+                              if call[0].endswith("getInfo")]
+            assert len(get_info_calls) == 1
+
+        def test_stands_calculation_preprocessed_forest(
+                self, directory, mocker, tmp_path):
+            forest_path = tmp_path / "Sample"
+            shutil.copytree(directory["sample_base_path"], forest_path)
+            stands_forest(directory, tmp_path,
+                          [{"stand": "A"}, {"stand": "B"}])
+            shutil.copy(tmp_path / "stands.geojson",
+                        forest_path / "sample.geojson")
+            geometry_ee = mocker.patch("dynamic_world.geometry.ee")
+            mocker.patch("dynamic_world.geometry.geemap")
+            geometry_ee.Dictionary.return_value.getInfo.return_value = {
+                "geometry": {"type": "Polygon", "coordinates": [[
+                    [-76.14, -8.76], [-76.12, -8.76], [-76.12, -8.75],
+                    [-76.14, -8.75], [-76.14, -8.76]]]},
+                "area": 200.0, "simplified_area": 200.0}
+            geometry_ee.Geometry.return_value.serialize.return_value = (
+                '{"serialized": true}')
+            ee = mocker.patch("dynamic_world.calculations.ee")
+            geemap = mocker.patch("dynamic_world.calculations.geemap")
+            mocker.patch("dynamic_world.composites.ee")
+            mocker.patch("dynamic_world.composites.geemap")
+            ee.Dictionary.fromLists.return_value.getInfo.return_value = {
+                "0": {"1": 6}, "1": {"1": 3}, "total": {"1": 9}}
+
+            forest = load_config(forest_path, preprocess=True)
+            result = stands_calculation('2022-06-04', '2022-07-04', forest,
+                                        "stand")
+
+            # The simplified geojson is a single feature without properties
+            assert len(forest.geojson_info["features"]) == 1
+            assert result.pixel_counts == {"A": {"trees": 6},
+                                           "B": {"trees": 3}}
+            stand_a = geemap.geojson_to_ee.call_args_list[0].args[0]
+            assert stand_a["features"][0]["properties"] == {"stand": "A"}
+
+        def test_stands_calculation_stand_without_pixels(self, tmp_path):
+            forest = synthetic_forests(tmp_path, 1, size_degrees=0.01)[0]
+            features = forest.geojson_info["features"]
+            square = square_without_pixels()
+            geojson_path = tmp_path / "stands.geojson"
+            geojson_path.write_text(json.dumps({
+                "type": "FeatureCollection",
+                "features": [
+                    {"type": "Feature", "properties": {"stand": "Empty"},
+                     "geometry": {"type": "Polygon",
+                                  "coordinates": [square]}},
+                    {**features[0], "properties": {"stand": "A"}}]}))
+            stands = ForestConfig(forest.name, geojson_path,
+                                  forest.co2_factor_info, forest.start_date)
+
+            with FakeBackend().install():
+                result = stands_calculation('2022-06-04', '2022-07-04',
+                                            stands, "stand")
+                expected = single_date_calculation('2022-06-04',
+                                                   '2022-07-04', forest)
+
+            assert result.pixel_counts == {"Empty": {}, "A": expected}
+            assert result.total_pixel_counts == expected
+
+    class TestUnhappyPaths:
+        def test_stands_calculation_missing_property(self, directory, mocker,
+                                                     tmp_path):
+            ee = mocker.patch("dynamic_world.calculations.ee")
+            mocker.patch("dynamic_world.calculations.geemap")
+            forest = stands_forest(directory, tmp_path,
+                                   [{"stand": "A"}, {}])
+
+            with pytest.raises(ValueError):
+                stands_calculation('2022-06-04', '2022-07-04', forest,
+                                   "stand")
+            assert ee.mock_calls == []
+
+
+class TestTransitionCalculation:
+
+    class TestHappyPaths:
+        def test_transition_calculation_single_round_trip(self, directory,
+                                                          mocker):
+            ee = mocker.patch("dynamic_world.calculations.ee")
+            composites_ee = mocker.patch("dynamic_world.composites.ee")
+            mocker.patch("dynamic_world.composites.geemap")
+            # trees -> trees, trees -> built, NA -> water
+            ee.Dictionary.return_value.getInfo.return_value = {
+                "11": 5, "16": 2, "90": 1}
+            forest = load_config(directory["sample_base_path"])
+
+            result = transition_calculation(forest,
+                                            ('2022-01-01', '2022-02-01'),
+                                            ('2023-01-01', '2023-02-01'))
+
+            expected = np.zeros((10, 10), dtype=np.int64)
+            expected[1, 1], expected[1, 6], expected[9, 0] = 5, 2, 1
+            np.testing.assert_array_equal(result.matrix, expected)
+            # Sample forest: trees are worth 1 and NA's are redistributed
+            assert result.co2_a == pytest.approx(7 + 1)
+            assert result.co2_b == pytest.approx(5)
+            assert result.co2_delta == pytest.approx(-3)
+            # Both composites fill missing pixels with NA before encoding,
+            # windows without images are all NA
+            collection = (composites_ee.ImageCollection.return_value
+                          .filterDate.return_value.filterBounds.return_value)
+            assert composites_ee.Algorithms.If.call_args_list == [
+                ((collection.size.return_value.gt.return_value,
+                  collection.select.return_value.reduce.return_value,
+                  composites_ee.Image.constant.return_value.rename
+                  .return_value),)] * 2
+            composites_ee.Image.constant.assert_called_with(9)
+            composite = composites_ee.Image.return_value
+            assert composite.unmask.call_args_list == [((9,),), ((9,),)]
+            get_info_calls = [call for call in ee.mock_calls
+                              if call[0].endswith("getInfo")]
+            assert len(get_info_calls) == 1
+
+        def test_transition_calculation_warns_for_both_windows(
+                self, directory, mocker):
+            ee = mocker.patch("dynamic_world.calculations.ee")
+            mocker.patch("dynamic_world.composites.ee")
+            mocker.patch("dynamic_world.composites.geemap")
+            logger = mocker.patch(
+                "dynamic_world.calculations.get_logger").return_value
+            ee.Dictionary.return_value.getInfo.return_value = {}
+            forest = load_config(directory["sample_base_path"])
+
+            transition_calculation(forest, ('2000-01-01', '2000-02-01'),
+                                   ('2001-01-01', '2001-02-01'))
+
+            assert logger.warning.call_count == 2
+            assert "2001-02-01" in logger.warning.call_args.args[0]
+
+    class TestUnhappyPaths:
+        def test_transition_calculation_bad_window(self, directory, mocker):
+            ee = mocker.patch("dynamic_world.calculations.ee")
+            forest = load_config(directory["sample_base_path"])
+
+            with pytest.raises(ValueError):
+                transition_calculation(forest, ('2022-01-01', '2022-02-01'),
+                                       ('2023-02-01', '2023-01-01'))
+            assert ee.mock_calls == []
+
+
+class TestMultiForestCalculation:
+
+    class TestHappyPaths:
+        def test_multi_forest_calculation_single_round_trip(self, directory,
+                                                            mocker):
+            ee = mocker.patch("dynamic_world.calculations.ee")
+            mocker.patch("dynamic_world.calculations.geemap")
+            mocker.patch("dynamic_world.composites.ee")
+            mocker.patch("dynamic_world.composites.geemap")
+            ee.Dictionary.fromLists.return_value.getInfo.return_value = {
+                "Cordillera Azul": {"0": 3, "1": 5},
+                "Sample": {"1": 2, "null": 1},
+            }
+
+            forests = [load_config(directory["cordillera_base_path"]),
+                       load_config(directory["sample_base_path"])]
+
+            counts = multi_forest_calculation('2022-06-04', '2022-07-04',
+                                              forests)
+
+            assert counts == {
+                "Cordillera Azul": {"water": 3, "trees": 5},
+                "Sample": {"trees": 2, "NA": 1},
+            }
+            get_info_calls = [call for call in ee.mock_calls
+                              if call[0].endswith("getInfo")]
+            assert len(get_info_calls) == 1
+
+        def test_multi_forest_calculation_forest_without_pixels(
+                self, tmp_path):
+            forests = synthetic_forests(tmp_path, 2, size_degrees=0.01)
+            square = square_without_pixels()
+            geojson_path = tmp_path / "empty.geojson"
+            geojson_path.write_text(json.dumps({
+                "type": "FeatureCollection",
+                "features": [{"type": "Feature", "properties": {},
+                              "geometry": {"type": "Polygon",
+                                           "coordinates": [square]}}]}))
+            empty = ForestConfig("Empty", geojson_path,
+                                 forests[0].co2_factor_info, "2022-01-01")
+
+            with FakeBackend().install():
+                counts = multi_forest_calculation('2022-06-04', '2022-07-04',
+                                                  [empty] + forests)
+                expected = [single_date_calculation('2022-06-04',
+                                                    '2022-07-04', forest)
+                            for forest in forests]
+
+            assert counts == {"Empty": {}, forests[0].name: expected[0],
+                              forests[1].name: expected[1]}
+
+    class TestUnhappyPaths:
+        def test_duplicated_forests(self, directory, mocker):
+            mocker.patch("dynamic_world.calculations.ee")
+            mocker.patch("dynamic_world.calculations.geemap")
+            mocker.patch("dynamic_world.composites.ee")
+            mocker.patch("dynamic_world.composites.geemap")
+
+            forest = load_config(directory["sample_base_path"])
+
+            with pytest.raises(ValueError):
+                multi_forest_calculation('2022-06-04', '2022-07-04',
+                                         [forest, forest])
+
+
+class TestTimeSeriesCalculation:
+
+    class TestHappyPaths:
+        def test_time_series_calculation_single_round_trip(self, directory,
+                                                           mocker):
+            ee = mocker.patch("dynamic_world.calculations.ee")
+            mocker.patch("dynamic_world.calculations.geemap")
+            mocker.patch("dynamic_world.composites.ee")
+            mocker.patch("dynamic_world.composites.geemap")
+            ee.List.return_value.getInfo.return_value = [
+                {"1": 4, "null": 1},
+                {},
+                {"1": 5},
+            ]
+
+            forest = load_config(directory["sample_base_path"])
+            windows = [('2022-06-01', '2022-06-08'),
+                       ('2022-06-08', '2022-06-15'),
+                       ('2022-06-15', '2022-06-22')]
+
+            series = time_series_calculation(forest, windows)
+
+            assert list(series.keys()) == windows
+            assert list(series.values()) == [{"trees": 4, "NA": 1}, {},
+                                             {"trees": 5}]
+            get_info_calls = [call for call in ee.mock_calls
+                              if call[0].endswith("getInfo")]
+            assert len(get_info_calls) == 1
+
+        def test_iter_time_series_calculation_batches(self, directory,
+                                                      mocker):
+            ee = mocker.patch("dynamic_world.calculations.ee")
+            mocker.patch("dynamic_world.calculations.geemap")
+            mocker.patch("dynamic_world.composites.ee")
+            mocker.patch("dynamic_world.composites.geemap")
+            ee.List.return_value.getInfo.side_effect = [
+                [{"1": 1}, {"1": 2}], [{"1": 3}]]
+            forest = load_config(directory["sample_base_path"])
+            windows = date_windows('2022-06-01', '2022-06-22', 7)
+
+            series = iter_time_series_calculation(forest, iter(windows),
+                                                  batch_size=2)
+            first = next(series)
+
+            # Only the first batch has been fetched so far
+            assert first == (windows[0], {"trees": 1})
+            assert ee.List.return_value.getInfo.call_count == 1
+            assert list(series) == [(windows[1], {"trees": 2}),
+                                    (windows[2], {"trees": 3})]
+            assert ee.List.return_value.getInfo.call_count == 2
+
+    class TestUnhappyPaths:
+        def test_window_end_before_start(self, directory, mocker):
+            mocker.patch("dynamic_world.calculations.ee")
+            mocker.patch("dynamic_world.calculations.geemap")
+            mocker.patch("dynamic_world.composites.ee")
+            mocker.patch("dynamic_world.composites.geemap")
+
+            forest = load_config(directory["sample_base_path"])
+
+            with pytest.raises(ValueError):
+                time_series_calculation(forest, [('2022-06-08', '2022-06-01')])
+
+
 class TestCo2FactorCalculation:
 
     class TestHappyPaths:
@@ -97,3 +559,40 @@ class TestCo2FactorCalculation:
             expected_value = 1
 
             assert co2_factor_calculation(pixel_counts, forest) == expected_value
+
+
+class TestCo2FactorBatchCalculation:
+
+    class TestHappyPaths:
+        def test_co2_factor_batch_matches_scalar(self, directory):
+            forest = load_config(directory["cordillera_base_path"])
+            rng = np.random.default_rng(0)
+            labels = ['NA', 'bare', 'built', 'crops', 'flooded_vegetation',
+                      'grass', 'shrub_and_scrub', 'snow_and_ice', 'trees',
+                      'water']
+            pixel_counts = [
+                {label: int(count) for label, count
+                 in zip(labels, rng.integers(0, 1000, len(labels)))
+                 if count > 100}
+                for _ in range(200)
+            ]
+
+            batch = co2_factor_batch_calculation(
+                pixel_counts_matrix(pixel_counts), forest)
+
+            expected = [co2_factor_calculation(counts, forest)
+                        for counts in pixel_counts]
+            np.testing.assert_allclose(batch, expected, rtol=1e-12)
+
+        def test_co2_factor_batch_only_na(self, directory):
+            forest = load_config(directory["sample_base_path"])
+            pixel_counts = [{'NA': 10}, {}, {'NA': 10, 'trees': 0}]
+
+            batch = co2_factor_batch_calculation(
+                pixel_counts_matrix(pixel_counts), forest)
+
+            # Every pixel is NA, both versions agree on 0 Co2 Tons.
+            expected = [co2_factor_calculation(counts, forest)
+                        for counts in pixel_counts]
+            np.testing.assert_allclose(batch, expected, atol=1e-12)
+            np.testing.assert_allclose(batch, [0, 0, 0], atol=1e-12)
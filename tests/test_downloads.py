@@ -1,8 +1,67 @@
 from pathlib import Path
 from dynamic_world.configurations import load_config
-from dynamic_world.downloads import download_single_date_image
+from dynamic_world.calculations import co2_factor_calculation
+from dynamic_world.downloads import (calculate_and_download,
+                                     download_single_date_image)
+from dynamic_world.rasters import local_pixel_counts
+import math
+
+import numpy as np
 import pytest
+import rasterio
+from rasterio.transform import from_origin
 from dynamic_world.utils import initialize_ee
+from dynamic_world.cache import ResultCache
+
+
+def fake_download_ee_image(image, filename, **kwargs):
+    """
+    Writes a synthetic label raster instead of downloading it
+    (tagged with nodata 0 as geemap does for uint8 images)
+    """
+    labels = (np.arange(64 * 64).reshape(64, 64) % 9).astype(np.uint8)
+    with rasterio.open(filename, "w", driver="GTiff", width=64, height=64,
+                       count=1, dtype="uint8", crs="EPSG:4326", nodata=0,
+                       transform=from_origin(-76.14, -8.72, 0.0001, 0.0001)
+                       ) as dst:
+        dst.write(labels, 1)
+
+
+TILE_PIXEL = 0.001
+
+
+def global_labels(rows, cols):
+    return ((rows * 7 + cols) % 9).astype(np.uint8)
+
+
+def fake_download_ee_tile(image, filename, region, **kwargs):
+    """
+    Writes the tile of a synthetic raster (aligned to a global pixel grid)
+    covering region, which is the bounds list passed to ee.Geometry.Rectangle
+    """
+    west, south, east, north = region
+    col_start = math.floor(west / TILE_PIXEL)
+    col_end = math.ceil(east / TILE_PIXEL)
+    row_start = math.floor(-north / TILE_PIXEL)
+    row_end = math.ceil(-south / TILE_PIXEL)
+    rows, cols = np.mgrid[row_start:row_end, col_start:col_end]
+    with rasterio.open(filename, "w", driver="GTiff", width=cols.shape[1],
+                       height=cols.shape[0], count=1, dtype="uint8",
+                       crs="EPSG:4326", nodata=255,
+                       transform=from_origin(col_start * TILE_PIXEL,
+                                             -row_start * TILE_PIXEL,
+                                             TILE_PIXEL, TILE_PIXEL)) as dst:
+        dst.write(global_labels(rows, cols), 1)
+
+
+def mock_tiled_ee(mocker):
+    ee = mocker.patch("dynamic_world.downloads.ee")
+    ee.Geometry.Rectangle.side_effect = lambda coords, *args: coords
+    geemap = mocker.patch("dynamic_world.downloads.geemap")
+    mocker.patch("dynamic_world.composites.ee")
+    mocker.patch("dynamic_world.composites.geemap")
+    geemap.download_ee_image.side_effect = fake_download_ee_tile
+    return geemap
 
 
 class TestDownloadSingleDateImage:
@@ -30,9 +89,9 @@ class TestDownloadSingleDateImage:
             path = Path(file_path)
             assert path.is_file()
 
-            # Check TIFF file exists in directory TODO maybe remove ???
+            # Check intermediate TIFF file was removed
             path_tif = Path(path_string.replace('.cog', ''))
-            assert path_tif.is_file()
+            assert not path_tif.exists()
 
         @pytest.mark.filterwarnings("ignore:end_date is before")
         def test_download_single_date_image_before_forest_start_date(self, directory):
@@ -57,9 +116,173 @@ class TestDownloadSingleDateImage:
             path = Path(file_path)
             assert path.is_file()
 
-            # Check TIFF file exists in directory TODO maybe remove ???
+            # Check intermediate TIFF file was removed
             path_tif = Path(path_string.replace('.cog', ''))
-            assert path_tif.is_file()
+            assert not path_tif.exists()
+
+        def test_download_single_date_image_in_process_cog(self, directory,
+                                                           mocker, tmp_path):
+            mocker.patch("dynamic_world.downloads.ee")
+            geemap = mocker.patch("dynamic_world.downloads.geemap")
+            mocker.patch("dynamic_world.composites.ee")
+            mocker.patch("dynamic_world.composites.geemap")
+            geemap.download_ee_image.side_effect = fake_download_ee_image
+
+            forest = load_config(directory["sample_base_path"])
+
+            file_path = download_single_date_image(
+                '2022-06-04', '2022-07-04', forest, tmp_path,
+                cog_options={"compress": "ZSTD", "predictor": "YES"})
+
+            assert file_path == tmp_path / "Sample_2022-06-04_2022-07-04.cog.tif"
+            assert list(tmp_path.iterdir()) == [file_path]
+            with rasterio.open(file_path) as src:
+                assert src.tags(ns="IMAGE_STRUCTURE")["LAYOUT"] == "COG"
+                assert src.compression.name == "zstd"
+                assert (src.read(1) == np.arange(64 * 64).reshape(64, 64) % 9).all()
+
+        def test_download_single_date_image_cached_by_options(
+                self, directory, mocker, tmp_path):
+            mocker.patch("dynamic_world.downloads.ee")
+            geemap = mocker.patch("dynamic_world.downloads.geemap")
+            mocker.patch("dynamic_world.composites.ee")
+            mocker.patch("dynamic_world.composites.geemap")
+            geemap.download_ee_image.side_effect = fake_download_ee_image
+            cache = ResultCache(tmp_path / "cache")
+            forest = load_config(directory["sample_base_path"])
+
+            compressions = []
+            for folder, cog_options in [
+                    ("zstd", {"compress": "ZSTD"}),
+                    ("deflate", {"compress": "DEFLATE"}),
+                    ("reused", {"compress": "ZSTD"})]:
+                file_path = download_single_date_image(
+                    '2022-06-04', '2022-07-04', forest, tmp_path / folder,
+                    cog_options=cog_options, cache=cache)
+                with rasterio.open(file_path) as src:
+                    compressions.append(src.compression.name)
+
+            assert compressions == ["zstd", "deflate", "zstd"]
+            assert geemap.download_ee_image.call_count == 2
+
+        def test_download_single_date_image_tiled(self, directory, mocker,
+                                                  tmp_path):
+            geemap = mock_tiled_ee(mocker)
+            progress = mocker.Mock()
+
+            forest = load_config(directory["sample_base_path"])
+
+            file_path = download_single_date_image(
+                '2022-06-04', '2022-07-04', forest, tmp_path, tile_size=0.02,
+                max_workers=3, progress=progress)
+
+            assert geemap.download_ee_image.call_count == 6
+            assert progress.call_count == 6
+            assert progress.call_args[0][:2] == (6, 6)
+            # Tiles are removed once the COG is created
+            assert list(tmp_path.iterdir()) == [file_path]
+            with rasterio.open(file_path) as src:
+                labels = src.read(1)
+                row_start = round(-src.transform.f / TILE_PIXEL)
+                col_start = round(src.transform.c / TILE_PIXEL)
+            rows, cols = np.mgrid[row_start:row_start + labels.shape[0],
+                                  col_start:col_start + labels.shape[1]]
+            assert (labels == global_labels(rows, cols)).all()
+
+        def test_download_single_date_image_tiled_resume(self, directory,
+                                                         mocker, tmp_path):
+            geemap = mock_tiled_ee(mocker)
+            calls = []
+
+            def failing_download(image, filename, region, **kwargs):
+                calls.append(region)
+                if len(calls) == 4:
+                    raise Exception("Too many concurrent aggregations.")
+                fake_download_ee_tile(image, filename, region)
+
+            geemap.download_ee_image.side_effect = failing_download
+            forest = load_config(directory["sample_base_path"])
+
+            with pytest.raises(Exception):
+                download_single_date_image(
+                    '2022-06-04', '2022-07-04', forest, tmp_path,
+                    tile_size=0.02, max_workers=1)
+
+            finished = len(list(tmp_path.glob("*_tiles_*/tile_*_*[0-9].tif")))
+            geemap.download_ee_image.reset_mock()
+            geemap.download_ee_image.side_effect = fake_download_ee_tile
+            file_path = download_single_date_image(
+                '2022-06-04', '2022-07-04', forest, tmp_path, tile_size=0.02,
+                max_workers=1)
+
+            # Only the tiles which were not finished are downloaded
+            assert finished >= 3
+            assert geemap.download_ee_image.call_count == 6 - finished
+            assert file_path.is_file()
+
+        def test_download_single_date_image_tiled_resume_other_tile_size(
+                self, directory, mocker, tmp_path):
+            geemap = mock_tiled_ee(mocker)
+            calls = []
+
+            def failing_download(image, filename, region, **kwargs):
+                calls.append(region)
+                if len(calls) == 4:
+                    raise Exception("Too many concurrent aggregations.")
+                fake_download_ee_tile(image, filename, region)
+
+            geemap.download_ee_image.side_effect = failing_download
+            forest = load_config(directory["sample_base_path"])
+
+            with pytest.raises(Exception):
+                download_single_date_image(
+                    '2022-06-04', '2022-07-04', forest, tmp_path,
+                    tile_size=0.02, max_workers=1)
+
+            geemap.download_ee_image.reset_mock()
+            geemap.download_ee_image.side_effect = fake_download_ee_tile
+            file_path = download_single_date_image(
+                '2022-06-04', '2022-07-04', forest, tmp_path, tile_size=0.03,
+                max_workers=1)
+
+            resumed_calls = geemap.download_ee_image.call_count
+            geemap.download_ee_image.reset_mock()
+            fresh_path = download_single_date_image(
+                '2022-06-04', '2022-07-04', forest, tmp_path / "fresh",
+                tile_size=0.03, max_workers=1)
+
+            # Tiles of the other grid are not reused
+            assert resumed_calls == geemap.download_ee_image.call_count
+            with rasterio.open(file_path) as src, \
+                    rasterio.open(fresh_path) as fresh:
+                assert src.bounds == fresh.bounds
+                assert (src.read(1) == fresh.read(1)).all()
+
+        def test_download_single_date_image_uint8(self, directory, mocker,
+                                                  tmp_path):
+            mocker.patch("dynamic_world.downloads.ee")
+            geemap = mocker.patch("dynamic_world.downloads.geemap")
+            ee = mocker.patch("dynamic_world.composites.ee")
+            mocker.patch("dynamic_world.composites.geemap")
+            geemap.download_ee_image.side_effect = fake_download_ee_image
+
+            forest = load_config(directory["sample_base_path"])
+
+            file_path = download_single_date_image(
+                '2022-06-04', '2022-07-04', forest, tmp_path)
+
+            composite = (ee.ImageCollection.return_value.filterDate.return_value
+                         .filterBounds.return_value.select.return_value
+                         .reduce.return_value.clip.return_value)
+            composite.unmask.assert_called_once_with(255)
+            composite.unmask.return_value.cast.assert_called_once_with(
+                {"label_mode": "uint8"})
+            assert geemap.download_ee_image.call_args[1]["dtype"] == "uint8"
+            with rasterio.open(file_path) as src:
+                assert src.dtypes[0] == "uint8"
+                assert src.nodata == 255
+                # Class 0 (water) is not hidden behind a nodata mask
+                assert not src.read(1, masked=True).mask.any()
 
     class TestUnhappyPaths:
         def test_date_before_start_date(self, directory):
@@ -73,3 +296,69 @@ class TestDownloadSingleDateImage:
                     '2000-01-02',
                     forest,
                     Path("tests/exampleProyects/CordilleraAzul/"))
+
+        def test_cog_creation_error(self, directory, mocker, tmp_path):
+            mocker.patch("dynamic_world.downloads.ee")
+            geemap = mocker.patch("dynamic_world.downloads.geemap")
+            mocker.patch("dynamic_world.composites.ee")
+            mocker.patch("dynamic_world.composites.geemap")
+            geemap.download_ee_image.side_effect = (
+                lambda image, filename, **kwargs:
+                    Path(filename).write_bytes(b"truncated download"))
+
+            forest = load_config(directory["sample_base_path"])
+
+            with pytest.raises((RuntimeError, rasterio.errors.RasterioError)):
+                download_single_date_image(
+                    '2022-06-04', '2022-07-04', forest, tmp_path)
+            assert list(tmp_path.iterdir()) == []
+
+        def test_download_single_date_image_bad_tile_size(self, directory,
+                                                          mocker, tmp_path):
+            mock_tiled_ee(mocker)
+
+            forest = load_config(directory["sample_base_path"])
+
+            with pytest.raises(ValueError):
+                download_single_date_image(
+                    '2022-06-04', '2022-07-04', forest, tmp_path, tile_size=0)
+
+
+class TestCalculateAndDownload:
+
+    class TestHappyPaths:
+        def test_calculate_and_download_single_composite(self, directory,
+                                                         mocker, tmp_path):
+            geemap = mock_tiled_ee(mocker)
+            ee = mocker.patch("dynamic_world.composites.ee")
+
+            forest = load_config(directory["sample_base_path"])
+
+            report = calculate_and_download('2022-06-04', '2022-07-04',
+                                            forest, tmp_path, tile_size=0.02)
+
+            assert report.path == tmp_path / "Sample_2022-06-04_2022-07-04.cog.tif"
+            assert report.path.is_file()
+            assert report.pixel_counts
+            assert report.pixel_counts == local_pixel_counts(report.path,
+                                                             forest)
+            assert report.co2 == co2_factor_calculation(report.pixel_counts,
+                                                        forest)
+            # One composite and no histogram round-trip
+            assert ee.ImageCollection.call_count == 1
+            assert geemap.download_ee_image.call_count == 6
+            assert not [call for call in ee.mock_calls
+                        if call[0].endswith("getInfo")]
+
+    class TestUnhappyPaths:
+        def test_calculate_and_download_bad_dates(self, directory, mocker,
+                                                  tmp_path):
+            mocker.patch("dynamic_world.composites.ee")
+            geemap = mocker.patch("dynamic_world.downloads.geemap")
+
+            forest = load_config(directory["sample_base_path"])
+
+            with pytest.raises(ValueError):
+                calculate_and_download('2022-07-04', '2022-06-04', forest,
+                                       tmp_path)
+            geemap.download_ee_image.assert_not_called()
@@ -0,0 +1,86 @@
+import os
+import shutil
+import time
+
+import geojson
+import pytest
+
+from dynamic_world.configurations import load_config
+from dynamic_world.geometry import count_vertices, preprocess_geometry
+
+SIMPLIFIED_POLYGON = {
+    "type": "Polygon",
+    "coordinates": [[[-76.14, -8.77], [-76.09, -8.77], [-76.09, -8.73],
+                     [-76.14, -8.77]]],
+}
+
+
+@pytest.fixture
+def forest_directory(directory, tmp_path):
+    forest_path = tmp_path / "Sample"
+    shutil.copytree(directory["sample_base_path"], forest_path)
+    return forest_path
+
+
+@pytest.fixture
+def mocked_ee(mocker):
+    ee = mocker.patch("dynamic_world.geometry.ee")
+    mocker.patch("dynamic_world.geometry.geemap")
+    ee.Dictionary.return_value.getInfo.return_value = {
+        "geometry": SIMPLIFIED_POLYGON, "area": 200.0, "simplified_area": 201.0}
+    ee.Geometry.return_value.serialize.return_value = '{"serialized": true}'
+    return ee
+
+
+class TestPreprocessGeometry:
+    class TestHappyPaths:
+        def test_preprocess_geometry(self, forest_directory, mocked_ee):
+            geojson_path = forest_directory / "sample.geojson"
+
+            preprocessed = preprocess_geometry(geojson_path)
+
+            assert preprocessed.geojson_path == (
+                forest_directory / "sample.simplified.geojson")
+            assert preprocessed.ee_geometry == '{"serialized": true}'
+            assert preprocessed.report.simplified_vertices == 4
+            assert preprocessed.report.vertices == count_vertices(
+                geojson.load(open(geojson_path)))
+            assert preprocessed.report.area_change == pytest.approx(0.005)
+            assert preprocessed.report.tolerance == 5
+            with open(preprocessed.geojson_path) as simplified_file:
+                simplified = geojson.load(simplified_file)
+            assert simplified["features"][0]["geometry"] == SIMPLIFIED_POLYGON
+
+        def test_preprocess_geometry_cached(self, forest_directory, mocked_ee):
+            geojson_path = forest_directory / "sample.geojson"
+
+            first = preprocess_geometry(geojson_path)
+            second = preprocess_geometry(geojson_path)
+
+            assert first == second
+            assert mocked_ee.Dictionary.call_count == 1
+
+        def test_preprocess_geometry_stale_cache(self, forest_directory,
+                                                 mocked_ee):
+            geojson_path = forest_directory / "sample.geojson"
+
+            preprocess_geometry(geojson_path)
+            future = time.time() + 10
+            os.utime(geojson_path, (future, future))
+            preprocess_geometry(geojson_path)
+            preprocess_geometry(geojson_path, tolerance=2)
+
+            assert mocked_ee.Dictionary.call_count == 3
+
+        def test_load_config_preprocess(self, forest_directory, mocked_ee):
+            forest = load_config(forest_directory, preprocess=True)
+
+            assert forest.ee_geometry == '{"serialized": true}'
+            assert forest.geojson_info["features"][0]["geometry"] == (
+                SIMPLIFIED_POLYGON)
+
+        def test_load_config_without_preprocess(self, forest_directory):
+            forest = load_config(forest_directory)
+
+            assert forest.ee_geometry is None
+            assert not (forest_directory / "sample.simplified.geojson").exists()
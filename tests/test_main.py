@@ -0,0 +1,68 @@
+import json
+
+from typer.testing import CliRunner
+
+from benchmarks.fake_ee import FakeBackend, synthetic_forests
+
+runner = CliRunner()
+
+
+class TestMain:
+    class TestHappyPaths:
+        def test_main(self, app, mocker, tmp_path):
+            initialize_ee = mocker.patch("dynamic_world.main.initialize_ee")
+            synthetic_forests(tmp_path / "forests", 2, size_degrees=0.01)
+            arguments = ['2022-01-01', '2022-03-01', '--step', '30',
+                         '--forests-dir', str(tmp_path / "forests"),
+                         '--output-dir', str(tmp_path / "output"), '-j', '2']
+
+            with FakeBackend().install():
+                result = runner.invoke(app, arguments)
+                resumed = runner.invoke(app, arguments)
+
+            assert result.exit_code == 0
+            initialize_ee.assert_called()
+            assert "4 jobs: 4 succeeded, 0 failed, 0 already done" in (
+                result.output)
+            assert "4 Earth Engine round-trips" in result.output
+            assert "0 succeeded, 0 failed, 4 already done" in resumed.output
+            lines = (tmp_path / "output" / "checkpoint.jsonl").read_text()
+            assert len([json.loads(line) for line in lines.splitlines()]) == 4
+
+        def test_main_results(self, app, mocker, tmp_path):
+            mocker.patch("dynamic_world.main.initialize_ee")
+            synthetic_forests(tmp_path / "forests", 2, size_degrees=0.01)
+
+            with FakeBackend().install():
+                result = runner.invoke(app, [
+                    '2022-01-01', '2022-03-01', '--forests-dir',
+                    str(tmp_path / "forests"), '--output-dir',
+                    str(tmp_path / "output"), '--results',
+                    str(tmp_path / "results.ndjson")])
+
+            rows = (tmp_path / "results.ndjson").read_text().splitlines()
+            assert result.exit_code == 0
+            assert len(rows) == 4
+            assert json.loads(rows[0])["co2"] > 0
+
+    class TestUnhappyPaths:
+        def test_main_failed_jobs(self, app, mocker, tmp_path):
+            mocker.patch("dynamic_world.main.initialize_ee")
+            synthetic_forests(tmp_path / "forests", 1, size_degrees=0.01)
+
+            with FakeBackend(failure_rate=1).install():
+                result = runner.invoke(app, [
+                    '2022-01-01', '2022-02-01', '--step', '31', '--forests-dir',
+                    str(tmp_path / "forests"), '--output-dir',
+                    str(tmp_path / "output")])
+
+            assert result.exit_code == 1
+            assert "1 failed" in result.output
+
+        def test_main_bad_dates(self, app, mocker, tmp_path):
+            mocker.patch("dynamic_world.main.initialize_ee")
+
+            result = runner.invoke(app, [
+                '2022-02-01', '2022-01-01', '--forests-dir', str(tmp_path)])
+
+            assert result.exit_code == 2
@@ -0,0 +1,126 @@
+import io
+import json
+import pstats
+
+import pytest
+
+from dynamic_world import metrics
+from dynamic_world.cache import ResultCache
+from dynamic_world.calculations import single_date_calculation
+from dynamic_world.configurations import load_config
+from dynamic_world.downloads import download_single_date_image
+from dynamic_world.scheduler import Job, run_jobs
+from tests.test_downloads import fake_download_ee_image
+
+
+@pytest.fixture
+def mock_ee(mocker):
+    ee = mocker.patch("dynamic_world.calculations.ee")
+    mocker.patch("dynamic_world.calculations.geemap")
+    mocker.patch("dynamic_world.composites.ee")
+    mocker.patch("dynamic_world.composites.geemap")
+    ee.Dictionary.return_value.getInfo.return_value = {"1": 7}
+    return ee
+
+
+class TestMetrics:
+    class TestHappyPaths:
+        def test_calculation_stages(self, directory, mock_ee, tmp_path):
+            cache = ResultCache(tmp_path)
+
+            with metrics.use_sink(metrics.InMemorySink()) as sink:
+                forest = load_config(directory["sample_base_path"])
+                for _ in range(2):
+                    single_date_calculation('2022-06-04', '2022-07-04',
+                                            forest, cache=cache)
+
+            assert set(sink.timings) == {"config_load", "geojson_to_ee",
+                                         "composite", "get_info"}
+            assert len(sink.timings["get_info"]) == 1
+            assert sink.counters == {"ee_round_trips": 1, "cache_misses": 1,
+                                     "cache_hits": 1}
+
+        def test_download_stages(self, directory, mocker, tmp_path):
+            mocker.patch("dynamic_world.downloads.ee")
+            geemap = mocker.patch("dynamic_world.downloads.geemap")
+            mocker.patch("dynamic_world.composites.ee")
+            mocker.patch("dynamic_world.composites.geemap")
+            geemap.download_ee_image.side_effect = fake_download_ee_image
+            forest = load_config(directory["sample_base_path"])
+
+            with metrics.use_sink(metrics.InMemorySink()) as sink:
+                download_single_date_image('2022-06-04', '2022-07-04', forest,
+                                           tmp_path)
+
+            assert {"download", "cog_conversion"} <= set(sink.timings)
+            assert sink.counters["ee_round_trips"] == 1
+            assert sink.counters["bytes_downloaded"] > 64 * 64
+
+        def test_json_lines_sink(self, directory, mock_ee):
+            stream = io.StringIO()
+
+            with metrics.use_sink(metrics.JsonLinesSink(stream)):
+                forest = load_config(directory["sample_base_path"])
+                single_date_calculation('2022-06-04', '2022-07-04', forest)
+
+            events = [json.loads(line) for line in stream.getvalue().splitlines()]
+            assert {"type": "counter", "name": "ee_round_trips"} in [
+                {"type": event["type"], "name": event["name"]}
+                for event in events]
+            assert all(event["value"] >= 0 for event in events)
+
+        def test_prometheus_textfile_sink(self, tmp_path):
+            path = tmp_path / "textfile" / "dynamic_world.prom"
+
+            with metrics.use_sink(metrics.PrometheusTextfileSink(path)):
+                with metrics.timer("download"):
+                    pass
+                with metrics.timer("download"):
+                    pass
+                metrics.increment("bytes_downloaded", 100)
+
+            lines = path.read_text().splitlines()
+            assert 'dynamic_world_stage_seconds_count{stage="download"} 2' in (
+                lines)
+            assert "dynamic_world_bytes_downloaded_total 100" in lines
+            assert list(tmp_path.glob("textfile/*.tmp")) == []
+
+        def test_retries_and_profiles(self, directory, tmp_path):
+            forest = load_config(directory["sample_base_path"])
+            attempts = []
+
+            def task(start_date, end_date, forest):
+                attempts.append(start_date)
+                if len(attempts) == 1:
+                    raise Exception("Too many concurrent aggregations.")
+                return {"trees": 1}
+
+            with metrics.use_sink(metrics.InMemorySink()) as sink:
+                results = list(run_jobs(
+                    [Job(forest, '2022-06-04', '2022-07-04', task)],
+                    backoff_seconds=0.01, profile_dir=tmp_path))
+
+            assert results[0].result == {"trees": 1}
+            assert sink.counters["retries"] == 1
+            profile = tmp_path / "Sample_2022-06-04_2022-07-04.prof"
+            assert pstats.Stats(str(profile)).total_calls > 0
+
+        def test_disabled_metrics(self, mocker):
+            ee_object = mocker.Mock()
+            ee_object.getInfo.return_value = {"1": 7}
+
+            assert metrics.get_sink() is None
+            # No measurement is taken, the same no-op context is reused
+            assert metrics.timer("download") is metrics.timer("get_info")
+            assert metrics.get_info(ee_object) == {"1": 7}
+            metrics.increment("retries")
+
+    class TestUnhappyPaths:
+        def test_timing_recorded_on_error(self):
+            with metrics.use_sink(metrics.InMemorySink()) as sink:
+                with pytest.raises(ValueError):
+                    with metrics.timer("download"):
+                        raise ValueError("failed download")
+
+            assert len(sink.timings["download"]) == 1
+            assert metrics.get_sink() is None
@@ -0,0 +1,175 @@
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+from dynamic_world.calculations import (co2_factor_batch_calculation,
+                                        pixel_counts_matrix,
+                                        transition_calculation)
+from dynamic_world.configurations import load_config
+from dynamic_world.rasters import (local_pixel_counts,
+                                   local_transition_calculation)
+
+WEST, NORTH, PIXEL = -76.14, -8.72, 0.0001
+
+
+def write_labels(path, labels, nodata):
+    profile = {
+        "driver": "GTiff", "width": labels.shape[1], "height": labels.shape[0],
+        "count": 1, "dtype": labels.dtype, "crs": "EPSG:4326",
+        "transform": from_origin(WEST, NORTH, PIXEL, PIXEL), "nodata": nodata,
+        "tiled": True, "blockxsize": 16, "blockysize": 16,
+    }
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(labels, 1)
+    return path
+
+
+def pixel_box(col_start, col_end, row_start, row_end):
+    """
+    Polygon covering exactly the pixels [row_start, row_end) x [col_start, col_end)
+    """
+    west, east = WEST + col_start * PIXEL, WEST + col_end * PIXEL
+    north, south = NORTH - row_start * PIXEL, NORTH - row_end * PIXEL
+    return {"type": "Polygon", "coordinates": [[
+        [west, north], [east, north], [east, south], [west, south], [west, north]
+    ]]}
+
+
+def expected_counts(labels, nodata):
+    values, counts = np.unique(labels, return_counts=True)
+    expected = {}
+    for value, count in zip(values, counts):
+        key = "null" if value == nodata or np.isnan(value) else str(int(value))
+        expected[key] = expected.get(key, 0) + int(count)
+    return expected
+
+
+class TestLocalPixelCounts:
+    class TestHappyPaths:
+        def test_local_pixel_counts_sub_area(self, directory, tmp_path):
+            rng = np.random.default_rng(0)
+            labels = rng.integers(0, 9, size=(64, 80)).astype(np.uint8)
+            labels[rng.random(labels.shape) < 0.1] = 255
+            path = write_labels(tmp_path / "labels.tif", labels, 255)
+            forest = load_config(directory["sample_base_path"])
+
+            counts = local_pixel_counts(path, forest,
+                                        geojson_info=pixel_box(10, 45, 5, 50),
+                                        return_raw=True)
+
+            assert counts == expected_counts(labels[5:50, 10:45], 255)
+
+        def test_local_pixel_counts_labels(self, directory, tmp_path):
+            labels = np.array([[0, 1], [1, 255]], dtype=np.uint8)
+            path = write_labels(tmp_path / "labels.tif", labels, 255)
+            forest = load_config(directory["sample_base_path"])
+
+            counts = local_pixel_counts(path, forest,
+                                        geojson_info=pixel_box(0, 2, 0, 2))
+
+            assert counts == {"water": 1, "trees": 2, "NA": 1}
+
+        def test_local_pixel_counts_float_raster(self, directory, tmp_path):
+            rng = np.random.default_rng(1)
+            labels = rng.integers(0, 9, size=(40, 40)).astype(np.float64)
+            labels[rng.random(labels.shape) < 0.2] = np.nan
+            path = write_labels(tmp_path / "labels.tif", labels, np.nan)
+            forest = load_config(directory["sample_base_path"])
+
+            counts = local_pixel_counts(path, forest,
+                                        geojson_info=pixel_box(3, 33, 7, 40),
+                                        return_raw=True)
+
+            assert counts == expected_counts(labels[7:40, 3:33], np.nan)
+
+        def test_local_pixel_counts_disjoint_area(self, directory, tmp_path):
+            labels = np.ones((16, 16), dtype=np.uint8)
+            path = write_labels(tmp_path / "labels.tif", labels, 255)
+            forest = load_config(directory["sample_base_path"])
+
+            counts = local_pixel_counts(path, forest,
+                                        geojson_info=pixel_box(100, 110, 0, 10))
+
+            assert counts == {}
+
+    class TestUnhappyPaths:
+        def test_local_pixel_counts_missing_file(self, directory, tmp_path):
+            forest = load_config(directory["sample_base_path"])
+
+            with pytest.raises(rasterio.errors.RasterioIOError):
+                local_pixel_counts(tmp_path / "missing.tif", forest)
+
+
+def transition_labels(seed):
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, 9, size=(48, 64)).astype(np.uint8)
+    labels[rng.random(labels.shape) < 0.1] = 255
+    return labels
+
+
+def expected_transitions(labels_a, labels_b):
+    classes_a = np.where(labels_a == 255, 9, labels_a).astype(np.int64)
+    classes_b = np.where(labels_b == 255, 9, labels_b).astype(np.int64)
+    return np.bincount((classes_a * 10 + classes_b).ravel(),
+                       minlength=100).reshape(10, 10)
+
+
+class TestLocalTransitionCalculation:
+    class TestHappyPaths:
+        def test_local_transition_calculation(self, directory, tmp_path):
+            labels_a, labels_b = transition_labels(0), transition_labels(1)
+            path_a = write_labels(tmp_path / "a.tif", labels_a, 255)
+            path_b = write_labels(tmp_path / "b.tif", labels_b, 255)
+            forest = load_config(directory["sample_base_path"])
+            area = pixel_box(4, 50, 3, 40)
+
+            result = local_transition_calculation(path_a, path_b, forest,
+                                                  geojson_info=area)
+
+            expected = expected_transitions(labels_a[3:40, 4:50],
+                                            labels_b[3:40, 4:50])
+            np.testing.assert_array_equal(result.matrix, expected)
+            co2 = co2_factor_batch_calculation(pixel_counts_matrix([
+                local_pixel_counts(path, forest, geojson_info=area)
+                for path in (path_a, path_b)]), forest)
+            assert result.co2_a == pytest.approx(co2[0])
+            assert result.co2_b == pytest.approx(co2[1])
+            assert result.co2_delta == pytest.approx(co2[1] - co2[0])
+
+        def test_transition_calculation_matches_local(self, directory,
+                                                      tmp_path, mocker):
+            labels_a, labels_b = transition_labels(2), transition_labels(3)
+            path_a = write_labels(tmp_path / "a.tif", labels_a, 255)
+            path_b = write_labels(tmp_path / "b.tif", labels_b, 255)
+            forest = load_config(directory["sample_base_path"])
+            area = pixel_box(0, 64, 0, 48)
+            # Earth Engine returns the histogram of the encoded band
+            matrix = expected_transitions(labels_a, labels_b)
+            ee = mocker.patch("dynamic_world.calculations.ee")
+            mocker.patch("dynamic_world.composites.ee")
+            mocker.patch("dynamic_world.composites.geemap")
+            ee.Dictionary.return_value.getInfo.return_value = {
+                str(code): int(count)
+                for code, count in enumerate(matrix.ravel()) if count}
+
+            remote = transition_calculation(forest,
+                                            ('2022-01-01', '2022-02-01'),
+                                            ('2023-01-01', '2023-02-01'))
+            local = local_transition_calculation(path_a, path_b, forest,
+                                                 geojson_info=area)
+
+            np.testing.assert_array_equal(remote.matrix, local.matrix)
+            assert remote.co2_delta == pytest.approx(local.co2_delta)
+
+    class TestUnhappyPaths:
+        def test_local_transition_calculation_other_grid(self, directory,
+                                                         tmp_path):
+            path_a = write_labels(tmp_path / "a.tif", transition_labels(0),
+                                  255)
+            path_b = write_labels(tmp_path / "b.tif",
+                                  transition_labels(1)[:, :32], 255)
+            forest = load_config(directory["sample_base_path"])
+
+            with pytest.raises(ValueError):
+                local_transition_calculation(path_a, path_b, forest)
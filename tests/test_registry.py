@@ -0,0 +1,86 @@
+import os
+import shutil
+import time
+
+import pytest
+
+import dynamic_world.configurations
+import dynamic_world.registry
+from dynamic_world.registry import ForestRegistry
+
+
+@pytest.fixture
+def forests_directory(directory, tmp_path):
+    base_path = tmp_path / "forests"
+    shutil.copytree(directory["sample_base_path"], base_path / "Sample")
+    shutil.copytree(directory["cordillera_base_path"],
+                    base_path / "CordilleraAzul")
+    shutil.copytree("tests/exampleProyects/Invalid/BadDate",
+                    base_path / "BadDate")
+    return base_path
+
+
+def touch(path):
+    future = time.time() + 10
+    os.utime(path, (future, future))
+
+
+class TestForestRegistry:
+    class TestHappyPaths:
+        def test_registry_loads_forests(self, forests_directory):
+            registry = ForestRegistry(forests_directory)
+
+            assert registry.names() == ["CordilleraAzul", "Sample"]
+            assert "BadDate" in registry.errors
+            assert registry.entry("Sample").start_date == "2022-01-01"
+            assert registry.get("CordilleraAzul").name == "Cordillera Azul"
+            registry.validate_forest_names(["Sample", "CordilleraAzul"])
+
+        def test_registry_parses_geojson_lazily(self, forests_directory,
+                                                mocker):
+            load = mocker.spy(dynamic_world.configurations.geojson, "load")
+
+            registry = ForestRegistry(forests_directory)
+            assert load.call_count == 0
+
+            forest = registry.get("Sample")
+            assert registry.get("Sample") is forest
+            assert load.call_count == 1
+
+        def test_registry_reuses_manifest(self, forests_directory, mocker):
+            ForestRegistry(forests_directory)
+            read = mocker.spy(dynamic_world.registry, "read_config_data")
+
+            registry = ForestRegistry(forests_directory)
+
+            # Only the invalid forest, which is not in the manifest, is read
+            assert read.call_count == 1
+            assert registry.names() == ["CordilleraAzul", "Sample"]
+
+        def test_registry_incremental_reload(self, forests_directory, mocker):
+            registry = ForestRegistry(forests_directory)
+            sample = registry.get("Sample")
+            shutil.rmtree(forests_directory / "CordilleraAzul")
+            shutil.copytree(forests_directory / "Sample",
+                            forests_directory / "Sample2")
+            touch(forests_directory / "Sample" / "sample.geojson")
+            read = mocker.spy(dynamic_world.registry, "read_config_data")
+
+            result = registry.reload()
+
+            # Unchanged forests, even invalid ones, are not read again
+            assert result.added == ["Sample2"]
+            assert result.changed == ["Sample"]
+            assert result.removed == ["CordilleraAzul"]
+            assert read.call_count == 2
+            assert registry.names() == ["Sample", "Sample2"]
+            assert registry.get("Sample") is not sample
+
+    class TestUnhappyPaths:
+        def test_registry_unknown_forest(self, forests_directory):
+            registry = ForestRegistry(forests_directory)
+
+            with pytest.raises(FileNotFoundError):
+                registry.get("AAA")
+            with pytest.raises(FileNotFoundError):
+                registry.validate_forest_names(["Sample", "BadDate"])
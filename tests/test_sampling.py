@@ -0,0 +1,172 @@
+import numpy as np
+import pytest
+
+from dynamic_world.calculations import (co2_factor_batch_calculation,
+                                        co2_factor_calculation,
+                                        single_date_calculation)
+from dynamic_world.configurations import load_config
+from dynamic_world.constants import PIXEL_COUNT_COLUMNS
+from dynamic_world.sampling import (estimate_calculation,
+                                    estimate_from_sample,
+                                    sample_size_for_error)
+from benchmarks.fake_ee import PIXEL, FakeBackend, synthetic_forests
+
+
+def synthetic_labels(size=1000):
+    """
+    Label raster with patches of trees, crops, grass, water and clouds (NA)
+    """
+    rows, cols = np.mgrid[0:size, 0:size]
+    labels = np.full((size, size), 1)
+    labels[(rows // 100 + cols // 100) % 4 == 0] = 4
+    labels[(rows // 50) % 7 == 3] = 2
+    labels[(cols // 25) % 11 == 5] = 0
+    labels[(rows - 600) ** 2 + (cols - 300) ** 2 < 120 ** 2] = 9
+    return labels.ravel()
+
+
+def sample_counts(labels, sample_size, rng):
+    sample = rng.choice(labels, size=sample_size, replace=False)
+    return np.bincount(sample, minlength=len(PIXEL_COUNT_COLUMNS))
+
+
+class TestEstimateFromSample:
+    class TestHappyPaths:
+        def test_estimate_close_to_exact(self, directory):
+            forest = load_config(directory["cordillera_base_path"])
+            labels = synthetic_labels()
+            exact = np.bincount(labels, minlength=len(PIXEL_COUNT_COLUMNS))
+            exact_co2 = co2_factor_batch_calculation(exact[np.newaxis],
+                                                     forest)[0]
+
+            estimate = estimate_from_sample(
+                sample_counts(labels, 5000, np.random.default_rng(0)),
+                labels.size, forest)
+
+            assert estimate.sample_size == 5000
+            assert estimate.co2 == pytest.approx(exact_co2, rel=0.05)
+            low, high = estimate.co2_interval
+            assert low <= exact_co2 <= high
+            for label, count in zip(PIXEL_COUNT_COLUMNS, exact):
+                assert estimate.pixel_counts[label] == pytest.approx(
+                    count, abs=0.03 * labels.size)
+            assert sum(estimate.proportions.values()) == pytest.approx(1)
+
+        def test_interval_coverage(self, directory):
+            forest = load_config(directory["cordillera_base_path"])
+            labels = synthetic_labels()
+            exact = np.bincount(labels, minlength=len(PIXEL_COUNT_COLUMNS))
+            exact_co2 = co2_factor_batch_calculation(exact[np.newaxis],
+                                                     forest)[0]
+            trees = PIXEL_COUNT_COLUMNS.index("trees")
+            rng = np.random.default_rng(1)
+
+            co2_covered, trees_covered = 0, 0
+            for _ in range(200):
+                estimate = estimate_from_sample(
+                    sample_counts(labels, 1000, rng), labels.size, forest)
+                low, high = estimate.co2_interval
+                co2_covered += low <= exact_co2 <= high
+                low, high = estimate.pixel_count_intervals["trees"]
+                trees_covered += low <= exact[trees] <= high
+
+            # 95% intervals, allowing for the randomness of 200 trials
+            assert co2_covered >= 180
+            assert trees_covered >= 180
+
+        def test_sample_size_for_error(self):
+            assert sample_size_for_error(0.01) == 9604
+            assert sample_size_for_error(0.05, confidence=0.9) == 271
+
+    class TestUnhappyPaths:
+        def test_empty_sample(self, directory):
+            forest = load_config(directory["sample_base_path"])
+
+            with pytest.raises(ValueError):
+                estimate_from_sample(np.zeros(len(PIXEL_COUNT_COLUMNS)),
+                                     100, forest)
+
+        def test_bad_target_error(self):
+            with pytest.raises(ValueError):
+                sample_size_for_error(1.5)
+
+
+class TestEstimateCalculation:
+    class TestHappyPaths:
+        def test_estimate_calculation_single_round_trip(self, directory,
+                                                        mocker):
+            ee = mocker.patch("dynamic_world.sampling.ee")
+            composites_ee = mocker.patch("dynamic_world.composites.ee")
+            geemap = mocker.patch("dynamic_world.composites.geemap")
+            ee.Dictionary.return_value.getInfo.return_value = {
+                "histogram": {"1": 90, "9.0": 10}, "area": 10_000 * PIXEL**2}
+            forest = load_config(directory["sample_base_path"])
+
+            estimate = estimate_calculation('2022-06-04', '2022-07-04',
+                                            forest, target_error=0.05)
+
+            assert estimate.sample_size == 100
+            assert estimate.total_pixels == pytest.approx(10_000)
+            assert estimate.pixel_counts["trees"] == pytest.approx(9000)
+            assert estimate.pixel_counts["NA"] == pytest.approx(1000)
+            # Every pixel with data is trees, worth 1 each
+            assert estimate.co2 == pytest.approx(10_000)
+            # Windows without images are all NA
+            composites_ee.Image.constant.assert_called_with(9)
+            composite = (composites_ee.Image.return_value
+                         .unmask.return_value.clip.return_value)
+            assert composite.sample.call_args.kwargs["numPixels"] == (
+                sample_size_for_error(0.05))
+            # The area error margin is in meters
+            borders = geemap.geojson_to_ee.return_value.geometry.return_value
+            assert borders.area.call_args.args == (1, "EPSG:4326")
+            get_info_calls = [call for call in ee.mock_calls
+                              if call[0].endswith("getInfo")]
+            assert len(get_info_calls) == 1
+
+        @pytest.mark.parametrize("south", [-8.0, 40.0, 60.0])
+        def test_estimate_calculation_matches_exact_grid(self, tmp_path,
+                                                         south):
+            forest = synthetic_forests(tmp_path, 1, size_degrees=0.01,
+                                       south=south)[0]
+
+            with FakeBackend().install():
+                exact = single_date_calculation('2022-06-04', '2022-07-04',
+                                                forest)
+                estimate = estimate_calculation('2022-06-04', '2022-07-04',
+                                                forest, sample_size=2000)
+
+            # Pixels shrink east-west away from the equator, the forest size
+            # must be counted on the same grid as the exact calculation
+            assert estimate.total_pixels == pytest.approx(
+                sum(exact.values()), rel=0.01)
+            for label, count in exact.items():
+                low, high = estimate.pixel_count_intervals[label]
+                assert low <= count <= high
+            low, high = estimate.co2_interval
+            assert low <= co2_factor_calculation(exact, forest) <= high
+
+        def test_estimate_calculation_window_without_images(self, tmp_path):
+            forest = synthetic_forests(tmp_path, 1, size_degrees=0.01)[0]
+
+            with FakeBackend().install():
+                exact = single_date_calculation('2015-01-01', '2015-02-01',
+                                                forest)
+                estimate = estimate_calculation('2015-01-01', '2015-02-01',
+                                                forest, sample_size=500)
+
+            assert exact == {}
+            assert estimate.sample_size == 500
+            assert estimate.proportions["NA"] == 1
+            assert estimate.co2 == 0
+
+    class TestUnhappyPaths:
+        def test_estimate_calculation_bad_sample_size(self, directory,
+                                                      mocker):
+            ee = mocker.patch("dynamic_world.sampling.ee")
+            forest = load_config(directory["sample_base_path"])
+
+            with pytest.raises(ValueError):
+                estimate_calculation('2022-06-04', '2022-07-04', forest,
+                                     sample_size=0)
+            assert ee.mock_calls == []
@@ -0,0 +1,150 @@
+import threading
+import time
+
+import pytest
+
+from dynamic_world.configurations import load_config
+from dynamic_world.scheduler import (Job, TokenBucket, is_throttling_error,
+                                     run_jobs)
+
+
+class FakeEarthEngine:
+    """
+    Simulates the latency of Earth Engine and throttles the calls when more
+    than max_concurrent are running at the same time
+    """
+
+    def __init__(self, latency=0.02, max_concurrent=None):
+        self.latency = latency
+        self.max_concurrent = max_concurrent
+        self.running = 0
+        self.peak = 0
+        self.calls = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def calculation(self, start_date, end_date, forest):
+        with self.lock:
+            self.calls += 1
+            if self.max_concurrent and self.running >= self.max_concurrent:
+                self.throttled += 1
+                raise Exception("Too many concurrent aggregations.")
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            time.sleep(self.latency)
+            return {"trees": 1}
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+class TestRunJobs:
+    class TestHappyPaths:
+        def test_run_jobs_concurrency_limit(self, directory):
+            forest = load_config(directory["sample_base_path"])
+            fake_ee = FakeEarthEngine()
+            jobs = [Job(forest, f"2022-01-{day:02d}", "2022-02-01",
+                        fake_ee.calculation) for day in range(1, 21)]
+
+            results = list(run_jobs(jobs, max_workers=4))
+
+            assert len(results) == 20
+            assert all(result.error is None for result in results)
+            assert {result.job.start_date for result in results} == {
+                job.start_date for job in jobs}
+            assert 1 < fake_ee.peak <= 4
+
+        def test_run_jobs_retries_throttled(self, directory):
+            forest = load_config(directory["sample_base_path"])
+            fake_ee = FakeEarthEngine(max_concurrent=2)
+            jobs = [Job(forest, "2022-01-01", "2022-02-01",
+                        fake_ee.calculation) for _ in range(8)]
+
+            results = list(run_jobs(jobs, max_workers=8, max_retries=20,
+                                    backoff_seconds=0.01))
+
+            assert all(result.error is None for result in results)
+            assert fake_ee.throttled > 0
+            assert sum(result.attempts for result in results) == fake_ee.calls
+
+        def test_run_jobs_streams_results(self, directory):
+            forest = load_config(directory["sample_base_path"])
+            slow_ee = FakeEarthEngine(latency=0.5)
+            fast_ee = FakeEarthEngine(latency=0.01)
+            jobs = [Job(forest, "2022-01-01", "2022-02-01", slow_ee.calculation),
+                    Job(forest, "2022-02-01", "2022-03-01", fast_ee.calculation)]
+
+            first = next(iter(run_jobs(jobs, max_workers=2)))
+
+            assert first.job.start_date == "2022-02-01"
+
+        def test_run_jobs_cancelled_when_stopped(self, directory):
+            forest = load_config(directory["sample_base_path"])
+            fake_ee = FakeEarthEngine(latency=0.05)
+            jobs = [Job(forest, "2022-01-01", "2022-02-01",
+                        fake_ee.calculation) for _ in range(10)]
+
+            results = run_jobs(jobs, max_workers=1)
+            next(results)
+            results.close()
+
+            # Only the running job finishes after the caller stops
+            assert fake_ee.calls <= 2
+
+        def test_run_jobs_consumes_jobs_lazily(self, directory):
+            forest = load_config(directory["sample_base_path"])
+            fake_ee = FakeEarthEngine(latency=0.01)
+            created = []
+
+            def jobs():
+                for day in range(1, 29):
+                    created.append(day)
+                    yield Job(forest, f"2022-01-{day:02d}", "2022-02-01",
+                              fake_ee.calculation)
+
+            results = run_jobs(jobs(), max_workers=2)
+            next(results)
+
+            # Only a few jobs more than the running ones are created
+            assert len(created) <= 5
+            assert len(list(results)) == 27
+
+        def test_token_bucket_rate(self):
+            bucket = TokenBucket(rate=50, capacity=1)
+
+            start = time.monotonic()
+            for _ in range(6):
+                bucket.acquire()
+
+            assert time.monotonic() - start >= 0.09
+
+    class TestUnhappyPaths:
+        def test_run_jobs_does_not_retry_other_errors(self, directory):
+            forest = load_config(directory["sample_base_path"])
+
+            def failing_task(start_date, end_date, forest):
+                raise ValueError("Image.load: Image asset not found.")
+
+            results = list(run_jobs(
+                [Job(forest, "2022-01-01", "2022-02-01", failing_task)]))
+
+            assert isinstance(results[0].error, ValueError)
+            assert results[0].attempts == 1
+
+        def test_run_jobs_gives_up_after_max_retries(self, directory):
+            forest = load_config(directory["sample_base_path"])
+
+            def throttled_task(start_date, end_date, forest):
+                raise Exception("429 Too Many Requests")
+
+            results = list(run_jobs(
+                [Job(forest, "2022-01-01", "2022-02-01", throttled_task)],
+                max_retries=2, backoff_seconds=0.001))
+
+            assert is_throttling_error(results[0].error)
+            assert results[0].attempts == 3
+
+        def test_token_bucket_invalid_rate(self):
+            with pytest.raises(ValueError):
+                TokenBucket(rate=0)
@@ -0,0 +1,181 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from dynamic_world.service import CalculationService, make_server
+from benchmarks.fake_ee import FakeBackend, synthetic_forests
+
+WINDOW = "start_date=2022-01-01&end_date=2022-02-01"
+
+
+@pytest.fixture
+def forests_dir(tmp_path, mocker):
+    get_session = mocker.patch("dynamic_world.service.get_session")
+    get_session.return_value.ensure.return_value.initialized = True
+    synthetic_forests(tmp_path / "forests", 2, size_degrees=0.01)
+    return tmp_path / "forests"
+
+
+@pytest.fixture
+def serve(forests_dir, tmp_path):
+    """
+    Starts a server in a free port, returns a function to request its paths
+    """
+    servers = []
+
+    def start(**options):
+        service = CalculationService(forests_dir,
+                                     download_directory=tmp_path / "output",
+                                     **options)
+        server = make_server(service, port=0)
+        threading.Thread(target=server.serve_forever, args=(0.01,),
+                         daemon=True).start()
+        servers.append((server, service))
+        return service, f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+
+    for server, service in servers:
+        server.shutdown()
+        server.server_close()
+        service.shutdown()
+
+
+def request(url, method="GET"):
+    """
+    Returns the status and json body of a request
+    """
+    try:
+        with urllib.request.urlopen(urllib.request.Request(
+                url, method=method)) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read())
+
+
+class TestService:
+    class TestHappyPaths:
+        def test_calculation_and_co2(self, serve):
+            with FakeBackend().install() as backend:
+                service, url = serve()
+                status, body = request(
+                    f"{url}/calculation?forest=Forest0&{WINDOW}")
+                co2_status, co2 = request(f"{url}/co2?forest=Forest0&{WINDOW}")
+
+            assert status == 200 and co2_status == 200
+            assert body["forest"] == "Forest0"
+            assert sum(body["pixel_counts"].values()) > 0
+            assert co2 == {"forest": "Forest0", "start_date": "2022-01-01",
+                           "end_date": "2022-02-01", "co2": body["co2"]}
+            # The second request was served by the LRU
+            assert backend.round_trips == 1
+            assert service.stats["lru_hits"] == 1
+
+        def test_download(self, serve, tmp_path):
+            with FakeBackend().install():
+                _, url = serve()
+                status, body = request(
+                    f"{url}/download?forest=Forest1&{WINDOW}")
+
+            assert status == 200
+            assert body["path"].startswith(str(tmp_path / "output" / "Forest1"))
+
+        def test_identical_requests_are_coalesced(self, serve):
+            with FakeBackend(latency=0.3).install() as backend:
+                service, url = serve()
+                with ThreadPoolExecutor(max_workers=8) as executor:
+                    responses = list(executor.map(
+                        lambda _: request(
+                            f"{url}/calculation?forest=Forest0&{WINDOW}"),
+                        range(8)))
+
+            assert [status for status, _ in responses] == [200] * 8
+            assert len({json.dumps(body) for _, body in responses}) == 1
+            assert backend.round_trips == 1
+            assert service.stats["coalesced"] + service.stats[
+                "lru_hits"] == 7
+
+        def test_lru_eviction(self, serve):
+            with FakeBackend().install() as backend:
+                service, url = serve(lru_size=1)
+                for forest in ("Forest0", "Forest1", "Forest0"):
+                    request(f"{url}/calculation?forest={forest}&{WINDOW}")
+
+            assert backend.round_trips == 3
+            assert service.health()["cached"] == 1
+
+        def test_health_and_forests(self, serve):
+            _, url = serve()
+
+            health_status, health = request(f"{url}/health")
+            _, forests = request(f"{url}/forests")
+
+            assert health_status == 200
+            assert health["forests"] == 2 and health["pending"] == 0
+            assert health["earth_engine_initialized"]
+            assert forests == {"forests": ["Forest0", "Forest1"]}
+
+        def test_reload(self, serve, forests_dir):
+            _, url = serve()
+            synthetic_forests(forests_dir, 3, size_degrees=0.01)
+
+            status, body = request(f"{url}/reload", method="POST")
+
+            assert status == 200
+            assert "Forest2" in body["added"]
+
+    class TestUnhappyPaths:
+        def test_backpressure(self, serve):
+            with FakeBackend(latency=0.5).install():
+                service, url = serve(max_workers=1, queue_size=0)
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    slow = executor.submit(
+                        request, f"{url}/calculation?forest=Forest0&{WINDOW}")
+                    while service.health()["pending"] == 0:
+                        pass
+                    status, body = request(
+                        f"{url}/calculation?forest=Forest1&{WINDOW}")
+
+            assert slow.result()[0] == 200
+            assert status == 503
+            assert "busy" in body["error"]
+            assert service.stats["rejected"] == 1
+
+        def test_bad_requests(self, serve):
+            _, url = serve()
+
+            assert request(f"{url}/calculation?forest=Unknown&{WINDOW}")[
+                0] == 404
+            assert request(f"{url}/calculation?forest=Forest0")[0] == 400
+            assert request(
+                f"{url}/calculation?forest=Forest0&start_date=2022-02-01"
+                "&end_date=2022-01-01")[0] == 400
+            assert request(f"{url}/unknown")[0] == 404
+
+        def test_earth_engine_errors(self, serve):
+            with FakeBackend(failure_rate=1).install():
+                service, url = serve()
+                status, body = request(
+                    f"{url}/calculation?forest=Forest0&{WINDOW}")
+
+            assert status == 500
+            assert body == {"error": "Internal error."}
+            # Failures are not cached
+            assert service.health()["cached"] == 0
+
+        @pytest.mark.parametrize("error", [KeyError("label"),
+                                           ValueError("bad histogram")])
+        def test_internal_errors_are_not_bad_requests(self, serve, mocker,
+                                                      error):
+            mocker.patch("dynamic_world.service.single_date_calculation",
+                         side_effect=error)
+            _, url = serve()
+
+            status, body = request(f"{url}/calculation?forest=Forest0&{WINDOW}")
+
+            assert status == 500
+            assert body == {"error": str(error)}
@@ -0,0 +1,115 @@
+import base64
+import json
+import threading
+
+import pytest
+
+from dynamic_world.session import EarthEngineSession
+
+SERVICE_ACCOUNT = {"client_email": "robot@project.iam.gserviceaccount.com",
+                   "private_key": "key"}
+
+
+@pytest.fixture
+def stub_ee(mocker, monkeypatch):
+    monkeypatch.setenv("SERVICE_ACCOUNT", base64.b64encode(
+        json.dumps(SERVICE_ACCOUNT).encode()).decode())
+    ee = mocker.patch("dynamic_world.session.ee")
+    ee.ServiceAccountCredentials.return_value.expired = False
+    return ee
+
+
+class TestEarthEngineSession:
+    class TestHappyPaths:
+        def test_initializes_once(self, stub_ee):
+            session = EarthEngineSession()
+
+            for _ in range(5):
+                session.ensure()
+
+            assert session.initialized
+            assert session.initializations == 1
+            stub_ee.Initialize.assert_called_once_with(
+                stub_ee.ServiceAccountCredentials.return_value)
+            email, = stub_ee.ServiceAccountCredentials.call_args.args
+            key_data = stub_ee.ServiceAccountCredentials.call_args.kwargs[
+                "key_data"]
+            assert email == SERVICE_ACCOUNT["client_email"]
+            assert json.loads(key_data) == SERVICE_ACCOUNT
+
+        def test_initializes_once_across_threads(self, stub_ee):
+            session = EarthEngineSession()
+            threads = [threading.Thread(target=session.ensure)
+                       for _ in range(16)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            assert stub_ee.Initialize.call_count == 1
+
+        def test_reinitializes_after_fork(self, stub_ee, mocker):
+            session = EarthEngineSession()
+            session.ensure()
+
+            # A forked worker sees a different pid
+            mocker.patch("dynamic_world.session.os.getpid",
+                         return_value=-1)
+            session.ensure()
+            session.ensure()
+
+            assert stub_ee.Initialize.call_count == 2
+            # Credentials are reused, not decoded again
+            assert stub_ee.ServiceAccountCredentials.call_count == 1
+
+        def test_refreshes_only_expired_tokens(self, stub_ee, mocker):
+            session = EarthEngineSession()
+            credentials = stub_ee.ServiceAccountCredentials.return_value
+            session.ensure()
+            session.ensure()
+            assert credentials.refresh.call_count == 0
+
+            credentials.expired = True
+            credentials.refresh.side_effect = lambda request: setattr(
+                credentials, "expired", False)
+            session.ensure()
+            session.ensure()
+
+            assert credentials.refresh.call_count == 1
+            assert stub_ee.Initialize.call_count == 1
+
+        def test_health_check(self, stub_ee):
+            stub_ee.Number.return_value.getInfo.return_value = 1
+
+            status = EarthEngineSession().health_check()
+
+            assert status.healthy
+            assert status.error is None
+            assert status.seconds >= 0
+
+        def test_reset(self, stub_ee):
+            session = EarthEngineSession()
+            session.ensure()
+            session.reset()
+            session.ensure()
+
+            assert stub_ee.ServiceAccountCredentials.call_count == 2
+            assert stub_ee.Initialize.call_count == 2
+
+    class TestUnhappyPaths:
+        def test_missing_service_account(self, stub_ee, monkeypatch):
+            monkeypatch.delenv("SERVICE_ACCOUNT")
+            session = EarthEngineSession()
+
+            with pytest.raises(KeyError):
+                session.ensure()
+            assert not session.initialized
+
+        def test_health_check_failure(self, stub_ee):
+            stub_ee.Number.return_value.getInfo.side_effect = Exception(
+                "Earth Engine unreachable")
+
+            status = EarthEngineSession().health_check()
+
+            assert not status.healthy
+            assert status.error == "Earth Engine unreachable"
@@ -0,0 +1,85 @@
+import csv
+import io
+import json
+import sys
+
+import pytest
+
+from dynamic_world.constants import PIXEL_COUNT_COLUMNS
+from dynamic_world.sinks import (CsvSink, ForestWindowResult, NdjsonSink,
+                                 ParquetSink, ResultSink, open_sink,
+                                 write_results)
+
+
+def results(count, fail_after=None):
+    for index in range(count):
+        if index == fail_after:
+            raise RuntimeError("Earth Engine unreachable")
+        yield ForestWindowResult("Sample", f"2022-01-{index + 1:02d}",
+                                 f"2022-01-{index + 2:02d}",
+                                 {"trees": index, "NA": 1}, float(index))
+
+
+class TestSinks:
+    class TestHappyPaths:
+        def test_ndjson_sink(self):
+            stream = io.StringIO()
+
+            written = write_results(results(3), NdjsonSink(stream))
+
+            rows = [json.loads(line) for line in stream.getvalue().splitlines()]
+            assert written == 3
+            assert rows[2]["trees"] == 2 and rows[2]["water"] == 0
+            assert list(rows[0]) == ["forest", "start_date", "end_date",
+                                     *PIXEL_COUNT_COLUMNS, "co2"]
+
+        def test_csv_sink_appends(self, tmp_path):
+            path = tmp_path / "results.csv"
+
+            write_results(results(2), CsvSink(path))
+            write_results(results(1), CsvSink(path))
+
+            with open(path, newline="") as csv_file:
+                rows = list(csv.DictReader(csv_file))
+            assert len(rows) == 3
+            assert rows[1]["trees"] == "1" and rows[1]["co2"] == "1.0"
+
+        def test_partial_results_survive(self, tmp_path):
+            path = tmp_path / "results.ndjson"
+
+            with pytest.raises(RuntimeError):
+                write_results(results(5, fail_after=3), open_sink(path))
+
+            assert len(path.read_text().splitlines()) == 3
+
+        def test_parquet_sink(self, tmp_path):
+            parquet = pytest.importorskip("pyarrow.parquet")
+            path = tmp_path / "results.parquet"
+
+            written = write_results(results(5), ParquetSink(path,
+                                                            row_group_size=2))
+
+            parquet_file = parquet.ParquetFile(path)
+            assert written == 5
+            assert parquet_file.metadata.num_row_groups == 3
+            assert parquet_file.read().column("trees").to_pylist() == [
+                0, 1, 2, 3, 4]
+
+    class TestUnhappyPaths:
+        def test_parquet_without_pyarrow(self, tmp_path, monkeypatch):
+            monkeypatch.setitem(sys.modules, "pyarrow", None)
+
+            with pytest.raises(ImportError, match="pip install pyarrow"):
+                ParquetSink(tmp_path / "results.parquet")
+
+        def test_unsupported_extension(self, tmp_path):
+            with pytest.raises(ValueError):
+                open_sink(tmp_path / "results.xlsx")
+
+        def test_sink_without_write(self):
+            class IncompleteSink(ResultSink):
+                def close(self):
+                    pass
+
+            with pytest.raises(TypeError):
+                IncompleteSink()
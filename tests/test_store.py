@@ -0,0 +1,83 @@
+import pytest
+
+from dynamic_world.configurations import load_config
+from dynamic_world.store import TimeSeriesStore, WindowRecord
+
+
+def fake_time_series(forest, windows):
+    return {window: {"trees": 3, "NA": 1} for window in windows}
+
+
+class TestTimeSeriesStore:
+    class TestHappyPaths:
+        def test_add_and_history(self, tmp_path):
+            store = TimeSeriesStore(tmp_path / "store.sqlite")
+            records = [
+                WindowRecord("2022-01-08", "2022-01-15", {"water": 2}, 0.0),
+                WindowRecord("2022-01-01", "2022-01-08",
+                             {"trees": 5, "NA": 1}, 6.0),
+            ]
+
+            store.add("Sample", records)
+
+            assert store.history("Sample") == records[::-1]
+            assert store.history("Other") == []
+            assert store.last_window_end("Sample") == "2022-01-15"
+
+        def test_update_only_computes_missing_windows(self, directory, mocker,
+                                                      tmp_path):
+            calculation = mocker.patch(
+                "dynamic_world.store.time_series_calculation",
+                side_effect=fake_time_series)
+            store = TimeSeriesStore(tmp_path / "store.sqlite")
+            forest = load_config(directory["sample_base_path"])
+
+            first = store.update([forest], 7, until="2022-01-31")
+            second = store.update([forest], 7, until="2022-01-31")
+            third = store.update([forest], 7, until="2022-02-06")
+
+            # The incomplete window 2022-01-29 - 2022-01-31 is not stored
+            assert first == {"Sample": 4}
+            assert second == {"Sample": 0}
+            assert third == {"Sample": 1}
+            assert calculation.call_count == 2
+            assert calculation.call_args[0][1] == [("2022-01-29", "2022-02-05")]
+
+            history = store.history("Sample")
+            assert [record.end_date for record in history] == [
+                "2022-01-08", "2022-01-15", "2022-01-22", "2022-01-29",
+                "2022-02-05"]
+            # trees factor is 1 and NA is redistributed
+            assert history[0].co2 == 4
+            assert history[0].pixel_counts == {"trees": 3, "NA": 1}
+
+        def test_update_stores_each_batch(self, directory, mocker, tmp_path):
+            calculation = mocker.patch(
+                "dynamic_world.store.time_series_calculation",
+                side_effect=[fake_time_series(None, [
+                    ("2022-01-01", "2022-01-08"),
+                    ("2022-01-08", "2022-01-15")]), RuntimeError("Timeout")])
+            store = TimeSeriesStore(tmp_path / "store.sqlite")
+            forest = load_config(directory["sample_base_path"])
+
+            with pytest.raises(RuntimeError):
+                store.update([forest], 7, until="2022-01-31", batch_size=2)
+
+            # The first batch is kept and the next update resumes after it
+            assert store.last_window_end("Sample") == "2022-01-15"
+            calculation.side_effect = fake_time_series
+            assert store.update([forest], 7, until="2022-01-31",
+                                batch_size=2) == {"Sample": 2}
+            assert [call[0][1] for call in calculation.call_args_list] == [
+                [("2022-01-01", "2022-01-08"), ("2022-01-08", "2022-01-15")],
+                [("2022-01-15", "2022-01-22"), ("2022-01-22", "2022-01-29")],
+                [("2022-01-15", "2022-01-22"), ("2022-01-22", "2022-01-29")],
+            ]
+            assert len(store.history("Sample")) == 4
+
+    class TestUnhappyPaths:
+        def test_update_invalid_batch_size(self, tmp_path):
+            store = TimeSeriesStore(tmp_path / "store.sqlite")
+
+            with pytest.raises(ValueError):
+                store.update([], 7, batch_size=0)
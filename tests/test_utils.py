@@ -1,5 +1,10 @@
+import json
+import subprocess
+import sys
+
 import pytest
-from dynamic_world.utils import validate_forest_names, validate_dates
+from dynamic_world.utils import (validate_forest_names, validate_dates,
+                                 date_windows, lazy_import)
 
 
 class TestValidateForest:
@@ -26,3 +31,49 @@ class TestValidateDates:
             with pytest.raises(ValueError):
                 dates = ["2022-01-01", "2022/01/01"]
                 validate_dates(dates)
+
+
+class TestDateWindows:
+    class TestHappyPaths:
+        def test_date_windows(self):
+            windows = date_windows("2022-01-01", "2022-01-20", 7)
+            assert windows == [("2022-01-01", "2022-01-08"),
+                               ("2022-01-08", "2022-01-15"),
+                               ("2022-01-15", "2022-01-20")]
+
+    class TestUnhappyPaths:
+        def test_date_windows_end_before_start(self):
+            with pytest.raises(ValueError):
+                date_windows("2022-01-20", "2022-01-01", 7)
+
+        def test_date_windows_bad_step(self):
+            with pytest.raises(ValueError):
+                date_windows("2022-01-01", "2022-01-20", 0)
+
+
+class TestLazyImport:
+    class TestHappyPaths:
+        def test_imported_on_first_use(self):
+            json_module = lazy_import("json")
+            assert json_module.dumps([1]) == "[1]"
+
+        @pytest.mark.parametrize("module", [
+            "dynamic_world.configurations",
+            "dynamic_world.calculations",
+            "dynamic_world.store",
+            "dynamic_world.registry",
+        ])
+        def test_no_earth_engine_at_import(self, module):
+            script = (f"import sys, json; import {module}; "
+                      "print(json.dumps([name for name in ('ee', 'geemap') "
+                      "if name in sys.modules]))")
+            process = subprocess.run([sys.executable, "-c", script],
+                                     capture_output=True, text=True,
+                                     check=True)
+            assert json.loads(process.stdout) == []
+
+    class TestUnhappyPaths:
+        def test_missing_module(self):
+            missing = lazy_import("dynamic_world.missing_module")
+            with pytest.raises(ModuleNotFoundError):
+                missing.anything